@@ -1,87 +1,88 @@
-import yfinance as yf
 import pandas as pd
 import numpy as np
 from datetime import datetime
 
-
-def calculate_metrics(returns, portfolio_values):
-    """Berechnet verschiedene Performance-Metriken"""
-    # Jährliche Rendite
-    years = len(returns) / 252  # Annahme: 252 Handelstage pro Jahr
-    total_return = (portfolio_values[-1] / portfolio_values[0])
-    annual_return = (total_return ** (1 / years) - 1) * 100
-
-    # Volatilität (annualisiert)
-    daily_vol = returns.std()
-    annual_vol = daily_vol * np.sqrt(252) * 100
-
-    # Maximum Drawdown
-    peak = portfolio_values.expanding(min_periods=1).max()
-    drawdown = (portfolio_values - peak) / peak
-    max_drawdown = drawdown.min() * 100
-
-    return {
-        'Jährliche Rendite': f"{annual_return:.2f}%",
-        'Volatilität': f"{annual_vol:.2f}%",
-        'Max Drawdown': f"{max_drawdown:.2f}%"
-    }
-
-
-def analyze_portfolios():
-    # Daten laden
-    msci = yf.download("ACWI", start="1900-01-01")
-    gold = yf.download("GC=F", start="1900-01-01")
-
-    # DataFrame erstellen
-    df = pd.DataFrame()
-    df['MSCI'] = msci['Adj Close']
-    df['Gold'] = gold['Adj Close']
-
-    # NaN-Werte entfernen
-    df = df.dropna()
+import calendar_align
+import metrics
+import profiling
+import result_cache
+import return_kernel
+import signals
+
+ASSETS = ['MSCI', 'Gold']
+
+# Portfolio -> (Gewichte je Asset, Hebel)
+PORTFOLIOS = {
+    'MSCI': ({'MSCI': 1.0}, 1),
+    'MSCI 2x': ({'MSCI': 1.0}, 2),
+    'MSCI 3x': ({'MSCI': 1.0}, 3),
+    'Gold': ({'Gold': 1.0}, 1),
+    'Gold 2x': ({'Gold': 1.0}, 2),
+    'Gold 3x': ({'Gold': 1.0}, 3),
+    # 50/50 Portfolio
+    'Mixed': ({'MSCI': 0.5, 'Gold': 0.5}, 1),
+    'Mixed 2x': ({'MSCI': 0.5, 'Gold': 0.5}, 2),
+    'Mixed 3x': ({'MSCI': 0.5, 'Gold': 0.5}, 3),
+}
+
+
+def calculate_metrics(returns):
+    """Formatierte Performance-Metriken für ein Portfolio (Berechnung in metrics)"""
+    values = metrics.compute_metrics(np.asarray(returns, dtype=float))
+    return metrics.format_metrics(values, ['Portfolio'])['Portfolio']
+
+
+@result_cache.memoize(lambda args: ['ACWI', 'GC=F'])
+def analyze_portfolios(financing_rate=0.0, ter=0.0, signal=None, signal_asset='MSCI'):
+    """Gehebelte Buy & Hold Portfolios aus MSCI ACWI und Gold (Kosten als Jahressätze).
+
+    signal (eine oder eine Liste von Definitionen aus signals) ergänzt jedes
+    Portfolio um Varianten 'Portfolio | Signal', die nur investiert sind,
+    solange das Signal von signal_asset am Vortag an war (sonst Cash). Alle
+    Signale kommen aus einer Signal-Matrix auf dem gemeinsamen Kalender.
+    """
+    with profiling.stage('align', step='BuyHoldLev.analyze_portfolios'):
+        # Daten laden, nur Tage an denen beide gehandelt wurden
+        dates, prices = calendar_align.aligned_prices(["ACWI", "GC=F"], 'intersect', field='Adj Close')
+
+        # DataFrame erstellen
+        df = pd.DataFrame({'MSCI': prices[0], 'Gold': prices[1]}, index=pd.DatetimeIndex(dates, name='Date'))
+
+        # NaN-Werte entfernen
+        df = df.dropna()
 
     # Tägliche Returns berechnen
     df['MSCI_Return'] = df['MSCI'].pct_change()
     df['Gold_Return'] = df['Gold'].pct_change()
 
-    # 50/50 Portfolio Return
-    df['Mixed_Return'] = 0.5 * df['MSCI_Return'] + 0.5 * df['Gold_Return']
-
-    # Gehebelte Returns
-    # MSCI ACWI
-    df['MSCI_2x'] = df['MSCI_Return'] * 2
-    df['MSCI_3x'] = df['MSCI_Return'] * 3
-
-    # Gold
-    df['Gold_2x'] = df['Gold_Return'] * 2
-    df['Gold_3x'] = df['Gold_Return'] * 3
-
-    # Gemischtes Portfolio
-    df['Mixed_2x'] = df['Mixed_Return'] * 2
-    df['Mixed_3x'] = df['Mixed_Return'] * 3
-
-    # Portfolio-Werte berechnen (startend bei 100)
-    portfolios = {
-        'MSCI': df['MSCI_Return'],
-        'MSCI 2x': df['MSCI_2x'],
-        'MSCI 3x': df['MSCI_3x'],
-        'Gold': df['Gold_Return'],
-        'Gold 2x': df['Gold_2x'],
-        'Gold 3x': df['Gold_3x'],
-        'Mixed': df['Mixed_Return'],
-        'Mixed 2x': df['Mixed_2x'],
-        'Mixed 3x': df['Mixed_3x']
-    }
-
-    # Portfolio-Werte berechnen
-    for name, returns in portfolios.items():
-        df[f'{name}_Portfolio'] = 100 * (1 + returns).cumprod()
-
-    # Metriken berechnen
-    results = {}
-    for name, returns in portfolios.items():
-        portfolio_values = df[f'{name}_Portfolio']
-        results[name] = calculate_metrics(returns.dropna(), portfolio_values.dropna())
+    # Portfolio-Returns aller Varianten in einem Schritt (ohne gehebelte Zwischenspalten)
+    with profiling.stage('simulate', step='BuyHoldLev.analyze_portfolios'):
+        weights = np.array([[allocation.get(asset, 0.0) for asset in ASSETS]
+                            for allocation, _ in PORTFOLIOS.values()])
+        leverage = np.array([[lev] * len(ASSETS) for _, lev in PORTFOLIOS.values()])
+        exposures, constant = return_kernel.fold_weights(
+            weights, leverage, range(len(ASSETS)), len(ASSETS), financing_rate=financing_rate, ter=ter)
+
+        asset_returns = df[[f'{asset}_Return' for asset in ASSETS]].to_numpy().T[:, 1:]
+        returns = return_kernel.portfolio_returns(asset_returns, exposures, constant)
+        names = list(PORTFOLIOS)
+
+        if signal is not None:
+            definitions = [signal] if isinstance(signal, (str, int, dict)) else list(signal)
+            codes = signals.compute(df[signal_asset].to_numpy(dtype=float), definitions)
+            # Tag t verdient die Rendite nur, wenn das Signal an Tag t-1 an war
+            invested = codes[:, :-1] == signals.ON
+            returns = np.vstack([returns] + [np.where(row, returns, 0.0) for row in invested])
+            names += [f'{name} | {signals.label(definition)}' for definition in definitions for name in PORTFOLIOS]
+
+        # Portfolio-Werte berechnen (startend bei 100, erster Tag ohne Return)
+        values = np.full((len(names), len(df)), np.nan)
+        values[:, 1:] = 100 * np.cumprod(1 + returns, axis=1)
+        for name, row in zip(names, values):
+            df[f'{name}_Portfolio'] = row
+
+    # Metriken für alle Portfolios in einem Durchlauf berechnen
+    results = metrics.format_metrics(metrics.compute_metrics(returns), names)
 
     return results, df
 
@@ -94,9 +95,9 @@ if __name__ == "__main__":
     print("\nPortfolio Analyse:")
     print("=" * 50)
 
-    for portfolio, metrics in results.items():
+    for portfolio, portfolio_metrics in results.items():
         print(f"\n{portfolio}:")
-        for metric, value in metrics.items():
+        for metric, value in portfolio_metrics.items():
             print(f"{metric}: {value}")
 
     # Zeitraum ausgeben
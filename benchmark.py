@@ -0,0 +1,346 @@
+"""Laufzeit- und Speicher-Benchmarks aller Einstiegspunkte mit synthetischen Kursen.
+
+Statt yfinance liefert ein deterministischer Generator (geometrische
+Brownsche Bewegung mit Sprüngen) die Kurse. Sie werden in einen temporären
+price_store geschrieben und im Offline-Modus gelesen, es ist also kein
+Netzwerk nötig. Jede Größe deckt denselben Kalenderzeitraum (1990-2020) ab,
+bei vielen Zeilen entsprechend mit Minuten- oder Sekundenabstand; so bleiben
+MA-Signale und Jahresrenditen in realistischen Bereichen.
+
+Alle Ticker teilen ein Zeitraster, handeln aber nicht an denselben Tagen:
+Börsen-Ticker ohne Wochenenden und mit eigenen Feiertagen (HOLIDAY_SHARE
+der Wochentage, je Ticker anders gezogen), BTC an allen sieben Tagen. So
+laufen auch die Kalender-Joins (intersect, ffill, native) mit echten Lücken.
+Jeder Einstiegspunkt wird kalt gemessen (In-Prozess-Caches geleert), die
+Laufzeit und der Spitzen-Speicher je in einem eigenen Lauf.
+
+Aufruf:
+    python benchmark.py                          # alle Einstiegspunkte, 10k bis 10M Zeilen
+    python benchmark.py --rows 10000 100000 --save benchmark_baseline.json
+    python benchmark.py --compare benchmark_baseline.json   # Exit-Code 1 bei Regression
+    python benchmark.py --check-state            # Tagesbetrieb gegen Neuberechnung prüfen
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+import warnings
+import zlib
+
+import numpy as np
+import pandas as pd
+
+import BuyHoldLev
+import calculator
+import calendar_align
+import final_portfolio_performance
+import final_portfolio_performance_btc
+import general_performance
+import ma_cache
+import moving_avrg_overlap
+import price_store
+import profiling
+import strategy_state
+
+ROWS = (10_000, 100_000, 1_000_000, 10_000_000)
+PERIOD = ('1990-01-01', '2020-01-01')
+DEFAULT_BASELINE = 'benchmark_baseline.json'
+
+# Ticker -> (Drift p.a., Volatilität p.a.); Sprünge für alle gleich
+MARKET_PARAMETERS = {
+    '^GSPC': (0.07, 0.18),
+    '^DJI': (0.07, 0.17),
+    '^NDX': (0.10, 0.25),
+    '^GDAXI': (0.06, 0.22),
+    'GC=F': (0.04, 0.15),
+    'BTC-USD': (0.50, 0.80),
+    'ACWI': (0.06, 0.16),
+}
+DEFAULT_PARAMETERS = (0.06, 0.20)
+JUMPS_PER_YEAR = 3.0
+JUMP_MEAN = -0.03
+JUMP_STD = 0.05
+
+# Ticker mit 7-Tage-Kalender; alle anderen handeln nur an Wochentagen
+SEVEN_DAY_TICKERS = ('BTC-USD',)
+# Anteil der Wochentage, die je Börsen-Ticker als Feiertag fehlen
+HOLIDAY_SHARE = 0.03
+
+
+# ---------------------------------------------------------------------------
+# Synthetische Kurse
+# ---------------------------------------------------------------------------
+
+def synthetic_dates(ticker, rows, period=PERIOD, seed=0):
+    """Zeitpunkte eines Tickers auf dem gemeinsamen Raster des Zeitraums.
+
+    Börsen-Ticker erhalten genau rows Zeitpunkte: Wochentage des Rasters ohne
+    eigene, zufällig gezogene Feiertage. Ticker aus SEVEN_DAY_TICKERS erhalten
+    alle Zeitpunkte des Rasters (rund 7/5 so viele).
+    """
+    start, end = (pd.Timestamp(value).value for value in period)
+    grid_rows = int(np.ceil(rows * 7 / 5 / (1 - HOLIDAY_SHARE)))
+    grid = np.linspace(start, end, grid_rows).astype(np.int64).astype('M8[ns]')
+    if ticker in SEVEN_DAY_TICKERS:
+        return grid
+
+    # 1970-01-01 war ein Donnerstag: (Tag + 3) % 7 < 5 sind Montag bis Freitag
+    weekdays = grid[(grid.astype('M8[D]').astype(np.int64) + 3) % 7 < 5]
+    rng = np.random.default_rng([seed, zlib.crc32(ticker.encode()), 1])
+    keep = np.sort(rng.choice(len(weekdays), size=min(rows, len(weekdays)), replace=False))
+    return weekdays[keep]
+
+
+def synthetic_prices(ticker, dates, seed=0):
+    """Deterministischer GBM-Pfad mit Poisson-Sprüngen im price_store-Format"""
+    rng = np.random.default_rng([seed, zlib.crc32(ticker.encode())])
+    drift, volatility = MARKET_PARAMETERS.get(ticker, DEFAULT_PARAMETERS)
+    rows = len(dates)
+    dt = (dates[-1] - dates[0]) / np.timedelta64(1, 'D') / 365.25 / max(rows - 1, 1)
+
+    log_return = (drift - 0.5 * volatility ** 2) * dt + volatility * np.sqrt(dt) * rng.standard_normal(rows)
+    jumps = rng.random(rows) < JUMPS_PER_YEAR * dt
+    log_return[jumps] += rng.normal(JUMP_MEAN, JUMP_STD, jumps.sum())
+    log_return[0] = 0.0
+    close = 100 * np.exp(np.cumsum(log_return))
+
+    array = np.empty(rows, dtype=price_store.PRICE_DTYPE)
+    array['Date'] = dates
+    array['Close'] = close
+    array['Adj Close'] = close
+    array['Open'] = np.concatenate([close[:1], close[:-1]])
+    spread = np.abs(rng.standard_normal(rows)) * volatility * np.sqrt(dt) / 2
+    array['High'] = np.maximum(array['Open'], close) * (1 + spread)
+    array['Low'] = np.minimum(array['Open'], close) * (1 - spread)
+    array['Volume'] = rng.integers(1_000, 1_000_000, rows)
+    return array
+
+
+def write_fixtures(tickers, rows, seed=0):
+    """Schreibt fehlende Ticker in den aktuellen price_store (LEVTAX_CACHE_DIR)"""
+    for ticker in tickers:
+        if price_store.load_array(ticker) is None:
+            price_store.save_array(ticker, synthetic_prices(ticker, synthetic_dates(ticker, rows, seed=seed), seed))
+
+
+# ---------------------------------------------------------------------------
+# Einstiegspunkte
+# ---------------------------------------------------------------------------
+
+ENTRY_POINTS = {
+    'calculate_trading_strategy': (
+        ('^GSPC', 'GC=F'),
+        lambda: calculator.calculate_trading_strategy('S&P 500', lev=2),
+    ),
+    'analyze_leveraged_portfolio': (
+        ('^GSPC', 'GC=F'),
+        lambda: general_performance.analyze_leveraged_portfolio('s&p 500', 'gold', 2),
+    ),
+    'calculate_ma_correlation': (
+        tuple(moving_avrg_overlap.TICKER_MAP.values()),
+        lambda: moving_avrg_overlap.calculate_ma_correlation(),
+    ),
+    'analyze_portfolios': (
+        ('ACWI', 'GC=F'),
+        lambda: BuyHoldLev.analyze_portfolios(),
+    ),
+    'simulate_regime_portfolio': (
+        tuple(final_portfolio_performance.SPEC['assets'].values()),
+        lambda: final_portfolio_performance.simulate_regime_portfolio(),
+    ),
+    'simulate_regime_portfolio_btc': (
+        tuple(final_portfolio_performance_btc.SPEC['assets'].values()),
+        lambda: final_portfolio_performance_btc.simulate_regime_portfolio(),
+    ),
+}
+
+
+def cold_start():
+    """Leert die In-Prozess-Caches (gemappte Kursdateien, Präfixsummen, Kalender)"""
+    price_store._loaded.clear()
+    ma_cache._cache.clear()
+    calendar_align._cache.clear()
+
+
+def measure(function, memory=True):
+    """(Sekunden, Spitzen-Speicher in MB oder None) für je einen kalten Aufruf"""
+    cold_start()
+    start = time.perf_counter()
+    function()
+    seconds = time.perf_counter() - start
+
+    peak_mb = None
+    if memory:
+        # Eigener, ebenfalls kalter Lauf, da tracemalloc die Laufzeit verfälscht
+        cold_start()
+        tracemalloc.start()
+        try:
+            function()
+            peak_mb = tracemalloc.get_traced_memory()[1] / 2 ** 20
+        finally:
+            tracemalloc.stop()
+    return seconds, peak_mb
+
+
+def run(rows=ROWS, entries=tuple(ENTRY_POINTS), memory=True, seed=0, verbose=True):
+    """Misst alle Einstiegspunkte für alle Größen: {Einstieg: {Zeilen: Ergebnis}}"""
+    results = {entry: {} for entry in entries}
+    previous = {key: os.environ.get(key) for key in ('LEVTAX_CACHE_DIR', 'LEVTAX_OFFLINE', 'LEVTAX_RESULT_CACHE')}
+
+    try:
+        for size in rows:
+            with tempfile.TemporaryDirectory(prefix='levtax_bench_') as directory:
+                os.environ['LEVTAX_CACHE_DIR'] = directory
+                os.environ['LEVTAX_OFFLINE'] = '1'
+                # Gemessen wird die Berechnung, nicht der Ergebnis-Cache
+                os.environ['LEVTAX_RESULT_CACHE'] = '0'
+
+                for entry in entries:
+                    tickers, function = ENTRY_POINTS[entry]
+                    write_fixtures(tickers, size, seed)
+                    with warnings.catch_warnings(), np.errstate(all='ignore'):
+                        warnings.simplefilter('ignore')
+                        seconds, peak_mb = measure(function, memory)
+
+                    results[entry][str(size)] = {
+                        'seconds': seconds,
+                        'rows_per_second': size / seconds,
+                        'peak_mb': peak_mb,
+                    }
+                    if verbose:
+                        memory_text = f"{peak_mb:10.1f} MB" if peak_mb is not None else ''
+                        print(f"{entry:32s} {size:>10,d} Zeilen {seconds:9.3f} s "
+                              f"{size / seconds:14,.0f} Zeilen/s {memory_text}", flush=True)
+    finally:
+        for key, value in previous.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+
+    return results
+
+
+def check_states(rows=6000, tail=300, verify_every=25, seed=0, verbose=True):
+    """Prüft strategy_state auf den versetzten Kalendern der synthetischen Kurse.
+
+    Jeder Zustand wird bis `tail` Tage vor dem Ende aufgebaut, dann Bar für
+    Bar fortgeschrieben und alle verify_every Bars gegen eine komplette
+    Neuberechnung verglichen (AssertionError bei Abweichung). rows ist so
+    gewählt, dass höchstens ein Zeitpunkt je Kalendertag liegt, da der
+    Zustand Tage als Datum speichert.
+    """
+    previous = {key: os.environ.get(key) for key in ('LEVTAX_CACHE_DIR', 'LEVTAX_OFFLINE', 'LEVTAX_RESULT_CACHE')}
+    try:
+        with tempfile.TemporaryDirectory(prefix='levtax_state_') as directory:
+            os.environ['LEVTAX_CACHE_DIR'] = directory
+            os.environ['LEVTAX_OFFLINE'] = '1'
+            os.environ['LEVTAX_RESULT_CACHE'] = '0'
+            cold_start()
+
+            specs = {'regime': final_portfolio_performance.SPEC, 'regime_btc': final_portfolio_performance_btc.SPEC}
+            write_fixtures(set(calculator.INDEX_TICKERS.values()) | {'GC=F'}, rows, seed)
+            for spec in specs.values():
+                write_fixtures(spec['assets'].values(), rows, seed)
+
+            states = {}
+            for index, ticker in calculator.INDEX_TICKERS.items():
+                until = pd.Timestamp(price_store.get_array(ticker)['Date'][-tail])
+                states[f'trading {index}'] = strategy_state.init_trading_state(index, lev=2, until=until)
+            for name, spec in specs.items():
+                base = spec['assets'][next(iter(spec['assets']))]
+                until = pd.Timestamp(price_store.get_array(base)['Date'][-tail])
+                states[name] = strategy_state.init_regime_state(spec, until=until)
+
+            for name, state in states.items():
+                start = state['last_date']
+                strategy_state.replay(state, verify_every)
+                if verbose:
+                    print(f"{name:24s} {start} -> {state['last_date']} ({state['last_bar_date']}) "
+                          f"Wert {state['portfolio_value']:.4f}: identisch", flush=True)
+    finally:
+        for key, value in previous.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+
+
+def environment():
+    return {
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'machine': platform.machine(),
+        'processor': platform.processor(),
+    }
+
+
+def save_baseline(results, path=DEFAULT_BASELINE):
+    with open(path, 'w', encoding='utf-8') as file:
+        json.dump({'environment': environment(), 'results': results}, file, indent=2)
+
+
+def compare(results, baseline, tolerance=0.25):
+    """Regressionen gegenüber der Baseline (langsamer oder mehr Speicher als 1 + tolerance)"""
+    regressions = []
+    for entry, sizes in results.items():
+        for size, current in sizes.items():
+            reference = baseline['results'].get(entry, {}).get(size)
+            if reference is None:
+                continue
+            for key in ('seconds', 'peak_mb'):
+                if current[key] is None or reference[key] is None:
+                    continue
+                if current[key] > reference[key] * (1 + tolerance):
+                    regressions.append(f"{entry} {size} Zeilen: {key} {reference[key]:.3f} -> {current[key]:.3f}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, nargs='+', default=list(ROWS))
+    parser.add_argument('--entry', nargs='+', choices=list(ENTRY_POINTS), default=list(ENTRY_POINTS))
+    parser.add_argument('--no-memory', action='store_true', help='Spitzen-Speicher nicht messen')
+    parser.add_argument('--save', metavar='PATH', help='Ergebnisse als Baseline speichern')
+    parser.add_argument('--compare', metavar='PATH', help='mit gespeicherter Baseline vergleichen')
+    parser.add_argument('--tolerance', type=float, default=0.25)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--profile', metavar='PATH', help='Stufen-Trace (JSON-Zeilen) in diese Datei schreiben')
+    parser.add_argument('--check-state', action='store_true',
+                        help='nur strategy_state auf versetzten Kalendern gegen Neuberechnung prüfen')
+    args = parser.parse_args(argv)
+
+    if args.check_state:
+        check_states(seed=args.seed)
+        return 0
+
+    if args.profile:
+        profiling.enable(args.profile)
+    results = run(args.rows, args.entry, memory=not args.no_memory, seed=args.seed)
+    if args.profile:
+        profiling.disable()
+        print(profiling.summarize(profiling.load_traces(args.profile)).to_string())
+
+    if args.save:
+        save_baseline(results, args.save)
+        print(f"\nBaseline gespeichert: {args.save}")
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as file:
+            regressions = compare(results, json.load(file), args.tolerance)
+        if regressions:
+            print("\nRegressionen:")
+            for line in regressions:
+                print(line)
+            return 1
+        print("\nKeine Regressionen")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
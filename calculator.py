@@ -1,43 +1,81 @@
-import yfinance as yf
 import pandas as pd
 import numpy as np
 from datetime import datetime
 
+import calendar_align
+import ma_cache
+import price_store
+import profiling
+import result_cache
+import signals
+import tax_ledger
 
-def calculate_trading_strategy(index='SPX', tax_rate=0.25, lev=1, which_lev='both'):
-    # Validate inputs
-    if which_lev not in ['index', 'gold', 'both']:
-        raise ValueError("which_lev must be 'index', 'gold', or 'both'")
 
-    # Dictionary mapping index names to their Yahoo Finance tickers
-    index_tickers = {
-        'S&P 500': '^GSPC',
-        'Dow Jones': '^DJI',
-        'Nasdaq 100': '^NDX'
-    }
+# Dictionary mapping index names to their Yahoo Finance tickers
+INDEX_TICKERS = {
+    'S&P 500': '^GSPC',
+    'Dow Jones': '^DJI',
+    'Nasdaq 100': '^NDX'
+}
 
+
+def load_strategy_prices(index='SPX'):
+    """Load the index and gold closing prices used by the strategy."""
     # Validate index input
-    if index not in index_tickers:
+    if index not in INDEX_TICKERS:
         raise ValueError("Invalid index. Choose from: DAX, S&P 500, Dow Jones, Nasdaq 100")
 
     # Download historical data
     start_date = '1988-01-01'
     end_date = datetime.today().strftime('%Y-%m-%d')
 
+    # Fetch both tickers concurrently, then read them from the local store
+    price_store.update_many([INDEX_TICKERS[index], 'GC=F'])
+
     # Get index data
-    index_data = yf.download(index_tickers[index], start=start_date, end=end_date)['Close']
+    index_data = price_store.get_prices(INDEX_TICKERS[index], start=start_date, end=end_date)['Close']
 
     # Get gold data
-    gold_data = yf.download('GC=F', start=start_date, end=end_date)['Close']
+    gold_data = price_store.get_prices('GC=F', start=start_date, end=end_date)['Close']
 
-    # Create initial dataframe
-    df = pd.DataFrame({
-        'index_price': index_data,
-        'gold_price': gold_data
-    })
+    return index_data, gold_data
 
-    # Calculate 200-day moving average for index
-    df['ma_200'] = df['index_price'].rolling(window=200).mean()
+
+def prepare_strategy_data(index='SPX', lev=1, which_lev='both', ma_window=200, signal=None):
+    """Download prices and build the return/position table used by both engines."""
+    # Validate inputs
+    if which_lev not in ['index', 'gold', 'both']:
+        raise ValueError("which_lev must be 'index', 'gold', or 'both'")
+
+    index_data, gold_data = load_strategy_prices(index)
+    return build_strategy_frame(index_data, gold_data, lev, which_lev, ma_window, signal)
+
+
+def build_strategy_frame(index_data, gold_data, lev=1, which_lev='both', ma_window=200, signal=None):
+    """Build the return/position table from already loaded prices.
+
+    signal replaces the price/MA comparison with any definition from the
+    signals module (e.g. 'ema:100' or 'band:200:0.02'); the strategy holds
+    gold while the signal is off.
+    """
+    # Calculate moving average for index on its own trading days (200 days by default)
+    with profiling.stage('signal', step='calculator.build_strategy_frame'):
+        if signal is None:
+            trend_column, trend = 'ma', ma_cache.rolling_mean(index_data, ma_window)
+        else:
+            # Signal codes as 1.0/0.0, NaN until the signal is defined (dropped like the MA warm-up)
+            codes = signals.compute(index_data.to_numpy(dtype=float), [signal])[0]
+            trend_column, trend = 'signal', np.where(codes == signals.NO_SIGNAL, np.nan, codes)
+
+    # Create initial dataframe on the days both assets traded
+    with profiling.stage('align', step='calculator.build_strategy_frame'):
+        calendar = calendar_align.build_calendar({'index': index_data.index, 'gold': gold_data.index})
+        joined = calendar_align.join(calendar, 'intersect')
+        df = pd.DataFrame({
+            'index_price': calendar_align.gather(index_data, joined['rows']['index']),
+            'gold_price': calendar_align.gather(gold_data, joined['rows']['gold']),
+            trend_column: calendar_align.gather(trend, joined['rows']['index']),
+        }, index=pd.DatetimeIndex(joined['dates'], name=index_data.index.name))
 
     # Remove rows with NaN values in MA column
     df = df.dropna()
@@ -60,15 +98,26 @@ def calculate_trading_strategy(index='SPX', tax_rate=0.25, lev=1, which_lev='bot
     # Remove first row which will have NaN returns
     df = df.dropna()
 
-    # Initialize portfolio value column
-    df['portfolio_value'] = 100
-
     # Determine position: index or gold - using previous day's comparison
-    df['ma_signal'] = np.where(df['index_price'] < df['ma_200'], 'gold', 'index')
-    df['position'] = df['ma_signal'].shift(1)  # Shift by 1 to implement next-day trading
+    with profiling.stage('signal', step='calculator.build_strategy_frame'):
+        if signal is None:
+            df['ma_signal'] = np.where(df['index_price'] < df['ma'], 'gold', 'index')
+        else:
+            df['ma_signal'] = np.where(df['signal'] == signals.OFF, 'gold', 'index')
+        df['position'] = df['ma_signal'].shift(1)  # Shift by 1 to implement next-day trading
+
+        # For the first position, use the first signal
+        df.loc[df.index[0], 'position'] = df['ma_signal'].iloc[0]
+
+    return df
 
-    # For the first position, use the first signal
-    df['position'].iloc[0] = df['ma_signal'].iloc[0]
+
+@profiling.traced('simulate')
+def portfolio_values_loop(df, tax_rate=0.25):
+    """Reference engine: day-by-day loop, taxing gains at every regime change."""
+    # Initialize portfolio value column
+    df = df.copy()
+    df['portfolio_value'] = 100.0
 
     # Initialize variables for tracking regime changes
     last_regime_change_idx = 0
@@ -106,14 +155,297 @@ def calculate_trading_strategy(index='SPX', tax_rate=0.25, lev=1, which_lev='bot
         # Update portfolio value
         df.iloc[i, df.columns.get_loc('portfolio_value')] = new_value
 
+    return df['portfolio_value'].to_numpy()
+
+
+@profiling.traced('simulate')
+def portfolio_values_vectorized(in_gold, index_lev, gold_lev, tax_rate=0.25, start_value=100.0):
+    """Segment engine: cumulative products per regime segment, tax once per switch.
+
+    in_gold is a boolean array (True = holding gold). The Python-level work is
+    one iteration per regime segment instead of one per day.
+    """
+    in_gold = np.asarray(in_gold, dtype=bool)
+    growth = 1 + np.where(in_gold, gold_lev, index_lev)
+
+    # Segment starts: first day plus every day on which the position changes
+    starts = np.concatenate(([0], np.flatnonzero(in_gold[1:] != in_gold[:-1]) + 1))
+    ends = np.append(starts[1:], len(in_gold))
+
+    values = np.empty(len(in_gold))
+    last_regime_change_value = start_value
+    for start, end in zip(starts, ends):
+        if start == 0:
+            segment_value = start_value
+        else:
+            segment_value = values[start - 1] * growth[start]
+
+            # Tax the gain since the last regime change
+            gain = segment_value - last_regime_change_value
+            if gain > 0:
+                segment_value -= gain * tax_rate
+            last_regime_change_value = segment_value
+
+        values[start] = segment_value
+        values[start + 1:end] = segment_value * np.cumprod(growth[start + 1:end])
+
+    return values
+
+
+def _position_arrays(df):
+    return (
+        (df['position'] == 'gold').to_numpy(),
+        df['index_lev'].to_numpy(dtype=float),
+        df['gold_lev'].to_numpy(dtype=float),
+    )
+
+
+def trading_strategy_values(index='SPX', tax_rate=0.25, lev=1, which_lev='both', engine='vectorized',
+                            ma_window=200, signal=None):
+    """Portfolio value path of the trading strategy (start value 100) indexed by date.
+
+    engine='ledger' taxes through tax_ledger instead: the switch is traded at the
+    previous close, and losses are offset within the year and carried forward.
+    """
+    if engine not in ['vectorized', 'loop', 'ledger']:
+        raise ValueError("engine must be 'vectorized', 'loop' or 'ledger'")
+
+    df = prepare_strategy_data(index, lev, which_lev, ma_window, signal)
+
+    if engine == 'loop':
+        portfolio_value = portfolio_values_loop(df, tax_rate)
+    elif engine == 'ledger':
+        portfolio_value = tax_ledger.value_path(tax_ledger.trading_strategy_ledger(df, tax_rate))
+    else:
+        portfolio_value = portfolio_values_vectorized(*_position_arrays(df), tax_rate)
+
+    return pd.Series(portfolio_value, index=df.index, name='portfolio_value')
+
+
+@result_cache.memoize(lambda args: [INDEX_TICKERS[args['index']], 'GC=F'])
+def calculate_trading_strategy(index='SPX', tax_rate=0.25, lev=1, which_lev='both', engine='vectorized',
+                               ma_window=200, signal=None):
+    portfolio_value = trading_strategy_values(index, tax_rate, lev, which_lev, engine, ma_window, signal).to_numpy()
+
     # Calculate average yearly return
-    total_years = len(df) / 252  # Assuming 252 trading days per year
-    total_return = (df['portfolio_value'].iloc[-1] / df['portfolio_value'].iloc[0]) - 1
+    total_years = len(portfolio_value) / 252  # Assuming 252 trading days per year
+    total_return = (portfolio_value[-1] / portfolio_value[0]) - 1
     avg_yearly_return = (1 + total_return) ** (1 / total_years) - 1
 
     return avg_yearly_return
 
 
+def check_engine_equivalence(index='S&P 500', tax_rate=0.25, lev=1, which_lev='both', rtol=1e-9):
+    """Run both engines on the same data and return the largest relative deviation.
+
+    Raises AssertionError if the portfolio paths differ by more than rtol.
+    """
+    df = prepare_strategy_data(index, lev, which_lev)
+    reference = portfolio_values_loop(df, tax_rate)
+    vectorized = portfolio_values_vectorized(*_position_arrays(df), tax_rate)
+
+    deviation = np.max(np.abs(vectorized - reference) / np.maximum(np.abs(reference), 1e-12))
+    if deviation > rtol:
+        raise AssertionError(f"Engines differ: max relative deviation {deviation:.3e} > {rtol:.0e}")
+    return deviation
+
+
+def _signal_frames(index_data, gold_data, definitions):
+    """Sweep frames for many signals from one signal matrix and one aligned price table.
+
+    Matches build_strategy_frame per signal: days before the signal is
+    defined are dropped, returns start on the second remaining day and the
+    position follows the previous day's signal.
+    """
+    with profiling.stage('signal', step='calculator.strategy_frames', signals=len(definitions)):
+        codes = signals.compute(index_data.to_numpy(dtype=float), definitions)
+
+    with profiling.stage('align', step='calculator.strategy_frames'):
+        calendar = calendar_align.build_calendar({'index': index_data.index, 'gold': gold_data.index})
+        joined = calendar_align.join(calendar, 'intersect')
+        index_price = calendar_align.gather(index_data, joined['rows']['index'])
+        gold_price = calendar_align.gather(gold_data, joined['rows']['gold'])
+        codes = codes[:, joined['rows']['index']]
+        prices_valid = np.isfinite(index_price) & np.isfinite(gold_price)
+
+    frames = {}
+    for definition, row in zip(definitions, codes):
+        keep = prices_valid & (row != signals.NO_SIGNAL)
+        index_kept, gold_kept = index_price[keep], gold_price[keep]
+        signal_gold = row[keep] == signals.OFF
+        in_gold = np.concatenate([signal_gold[1:2], signal_gold[1:-1]])
+        frames[signals.label(definition)] = {
+            'in_gold': in_gold,
+            'index_return': index_kept[1:] / index_kept[:-1] - 1,
+            'gold_return': gold_kept[1:] / gold_kept[:-1] - 1,
+            'switches': np.flatnonzero(in_gold[1:] != in_gold[:-1]) + 1,
+        }
+    return frames
+
+
+@profiling.traced('simulate')
+def _segment_growth(frames, path_windows, path_index_lev, path_gold_lev, chunk_size):
+    """Growth factor of every tax segment for every (window, leverage) path.
+
+    Each window's series is right-aligned into a common day axis; the padding
+    has growth 1 and no position changes, so it does not affect the result.
+    Returns (segment_growth, tail_growth) with shapes (paths, max_switches)
+    and (paths,).
+    """
+    n_days = max(len(frame['in_gold']) for frame in frames.values())
+    max_switches = max(len(frame['switches']) for frame in frames.values())
+
+    n_paths = len(path_windows)
+    segment_growth = np.ones((n_paths, max_switches))
+    tail_growth = np.empty(n_paths)
+
+    for chunk_start in range(0, n_paths, chunk_size):
+        rows = range(chunk_start, min(chunk_start + chunk_size, n_paths))
+
+        # One extra column of ones so a switch on the last day still has a (neutral) tail
+        growth = np.ones((len(rows), n_days + 1))
+        boundaries = []
+        for row, path in enumerate(rows):
+            frame = frames[path_windows[path]]
+            pad = n_days - len(frame['in_gold'])
+            leveraged = np.where(frame['in_gold'],
+                                 frame['gold_return'] * path_gold_lev[path],
+                                 frame['index_return'] * path_index_lev[path])
+            # Day 0 of every series only sets the start value
+            growth[row, pad + 1:n_days] += leveraged[1:]
+
+            # Segment k covers the days after switch k-1 up to and including switch k
+            offset = row * (n_days + 1)
+            boundaries.append(offset + 1)
+            boundaries.extend(offset + pad + frame['switches'] + 1)
+
+        products = np.multiply.reduceat(growth.ravel(), np.array(boundaries))
+
+        position = 0
+        for row, path in enumerate(rows):
+            n_switches = len(frames[path_windows[path]]['switches'])
+            segment_growth[path, :n_switches] = products[position:position + n_switches]
+            tail_growth[path] = products[position + n_switches]
+            position += n_switches + 1
+
+    return segment_growth, tail_growth
+
+
+def sweep_trading_strategy(index='S&P 500', lev=(1,), tax_rate=(0.25,), which_lev=('both',), ma_window=(200,),
+                           chunk_size=256, signal=None, cache=True):
+    """Evaluate calculate_trading_strategy for the full parameter grid in one batch.
+
+    Prices are loaded once. Scenarios that share MA window, leverage and
+    which_lev share one return path; the tax recursion then runs once per
+    segment boundary across all scenarios at the same time. chunk_size bounds
+    the number of return paths held in memory at once.
+
+    signal takes a list of signal definitions (see the signals module)
+    instead of MA windows; the grid then has a 'signal' column with their
+    labels, and all signals come from a single signal matrix.
+
+    With cache=True the whole result frame is one result_cache entry, keyed by
+    the grid parameters and the price data; cache=False always computes.
+
+    Returns a DataFrame with one row per scenario.
+    """
+    sweep = _sweep_trading_strategy if cache else _sweep_trading_strategy.uncached
+    return sweep(index, lev, tax_rate, which_lev, ma_window, chunk_size, signal)
+
+
+@result_cache.memoize(lambda args: [INDEX_TICKERS[args['index']], 'GC=F'],
+                      name='calculator.sweep_trading_strategy')
+def _sweep_trading_strategy(index, lev, tax_rate, which_lev, ma_window, chunk_size, signal):
+    lev = np.atleast_1d(np.asarray(lev, dtype=float))
+    tax_rate = np.atleast_1d(np.asarray(tax_rate, dtype=float))
+    which_lev = list(np.atleast_1d(which_lev))
+    ma_window = [int(window) for window in np.atleast_1d(ma_window)]
+
+    for choice in which_lev:
+        if choice not in ['index', 'gold', 'both']:
+            raise ValueError("which_lev must be 'index', 'gold', or 'both'")
+
+    if signal is not None:
+        trend_column, trend_values = 'signal', [signals.label(definition) for definition in signal]
+    else:
+        trend_column, trend_values = 'ma_window', ma_window
+
+    # Scenario grid (lev x tax_rate x which_lev x ma_window or signal)
+    grid = pd.MultiIndex.from_product(
+        [lev, tax_rate, which_lev, trend_values], names=['lev', 'tax_rate', 'which_lev', trend_column]
+    ).to_frame(index=False)
+    grid.insert(0, 'index', index)
+
+    index_data, gold_data = load_strategy_prices(index)
+    keys = list(dict.fromkeys(trend_values))
+    if signal is not None:
+        frames = strategy_frames(index_data, gold_data, signal=keys)
+    else:
+        frames = strategy_frames(index_data, gold_data, keys)
+    table = evaluate_scenarios(frames, grid, trend_column, chunk_size)
+    table['days'] = table['days'].astype(np.int64)
+    return table
+
+
+def strategy_frames(index_data, gold_data, ma_window=(200,), signal=None):
+    """Positions, unleveraged returns and switch days keyed by MA window (or signal label)."""
+    if signal is not None:
+        return _signal_frames(index_data, gold_data, [signals.definition(definition) for definition in signal])
+
+    frames = {}
+    for window in set(ma_window):
+        df = build_strategy_frame(index_data, gold_data, 1, 'both', window)
+        in_gold = (df['position'] == 'gold').to_numpy()
+        frames[window] = {
+            'in_gold': in_gold,
+            'index_return': df['index_return'].to_numpy(dtype=float),
+            'gold_return': df['gold_return'].to_numpy(dtype=float),
+            'switches': np.flatnonzero(in_gold[1:] != in_gold[:-1]) + 1,
+        }
+    return frames
+
+
+def evaluate_scenarios(frames, scenarios, key_column='ma_window', chunk_size=256):
+    """Final value and average yearly return for scenario rows on prepared frames.
+
+    scenarios needs the columns lev, tax_rate, which_lev and key_column (a
+    key of frames); any combination of rows is allowed. Returns a copy with
+    days, final_value and avg_yearly_return added.
+    """
+    grid = scenarios.reset_index(drop=True)
+
+    # Unique return paths; tax rates only enter the recursion below
+    paths = grid[[key_column, 'which_lev', 'lev']].drop_duplicates().reset_index(drop=True)
+    path_id = grid.merge(paths.assign(path_id=np.arange(len(paths))), on=[key_column, 'which_lev', 'lev'],
+                         how='left')['path_id'].to_numpy()
+    path_index_lev = np.where(paths['which_lev'].isin(['index', 'both']), paths['lev'], 1.0)
+    path_gold_lev = np.where(paths['which_lev'].isin(['gold', 'both']), paths['lev'], 1.0)
+
+    segment_growth, tail_growth = _segment_growth(
+        {key: frames[key] for key in paths[key_column]}, paths[key_column].to_numpy(),
+        path_index_lev, path_gold_lev, chunk_size
+    )
+
+    # Tax recursion over segment boundaries, vectorized across scenarios
+    with profiling.stage('simulate', step='calculator.evaluate_scenarios', scenarios=len(grid)):
+        scenario_tax = grid['tax_rate'].to_numpy(dtype=float)
+        value = np.full(len(grid), 100.0)
+        for k in range(segment_growth.shape[1]):
+            new_value = value * segment_growth[path_id, k]
+            value = new_value - scenario_tax * np.maximum(new_value - value, 0)
+        final_value = value * tail_growth[path_id]
+
+    days = np.array([len(frames[key]['in_gold']) for key in grid[key_column]])
+    total_years = days / 252  # Assuming 252 trading days per year
+    with np.errstate(invalid='ignore'):
+        avg_yearly_return = (final_value / 100) ** (1 / total_years) - 1
+
+    grid['days'] = days
+    grid['final_value'] = final_value
+    grid['avg_yearly_return'] = avg_yearly_return
+    return grid
+
+
 def main():
     # Example usage with different leverage scenarios
     test_cases = [
@@ -127,4 +459,4 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,100 @@
+"""Gemeinsamer Kalender mehrerer Assets als Integer-Indexarrays.
+
+Aus den Handelstagen der Assets wird einmal ein Master-Kalender (Vereinigung
+aller Tage) gebaut; für jedes Asset steht fest, an welcher Stelle des
+Master-Kalenders jeder seiner Tage liegt. join() leitet daraus für eine
+Join-Regel die Zeilen ab, die jedes Asset für den Ergebnis-Kalender liefert
+(-1 = kein Kurs). Die Engines holen ihre Arrays dann per Indexzugriff, ohne
+DataFrames neu zu indizieren.
+
+Join-Regeln:
+    'intersect'  nur Tage, an denen alle Assets gehandelt wurden
+    'ffill'      alle Tage, an denen mindestens ein Asset gehandelt wurde, im
+                 gemeinsamen Zeitraum; fehlende Kurse = letzter bekannter Kurs
+    'native'     Kalender des Basis-Assets (z.B. BTC mit Wochenenden), andere
+                 Assets nur an exakt gleichen Tagen
+"""
+import numpy as np
+
+import price_store
+
+POLICIES = ('intersect', 'ffill', 'native')
+
+# Ticker-Tupel -> Kalender (mit Signatur der Kursdaten)
+_cache = {}
+
+
+def build_calendar(dates):
+    """Master-Kalender für {Name: sortierte Datumswerte}"""
+    dates = {name: np.asarray(values, dtype='M8[ns]') for name, values in dates.items()}
+    master = np.unique(np.concatenate(list(dates.values()))) if dates else np.array([], dtype='M8[ns]')
+
+    # Zeile des Assets je Master-Tag (-1 = nicht gehandelt)
+    rows = {}
+    for name, values in dates.items():
+        row_at = np.full(len(master), -1, dtype=np.int64)
+        row_at[np.searchsorted(master, values)] = np.arange(len(values))
+        rows[name] = row_at
+
+    return {'names': list(dates), 'dates': master, 'rows': rows, 'joins': {}}
+
+
+def join(calendar, policy='intersect', base=None):
+    """Ergebnis-Kalender und Zeilen je Asset für eine Join-Regel (Ergebnis wird gemerkt)"""
+    if policy not in POLICIES:
+        raise ValueError(f"Unbekannte Join-Regel {policy}. Wählen Sie aus: {', '.join(POLICIES)}")
+    if policy == 'native':
+        base = base if base is not None else calendar['names'][0]
+    key = (policy, base)
+    if key in calendar['joins']:
+        return calendar['joins'][key]
+
+    rows = calendar['rows']
+    if policy == 'intersect':
+        keep = np.flatnonzero(np.logical_and.reduce([row_at >= 0 for row_at in rows.values()]))
+        joined = {name: row_at[keep] for name, row_at in rows.items()}
+    elif policy == 'ffill':
+        # Gemeinsamer Zeitraum: ab dem letzten Start bis zum ersten Ende
+        first = max(np.argmax(row_at >= 0) for row_at in rows.values())
+        last = min(len(row_at) - np.argmax(row_at[::-1] >= 0) for row_at in rows.values())
+        keep = np.arange(first, max(first, last))
+        joined = {name: np.maximum.accumulate(row_at)[keep] for name, row_at in rows.items()}
+    else:
+        keep = np.flatnonzero(rows[base] >= 0)
+        joined = {name: row_at[keep] for name, row_at in rows.items()}
+
+    result = {'dates': calendar['dates'][keep], 'rows': joined}
+    calendar['joins'][key] = result
+    return result
+
+
+def gather(values, rows):
+    """values[rows] als float, NaN wo rows == -1"""
+    values = np.asarray(values, dtype=float)
+    result = values[np.maximum(rows, 0)] if len(values) else np.full(len(rows), np.nan)
+    result[rows < 0] = np.nan
+    return result
+
+
+def ticker_calendar(tickers):
+    """Kalender für Ticker aus dem price_store, gecacht bis neue Kurse hinzukommen"""
+    tickers = tuple(dict.fromkeys(tickers))
+    price_store.update_many(tickers)
+    arrays = {ticker: price_store.get_array(ticker) for ticker in tickers}
+    signature = tuple((len(array), array['Date'][-1] if len(array) else None) for array in arrays.values())
+
+    cached = _cache.get(tickers)
+    if cached is None or cached['signature'] != signature:
+        cached = build_calendar({ticker: array['Date'] for ticker, array in arrays.items()})
+        cached['signature'] = signature
+        _cache[tickers] = cached
+    return cached
+
+
+def aligned_prices(tickers, policy='intersect', base=None, field='Close'):
+    """(Datumswerte, Kurse als Assets x Tage) für Ticker aus dem price_store"""
+    calendar = ticker_calendar(tickers)
+    joined = join(calendar, policy, base)
+    matrix = np.vstack([gather(price_store.get_array(ticker)[field], joined['rows'][ticker])
+                        for ticker in tickers]) if len(tickers) else np.empty((0, len(joined['dates'])))
+    return joined['dates'], matrix
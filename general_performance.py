@@ -1,28 +1,34 @@
-import yfinance as yf
 import pandas as pd
 import numpy as np
 from datetime import datetime
 
-
-def analyze_leveraged_portfolio(ticker_choice, signal_asset, leverage, position='over', direction='long'):
+import calendar_align
+import ma_cache
+import price_store
+import profiling
+import result_cache
+
+# Dictionary für die Ticker-Symbole
+TICKER_MAP = {
+    "s&p 500": "^GSPC",
+    "dax": "^GDAXI",
+    "nasdaq 100": "^NDX",
+    "dow jones": "^DJI",
+    "gold": "GC=F",
+    "bitcoin": "BTC-USD"
+}
+
+
+def prepare_leveraged_data(ticker_choice, signal_asset, leverage, position='over', direction='long'):
+    """Lädt Kurse und berechnet Regime, Returns und die tägliche Strategie-Rendite"""
     if position.lower() not in ['over', 'under']:
         raise ValueError("Position muss 'over' oder 'under' sein")
     if direction.lower() not in ['long', 'short']:
         raise ValueError("Direction muss 'long' oder 'short' sein")
 
-    # Dictionary für die Ticker-Symbole
-    ticker_map = {
-        "s&p 500": "^GSPC",
-        "dax": "^GDAXI",
-        "nasdaq 100": "^NDX",
-        "dow jones": "^DJI",
-        "gold": "GC=F",
-        "bitcoin": "BTC-USD"
-    }
-
     # Ticker-Symbole auswählen
-    ticker = ticker_map.get(ticker_choice.lower())
-    signal_ticker = ticker_map.get(signal_asset.lower())
+    ticker = TICKER_MAP.get(ticker_choice.lower())
+    signal_ticker = TICKER_MAP.get(signal_asset.lower())
     if not ticker:
         raise ValueError(
             "Ungültige Auswahl für Trading Asset. Bitte wählen Sie aus: S&P 500, DAX, NASDAQ 100, Dow Jones, Gold, Bitcoin")
@@ -32,28 +38,29 @@ def analyze_leveraged_portfolio(ticker_choice, signal_asset, leverage, position=
 
     # DataFrame für Signal Asset als Referenz erstellen
     df_ref = pd.DataFrame()
-    signal_data = yf.download(signal_ticker, start="1900-01-01")
+    price_store.update_many([signal_ticker, ticker])
+    signal_data = price_store.get_prices(signal_ticker)
     df_ref['reference'] = signal_data['Close']
 
-    # 200 Tage MA vom Signal Asset berechnen
-    df_ref['ma200'] = df_ref['reference'].rolling(window=200).mean()
+    with profiling.stage('signal', step='general_performance.prepare_leveraged_data'):
+        # 200 Tage MA vom Signal Asset berechnen
+        df_ref['ma200'] = ma_cache.ticker_ma(signal_ticker, 200)
 
-    # Erste 199 Zeilen löschen
-    df_ref = df_ref.iloc[199:]
+        # Erste 199 Zeilen löschen
+        df_ref = df_ref.iloc[199:]
 
-    # Regime-Spalte erstellen (True wenn über MA200)
-    df_ref['regime'] = df_ref['reference'] > df_ref['ma200']
+        # Regime-Spalte erstellen (True wenn über MA200)
+        df_ref['regime'] = df_ref['reference'] > df_ref['ma200']
 
-    # Gewählten Trading Index laden
-    index_data = yf.download(ticker, start="1900-01-01")
-    df_index = pd.DataFrame()
-    df_index['price'] = index_data['Close']
+    with profiling.stage('align', step='general_performance.prepare_leveraged_data'):
+        # Gewählten Trading Index auf den Kalender des Signal Assets legen (ohne die ersten 199 Tage)
+        calendar = calendar_align.ticker_calendar([signal_ticker, ticker])
+        rows = calendar_align.join(calendar, 'native', base=signal_ticker)['rows'][ticker][199:]
+        df = df_ref.copy()
+        df['price'] = calendar_align.gather(price_store.get_array(ticker)['Close'], rows)
 
-    # DataFrames auf Basis der Daten mergen
-    df = pd.merge(df_ref, df_index, left_index=True, right_index=True, how='left')
-
-    # Zeilen mit NA im Index löschen
-    df = df.dropna(subset=['price'])
+        # Zeilen mit NA im Index löschen
+        df = df.dropna(subset=['price'])
 
     # Tägliche Returns berechnen
     df['daily_return'] = df['price'].pct_change()
@@ -67,24 +74,32 @@ def analyze_leveraged_portfolio(ticker_choice, signal_asset, leverage, position=
     # Gehebelte Returns berechnen
     df['leveraged_return'] = df['direction_return'] * leverage
 
-    # Portfolio-Wert berechnen
-    df['portfolio'] = 0.0  # Initialisieren
-    df['portfolio'].iloc[0] = 100  # Startwert
-
-    # Portfolio-Werte basierend auf Regime und Position berechnen
-    for i in range(1, len(df)):
-        prev_value = df['portfolio'].iloc[i - 1]
-        if position.lower() == 'over':
-            # Wenn "over", dann leveraged_return wenn über MA200, sonst 0
-            return_today = df['leveraged_return'].iloc[i] if df['regime'].iloc[i - 1] else 0
-        else:
-            # Wenn "under", dann leveraged_return wenn unter MA200, sonst 0
-            return_today = df['leveraged_return'].iloc[i] if not df['regime'].iloc[i - 1] else 0
-        df['portfolio'].iloc[i] = prev_value * (1 + return_today)
-
-    # Buy & Hold Portfolio zum Vergleich
-    df['buy_hold'] = 100 * (1 + df['daily_return']).cumprod()
-    df['buy_hold_leveraged'] = 100 * (1 + df['leveraged_return']).cumprod()
+    # Strategie-Rendite: gehebelter Return, wenn das Regime vom Vortag passt, sonst 0
+    regime = df['regime'].to_numpy(dtype=bool)
+    invested = np.zeros(len(df), dtype=bool)
+    if position.lower() == 'over':
+        # Wenn "over", dann leveraged_return wenn über MA200
+        invested[1:] = regime[:-1]
+    else:
+        # Wenn "under", dann leveraged_return wenn unter MA200
+        invested[1:] = ~regime[:-1]
+    df['invested'] = invested
+    df['strategy_return'] = np.where(invested, df['leveraged_return'], 0.0)
+
+    return df
+
+
+@result_cache.memoize(lambda args: [TICKER_MAP[args['ticker_choice'].lower()], TICKER_MAP[args['signal_asset'].lower()]])
+def analyze_leveraged_portfolio(ticker_choice, signal_asset, leverage, position='over', direction='long'):
+    df = prepare_leveraged_data(ticker_choice, signal_asset, leverage, position, direction)
+
+    with profiling.stage('simulate', step='general_performance.analyze_leveraged_portfolio'):
+        # Portfolio-Wert berechnen (Startwert 100)
+        df['portfolio'] = 100 * (1 + df['strategy_return']).cumprod()
+
+        # Buy & Hold Portfolio zum Vergleich
+        df['buy_hold'] = 100 * (1 + df['daily_return']).cumprod()
+        df['buy_hold_leveraged'] = 100 * (1 + df['leveraged_return']).cumprod()
 
     # Jahre berechnen
     years = (df.index[-1] - df.index[0]).days / 365.25
@@ -115,7 +130,115 @@ def analyze_leveraged_portfolio(ticker_choice, signal_asset, leverage, position=
 
     return results, df
 
+
+def _log_growth_prefix(returns):
+    """Präfixsummen der Log-Renditen (Tag 0 = 0); Totalverlust wird auf ~0 begrenzt"""
+    growth = np.maximum(1 + np.nan_to_num(np.asarray(returns, dtype=float)), np.finfo(float).tiny)
+    growth[0] = 1.0
+    return np.cumsum(np.log(growth))
+
+
+def _drawdown_tables(log_value):
+    """Sparse Table über Blöcke der Länge 2^k: (Maximum, Minimum, Max Drawdown) im Log-Raum"""
+    tables = [(log_value, log_value, np.zeros_like(log_value))]
+    length = 1
+    while 2 * length <= len(log_value):
+        high, low, drawdown = tables[-1]
+        n = len(high) - length
+        tables.append((
+            np.maximum(high[:n], high[length:]),
+            np.minimum(low[:n], low[length:]),
+            # Drawdown im Block: links, rechts oder Hoch links -> Tief rechts
+            np.minimum(np.minimum(drawdown[:n], drawdown[length:]), low[length:] - high[:n]),
+        ))
+        length *= 2
+    return tables
+
+
+def _range_drawdown(tables, start, end):
+    """Max Drawdown (Log) für alle Bereiche [start, end] aus disjunkten 2^k-Blöcken"""
+    position = start.copy()
+    remaining = end - start + 1
+    high = np.full(len(start), -np.inf)
+    drawdown = np.zeros(len(start))
+
+    for k in range(len(tables) - 1, -1, -1):
+        take = remaining >= 2 ** k
+        if not take.any():
+            continue
+        block_high, block_low, block_drawdown = (table[np.minimum(position, len(table) - 1)] for table in tables[k])
+        drawdown = np.where(take, np.minimum(np.minimum(drawdown, block_drawdown), block_low - high), drawdown)
+        high = np.where(take, np.maximum(high, block_high), high)
+        position = np.where(take, position + 2 ** k, position)
+        remaining = np.where(take, remaining - 2 ** k, remaining)
+    return drawdown
+
+
+def analyze_start_dates(ticker_choice, signal_asset, leverage, position='over', direction='long', horizons=None):
+    """Jährliche Rendite, Endwert und Max Drawdown für jeden möglichen Einstiegstag.
+
+    horizons=None: vom Einstieg bis zum Ende der Daten. Sonst eine Liste von
+    Anlagedauern in Jahren; dann gibt es eine Zeile je (Einstieg, Dauer), sofern
+    die Dauer vollständig in den Daten liegt.
+    Alle Bereiche werden über Präfixsummen der Log-Renditen und eine Sparse Table
+    für Bereichs-Maxima/-Minima berechnet, ohne Schleife über die Einstiegstage.
+    """
+    df = prepare_leveraged_data(ticker_choice, signal_asset, leverage, position, direction)
+    dates = df.index.values
+    n = len(df)
+
+    portfolios = {
+        'Buy & Hold Portfolio': df['daily_return'],
+        'Buy & Hold Leveraged': df['leveraged_return'],
+        'Strategy Portfolio': df['strategy_return'],
+    }
+
+    # Bereiche (Einstieg, Ende) festlegen
+    if horizons is None:
+        start = np.arange(n - 1)
+        end = np.full(n - 1, n - 1)
+        horizon = np.full(n - 1, np.nan)
+    else:
+        starts, ends, horizon_list = [], [], []
+        for years in horizons:
+            target = dates + np.timedelta64(int(round(years * 365.25)), 'D')
+            end_for_start = np.searchsorted(dates, target, side='right') - 1
+            complete = target <= dates[-1]
+            starts.append(np.flatnonzero(complete))
+            ends.append(end_for_start[complete])
+            horizon_list.append(np.full(complete.sum(), float(years)))
+        start, end, horizon = np.concatenate(starts), np.concatenate(ends), np.concatenate(horizon_list)
+
+    years = (dates[end] - dates[start]) / np.timedelta64(1, 'D') / 365.25
+
+    frames = []
+    for name, returns in portfolios.items():
+        with profiling.stage('metrics', step='general_performance.analyze_start_dates', portfolio=name):
+            log_value = _log_growth_prefix(returns.to_numpy())
+            log_growth = log_value[end] - log_value[start]
+
+            if horizons is None:
+                # Gemeinsames Ende: Drawdown ab jedem Einstieg per Rückwärts-Akkumulation
+                suffix_low = np.minimum.accumulate(log_value[::-1])[::-1]
+                max_drawdown = np.minimum.accumulate((suffix_low - log_value)[::-1])[::-1][start]
+            else:
+                max_drawdown = _range_drawdown(_drawdown_tables(log_value), start, end)
+
+            with np.errstate(over='ignore', divide='ignore', invalid='ignore'):
+                frames.append(pd.DataFrame({
+                    'Start': df.index[start],
+                    'Ende': df.index[end],
+                    'Horizont (Jahre)': horizon,
+                    'Portfolio': name,
+                    'Finaler Wert': 100 * np.exp(log_growth),
+                    'Jährliche Rendite': np.expm1(log_growth / years),
+                    'Max Drawdown': np.expm1(max_drawdown),
+                }))
+
+    return pd.concat(frames, ignore_index=True)
+
 # Test
-# Beispiel: SHORT Trading Bitcoin mit 3x Hebel wenn S&P 500 über MA200
-results, data = analyze_leveraged_portfolio("bitcoin", "bitcoin", 1, "under", "short")
-print(results)
\ No newline at end of file
+if __name__ == "__main__":
+    # Beispiel: SHORT Trading Bitcoin mit 3x Hebel wenn S&P 500 über MA200
+    results, data = analyze_leveraged_portfolio("bitcoin", "bitcoin", 1, "under", "short")
+    print(results)
\ No newline at end of file
@@ -0,0 +1,270 @@
+"""Kommandozeile für alle Auswertungen.
+
+Die Module werden erst im jeweiligen Befehl importiert. 'price' und 'ma'
+lesen den lokalen Kursspeicher nur mit numpy und starten daher ohne pandas.
+'batch' führt viele Befehle (eine Zeile je Befehl) in einem Prozess aus;
+--offline und --profile einer Zeile gelten nur für diese Zeile, und eine
+fehlerhafte Zeile wird gemeldet, ohne die übrigen abzubrechen.
+
+Beispiele:
+    python levtax.py price ^GSPC --days 5
+    python levtax.py ma BTC-USD --window 200
+    python levtax.py --offline trading --index "S&P 500" --lev 2
+    python levtax.py trading --signal band:200:0.02
+    python levtax.py leveraged bitcoin "s&p 500" --leverage 3
+    python levtax.py optimize --btc --method descent
+    python levtax.py batch befehle.txt
+"""
+import argparse
+import os
+import shlex
+import sys
+
+import numpy as np
+
+
+def _price(args):
+    import price_store
+
+    array = price_store.get_array(args.ticker)[-args.days:]
+    for row in array:
+        print(f"{np.datetime_as_string(row['Date'], unit='D')}  {row[args.field]:.2f}")
+
+
+def _ma(args):
+    import price_store
+
+    close = price_store.get_array(args.ticker)[args.field]
+    close = close[~np.isnan(close)]
+    if len(close) < args.window:
+        raise ValueError(f"Zu wenige Kurse für MA{args.window}: {len(close)}")
+    ma = close[-args.window:].mean()
+    position = 'über' if close[-1] > ma else 'unter'
+    print(f"{args.ticker}: {close[-1]:.2f} {position} MA{args.window} ({ma:.2f}, {(close[-1] / ma - 1) * 100:+.1f}%)")
+
+
+def _update(args):
+    import price_store
+
+    for ticker, array in price_store.update_many(args.tickers, offline=False).items():
+        print(f"{ticker}: {len(array)} Tage bis {np.datetime_as_string(array['Date'][-1], unit='D')}")
+
+
+def _trading(args):
+    import calculator
+
+    avg_yearly_return = calculator.calculate_trading_strategy(
+        args.index, args.tax_rate, args.lev, args.which_lev, args.engine, args.ma_window, args.signal)
+    print(f"Average yearly return: {avg_yearly_return:.2%}")
+
+
+def _leveraged(args):
+    import general_performance
+
+    results, _ = general_performance.analyze_leveraged_portfolio(
+        args.trade, args.signal, args.leverage, args.position, args.direction)
+    _print_nested(results)
+
+
+def _regime(args):
+    if args.btc:
+        import final_portfolio_performance_btc as module
+    else:
+        import final_portfolio_performance as module
+
+    results, _ = module.simulate_regime_portfolio()
+    _print_nested(results)
+
+
+def _overlap(args):
+    import moving_avrg_overlap
+
+    moving_avrg_overlap.print_results(args.ma_period)
+
+
+def _portfolios(args):
+    import BuyHoldLev
+
+    results, _ = BuyHoldLev.analyze_portfolios(signal=args.signal or None)
+    _print_nested(results)
+
+
+def _montecarlo(args):
+    import montecarlo
+
+    params = {'lev': args.lev} if args.strategy == 'trading_strategy' else {'leverage': args.lev}
+    print(montecarlo.simulate(args.strategy, tuple(args.tickers), n_paths=args.paths, years=args.years,
+                              seed=args.seed, **params).to_string())
+
+
+def _optimize(args):
+    if args.btc:
+        import final_portfolio_performance_btc as module
+    else:
+        import final_portfolio_performance as module
+    import weight_optimizer
+
+    problem = weight_optimizer.prepare(module.SPEC)
+    options = {'grid': {'steps': args.steps}, 'random': {'n': args.samples, 'seed': args.seed},
+               'descent': {'steps': args.steps, 'objective': args.objective}}[args.method]
+    if args.walk_forward:
+        train_years, test_years = args.walk_forward
+        frame = weight_optimizer.walk_forward(problem, train_years, test_years, method=args.method, **options)
+    else:
+        candidates, scores = weight_optimizer.search(problem, args.method, **options)
+        frame = weight_optimizer.front_frame(problem, candidates, scores)
+    print(frame.to_string())
+
+
+def _cache(args):
+    import result_cache
+
+    if args.clear:
+        result_cache.clear()
+    print(f"Verzeichnis: {result_cache.directory() or 'abgeschaltet'}")
+    _print_nested(result_cache.stats())
+
+
+def _batch(args):
+    failed = 0
+    lines = sys.stdin if args.file == '-' else open(args.file, encoding='utf-8')
+    with lines:
+        for number, line in enumerate(lines, start=1):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            print(f"$ {line}", flush=True)
+            try:
+                run(shlex.split(line))
+            except SystemExit as error:
+                # argparse meldet ungültige Zeilen selbst auf stderr (Code 2), sys.exit(Text) nicht
+                if error.code:
+                    failed += 1
+                    message = error.code if isinstance(error.code, str) else 'ungültiger Befehl'
+                    print(f"Fehler in Zeile {number}: {message}", file=sys.stderr, flush=True)
+            except Exception as error:
+                failed += 1
+                print(f"Fehler in Zeile {number}: {type(error).__name__}: {error}", file=sys.stderr, flush=True)
+    if failed:
+        print(f"{failed} Zeile(n) fehlgeschlagen", file=sys.stderr)
+        return 1
+
+
+def _print_nested(results, indent=''):
+    for key, value in results.items():
+        if isinstance(value, dict):
+            print(f"{indent}{key}:")
+            _print_nested(value, indent + '  ')
+        else:
+            print(f"{indent}{key}: {value}")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='levtax', description=__doc__.splitlines()[0])
+    parser.add_argument('--offline', action='store_true', help='nur lokale Kursdaten verwenden')
+    parser.add_argument('--profile', metavar='PATH', help='Stufen-Trace (JSON-Zeilen) schreiben')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    command = commands.add_parser('price', help='letzte Kurse aus dem lokalen Speicher')
+    command.add_argument('ticker')
+    command.add_argument('--days', type=int, default=1)
+    command.add_argument('--field', default='Close')
+    command.set_defaults(handler=_price)
+
+    command = commands.add_parser('ma', help='letzter Kurs über/unter dem MA')
+    command.add_argument('ticker')
+    command.add_argument('--window', type=int, default=200)
+    command.add_argument('--field', default='Close')
+    command.set_defaults(handler=_ma)
+
+    command = commands.add_parser('update', help='Kursspeicher aktualisieren')
+    command.add_argument('tickers', nargs='+')
+    command.set_defaults(handler=_update)
+
+    command = commands.add_parser('trading', help='calculate_trading_strategy')
+    command.add_argument('--index', default='S&P 500')
+    command.add_argument('--tax-rate', type=float, default=0.25)
+    command.add_argument('--lev', type=float, default=1)
+    command.add_argument('--which-lev', default='both', choices=['index', 'gold', 'both'])
+    command.add_argument('--ma-window', type=int, default=200)
+    command.add_argument('--engine', default='vectorized', choices=['vectorized', 'loop', 'ledger'])
+    command.add_argument('--signal', help="Signal statt Kurs über MA, z.B. 'ema:100' oder 'band:200:0.02/2'")
+    command.set_defaults(handler=_trading)
+
+    command = commands.add_parser('leveraged', help='analyze_leveraged_portfolio')
+    command.add_argument('trade')
+    command.add_argument('signal')
+    command.add_argument('--leverage', type=float, default=1)
+    command.add_argument('--position', default='over', choices=['over', 'under'])
+    command.add_argument('--direction', default='long', choices=['long', 'short'])
+    command.set_defaults(handler=_leveraged)
+
+    command = commands.add_parser('regime', help='simulate_regime_portfolio')
+    command.add_argument('--btc', action='store_true', help='Variante mit Bitcoin')
+    command.set_defaults(handler=_regime)
+
+    command = commands.add_parser('overlap', help='Übereinstimmung der MA-Signale')
+    command.add_argument('--ma-period', type=int, default=200)
+    command.set_defaults(handler=_overlap)
+
+    command = commands.add_parser('portfolios', help='gehebelte Buy & Hold Portfolios')
+    command.add_argument('--signal', nargs='+', help="zusätzlich mit Trendfilter, z.B. 'sma:200' 'cross:50:200'")
+    command.set_defaults(handler=_portfolios)
+
+    command = commands.add_parser('montecarlo', help='Block-Bootstrap-Simulation')
+    command.add_argument('--strategy', default='trading_strategy',
+                         choices=['trading_strategy', 'leveraged_portfolio', 'buy_hold'])
+    command.add_argument('--tickers', nargs='+', default=['^GSPC', 'GC=F'])
+    command.add_argument('--lev', type=float, default=1)
+    command.add_argument('--paths', type=int, default=10_000)
+    command.add_argument('--years', type=float, default=10)
+    command.add_argument('--seed', type=int, default=0)
+    command.set_defaults(handler=_montecarlo)
+
+    command = commands.add_parser('optimize', help='Regime-Gewichte optimieren (Pareto-Front CAGR/Drawdown)')
+    command.add_argument('--btc', action='store_true', help='Variante mit Bitcoin')
+    command.add_argument('--method', default='random', choices=['grid', 'random', 'descent'])
+    command.add_argument('--samples', type=int, default=20_000)
+    command.add_argument('--steps', type=int, default=5)
+    command.add_argument('--objective', default='Calmar', choices=['CAGR', 'Calmar'])
+    command.add_argument('--seed', type=int, default=0)
+    command.add_argument('--walk-forward', type=float, nargs=2, metavar=('TRAIN', 'TEST'),
+                         help='Trainings- und Testfenster in Jahren')
+    command.set_defaults(handler=_optimize)
+
+    command = commands.add_parser('cache', help='Ergebnis-Cache anzeigen oder leeren')
+    command.add_argument('--clear', action='store_true')
+    command.set_defaults(handler=_cache)
+
+    command = commands.add_parser('batch', help='Befehle zeilenweise aus einer Datei (- = stdin)')
+    command.add_argument('file')
+    command.set_defaults(handler=_batch)
+
+    return parser
+
+
+def run(argv):
+    """Führt einen Befehl aus; --offline und --profile gelten nur für diesen Aufruf"""
+    args = build_parser().parse_args(argv)
+    offline = os.environ.get('LEVTAX_OFFLINE')
+    if args.offline:
+        os.environ['LEVTAX_OFFLINE'] = '1'
+    try:
+        if args.profile:
+            import profiling
+            with profiling.enabled(args.profile):
+                return args.handler(args)
+        return args.handler(args)
+    finally:
+        if offline is None:
+            os.environ.pop('LEVTAX_OFFLINE', None)
+        else:
+            os.environ['LEVTAX_OFFLINE'] = offline
+
+
+def main(argv=None):
+    return run(sys.argv[1:] if argv is None else argv) or 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,96 @@
+"""Gleitende Durchschnitte über Präfixsummen.
+
+Pro Kursreihe wird einmal eine Präfixsumme gebildet, danach kostet jedes
+MA-Fenster O(1) pro Tag. Fenster mit NaN ergeben NaN (wie pandas rolling mit
+min_periods=window). Für Ticker aus dem price_store werden die Präfixsummen
+zwischengespeichert, bis neue Kurse hinzukommen.
+"""
+import numpy as np
+import pandas as pd
+
+import price_store
+
+# (Ticker, Feld) -> {'length', 'last_date', 'index', 'prefix'}
+_cache = {}
+
+
+def prefix_sums(values):
+    """Präfixsummen (beginnend mit 0) und kumulierte NaN-Anzahl einer Reihe.
+
+    Die Werte werden um den ersten gültigen Wert verschoben summiert, damit
+    die Differenzen langer Summen genau bleiben.
+    """
+    values = np.asarray(values, dtype=float)
+    missing = np.isnan(values)
+    offset = values[~missing][0] if (~missing).any() else 0.0
+
+    total = np.zeros(len(values) + 1)
+    np.cumsum(np.where(missing, 0.0, values - offset), out=total[1:])
+    nans = np.zeros(len(values) + 1, dtype=np.int64)
+    np.cumsum(missing, out=nans[1:])
+    return {'sum': total, 'nans': nans, 'offset': offset}
+
+
+def moving_average(prefix, windows):
+    """MA für ein Fenster (1D) oder mehrere Fenster (2D: Fenster x Tage)"""
+    scalar = np.ndim(windows) == 0
+    windows = np.atleast_1d(np.asarray(windows, dtype=np.int64))[:, None]
+
+    n = len(prefix['sum']) - 1
+    end = np.arange(1, n + 1)[None, :]
+    start = end - windows
+    start_clipped = np.maximum(start, 0)
+
+    ma = (prefix['sum'][end] - prefix['sum'][start_clipped]) / windows + prefix['offset']
+    ma[(start < 0) | (prefix['nans'][end] - prefix['nans'][start_clipped] > 0)] = np.nan
+    return ma[0] if scalar else ma
+
+
+def rolling_mean(series, window, prefix=None):
+    """Ersatz für series.rolling(window=window).mean()"""
+    if prefix is None:
+        prefix = prefix_sums(series.to_numpy(dtype=float))
+    return pd.Series(moving_average(prefix, window), index=series.index, name=series.name)
+
+
+def ticker_prefix(ticker, field='Close'):
+    """Zwischengespeicherte Präfixsummen der gesamten Historie eines Tickers"""
+    array = price_store.update(ticker)
+    last_date = array['Date'][-1] if len(array) else None
+
+    entry = _cache.get((ticker, field))
+    if entry is None or entry['length'] != len(array) or entry['last_date'] != last_date:
+        values = np.asarray(array[field])
+        entry = {
+            'length': len(array),
+            'last_date': last_date,
+            'index': pd.DatetimeIndex(np.asarray(array['Date']), name='Date'),
+            'values': values,
+            'prefix': prefix_sums(values),
+        }
+        _cache[(ticker, field)] = entry
+    return entry
+
+
+def ticker_ma(ticker, window, field='Close'):
+    """MA eines Tickers als Series (gleicher Index wie price_store.get_prices)"""
+    entry = ticker_prefix(ticker, field)
+    return pd.Series(moving_average(entry['prefix'], window), index=entry['index'])
+
+
+def signal_matrix(values, windows, prefix=None):
+    """Bool-Matrix (Fenster x Tage): Kurs über seinem MA (False solange MA fehlt)"""
+    values = np.asarray(values, dtype=float)
+    if prefix is None:
+        prefix = prefix_sums(values)
+    ma = moving_average(prefix, np.atleast_1d(windows))
+    with np.errstate(invalid='ignore'):
+        return values[None, :] > ma
+
+
+def ticker_signal_matrix(ticker, windows, field='Close'):
+    """Signal-Matrix eines Tickers als DataFrame (Zeilen: Fenster, Spalten: Tage)"""
+    entry = ticker_prefix(ticker, field)
+    windows = np.atleast_1d(windows)
+    return pd.DataFrame(signal_matrix(entry['values'], windows, entry['prefix']),
+                        index=pd.Index(windows, name='window'), columns=entry['index'])
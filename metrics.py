@@ -0,0 +1,100 @@
+"""Performance-Kennzahlen für viele Portfolios auf einmal.
+
+compute_metrics nimmt tägliche Returns als (Portfolios x Tage) und gibt je
+Kennzahl ein numerisches Array (ein Wert pro Portfolio) zurück. Damit lassen
+sich auch tausende Sweep-Ergebnisse ohne Python-Schleife berechnen und
+sortieren. Die Formatierung als Text übernimmt format_metrics.
+
+Alle Kennzahlen sind Anteile (0.12 = 12%), die Drawdown-Dauer ist in Tagen.
+Der Startwert (vor dem ersten Return) zählt als erstes Hoch.
+"""
+import numpy as np
+import pandas as pd
+
+import profiling
+
+TRADING_DAYS = 252
+
+METRICS = ('CAGR', 'Volatilität', 'Max Drawdown', 'Drawdown-Dauer',
+           'Sharpe', 'Sortino', 'Calmar', 'Ulcer Index')
+
+
+def _chunk_metrics(returns, periods_per_year, risk_free):
+    n_days = returns.shape[1]
+
+    # Wertverlauf mit Startwert 1 in Spalte 0
+    values = np.ones((returns.shape[0], n_days + 1))
+    np.cumprod(1 + returns, axis=1, out=values[:, 1:])
+    peak = np.maximum.accumulate(values, axis=1)
+    drawdown = values / peak - 1
+
+    # Drawdown-Dauer: Abstand zum letzten Hoch
+    days = np.arange(n_days + 1)
+    last_peak = np.maximum.accumulate(np.where(drawdown >= 0, days, 0), axis=1)
+    duration = (days - last_peak).max(axis=1)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cagr = values[:, -1] ** (periods_per_year / n_days) - 1
+        excess = returns - risk_free / periods_per_year
+        mean_excess = excess.mean(axis=1)
+        volatility = returns.std(axis=1, ddof=1)
+        downside = np.sqrt((np.minimum(excess, 0.0) ** 2).mean(axis=1))
+        max_drawdown = drawdown.min(axis=1)
+
+        return {
+            'CAGR': cagr,
+            'Volatilität': volatility * np.sqrt(periods_per_year),
+            'Max Drawdown': max_drawdown,
+            'Drawdown-Dauer': duration,
+            'Sharpe': mean_excess / volatility * np.sqrt(periods_per_year),
+            'Sortino': mean_excess / downside * np.sqrt(periods_per_year),
+            'Calmar': cagr / -max_drawdown,
+            'Ulcer Index': np.sqrt((drawdown[:, 1:] ** 2).mean(axis=1)),
+        }
+
+
+@profiling.traced('metrics')
+def compute_metrics(returns, periods_per_year=TRADING_DAYS, risk_free=0.0, chunk_size=1024):
+    """Alle Kennzahlen für (Portfolios x Tage) Returns; 1D wird als ein Portfolio behandelt.
+
+    Die Returns müssen endlich sein (z.B. den ersten pct_change-Tag vorher
+    entfernen). risk_free ist ein jährlicher Zins für Sharpe und Sortino.
+    Die Portfolios werden in Blöcken von chunk_size Zeilen berechnet.
+    """
+    returns = np.atleast_2d(np.asarray(returns, dtype=float))
+    chunks = [_chunk_metrics(returns[start:start + chunk_size], periods_per_year, risk_free)
+              for start in range(0, len(returns), chunk_size)]
+    return {name: np.concatenate([chunk[name] for chunk in chunks]) for name in METRICS}
+
+
+def metrics_frame(metrics, names=None):
+    """Kennzahlen als DataFrame (eine Zeile pro Portfolio), z.B. zum Sortieren"""
+    return pd.DataFrame(metrics, index=names, columns=list(metrics))
+
+
+def _percent(value):
+    return f"{value * 100:.2f}%"
+
+
+def _ratio(value):
+    return f"{value:.2f}"
+
+
+FORMATS = {
+    'CAGR': ('Jährliche Rendite', _percent),
+    'Volatilität': ('Volatilität', _percent),
+    'Max Drawdown': ('Max Drawdown', _percent),
+    'Drawdown-Dauer': ('Längster Drawdown', lambda value: f"{int(value)} Tage"),
+    'Sharpe': ('Sharpe Ratio', _ratio),
+    'Sortino': ('Sortino Ratio', _ratio),
+    'Calmar': ('Calmar Ratio', _ratio),
+    'Ulcer Index': ('Ulcer Index', _percent),
+}
+
+
+def format_metrics(metrics, names, fields=METRICS):
+    """Formatierte Texte je Portfolio: {Name: {Beschriftung: Text}}"""
+    return {
+        name: {FORMATS[field][0]: FORMATS[field][1](metrics[field][row]) for field in fields}
+        for row, name in enumerate(names)
+    }
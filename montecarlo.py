@@ -0,0 +1,201 @@
+"""Monte-Carlo-Simulation der gehebelten Strategien per Block-Bootstrap.
+
+Tägliche Returns der beteiligten Assets werden gemeinsam in Blöcken gezogen
+(gleiche Tage für alle Assets, damit die Korrelation erhalten bleibt). Die
+Pfade werden in Blöcken fester Größe (chunk_size) berechnet; von jedem Pfad
+bleiben nur Kennzahlen, die in Histogramm-Akkumulatoren einfließen. Der
+Speicherbedarf hängt damit nur von chunk_size ab, nicht von n_paths.
+
+Strategien:
+    'trading_strategy':    calculator.calculate_trading_strategy (Index/Gold, Steuer bei Wechsel)
+    'leveraged_portfolio': general_performance.analyze_leveraged_portfolio (MA-Signal eines Assets)
+    'buy_hold':            gehebeltes Buy & Hold des ersten Assets
+"""
+import numpy as np
+import pandas as pd
+
+import calendar_align
+import profiling
+
+TRADING_DAYS = 252
+
+
+# ---------------------------------------------------------------------------
+# Daten und Bootstrap
+# ---------------------------------------------------------------------------
+
+@profiling.traced('align')
+def load_joint_returns(tickers):
+    """Tägliche Returns aller Ticker an gemeinsamen Handelstagen (Tage x Assets)"""
+    dates, closes = calendar_align.aligned_prices(tickers, 'intersect')
+    return pd.DataFrame((closes[:, 1:] / closes[:, :-1] - 1).T, columns=list(tickers),
+                        index=pd.DatetimeIndex(dates[1:], name='Date'))
+
+
+def bootstrap_returns(returns, n_paths, n_days, block_length, rng):
+    """Zieht n_paths Pfade aus zusammenhängenden Blöcken (Pfade x Tage x Assets)"""
+    n_blocks = -(-n_days // block_length)
+    starts = rng.integers(0, len(returns) - block_length + 1, size=(n_paths, n_blocks))
+    rows = (starts[:, :, None] + np.arange(block_length)).reshape(n_paths, -1)[:, :n_days]
+    return returns[rows]
+
+
+def _moving_average(prices, window):
+    """MA entlang der Tage für viele Pfade (NaN solange das Fenster nicht voll ist)"""
+    total = np.zeros((prices.shape[0], prices.shape[1] + 1))
+    np.cumsum(prices, axis=1, out=total[:, 1:])
+    ma = np.full(prices.shape, np.nan)
+    ma[:, window - 1:] = (total[:, window:] - total[:, :-window]) / window
+    return ma
+
+
+def _max_drawdown(values):
+    return (values / np.maximum.accumulate(values, axis=1) - 1).min(axis=1)
+
+
+# ---------------------------------------------------------------------------
+# Strategien auf Pfad-Blöcken (erste `warmup` Tage dienen nur dem MA)
+# ---------------------------------------------------------------------------
+
+def _trading_strategy(returns, warmup, tax_rate=0.25, lev=1, which_lev='both', ma_window=200):
+    """Wie calculate_trading_strategy: Index über MA -> Index, sonst Gold, Steuer bei jedem Wechsel"""
+    index_return, gold_return = returns[:, :, 0], returns[:, :, 1]
+    index_price = np.cumprod(1 + index_return, axis=1)
+    in_gold = index_price < _moving_average(index_price, ma_window)
+
+    index_lev = index_return * lev if which_lev in ['index', 'both'] else index_return
+    gold_lev = gold_return * lev if which_lev in ['gold', 'both'] else gold_return
+
+    n_paths, n_days = index_return.shape
+    value = np.full(n_paths, 100.0)
+    peak = value.copy()
+    max_drawdown = np.zeros(n_paths)
+    last_regime_change_value = value.copy()
+    position = in_gold[:, warmup]
+
+    # Die Steuer hängt vom Pfad ab, daher ein Schritt pro Tag über alle Pfade gleichzeitig
+    for t in range(warmup + 1, n_days):
+        current_position = in_gold[:, t - 1]
+        value = value * (1 + np.where(current_position, gold_lev[:, t], index_lev[:, t]))
+
+        switched = current_position != position
+        gain = np.where(switched, value - last_regime_change_value, 0.0)
+        value = value - tax_rate * np.maximum(gain, 0.0)
+        last_regime_change_value = np.where(switched, value, last_regime_change_value)
+        position = current_position
+
+        peak = np.maximum(peak, value)
+        max_drawdown = np.minimum(max_drawdown, value / peak - 1)
+
+    return value, max_drawdown
+
+
+def _leveraged_portfolio(returns, warmup, leverage=1, position='over', direction='long', ma_window=200):
+    """Wie analyze_leveraged_portfolio: Asset 0 handeln, wenn Asset 1 (Vortag) über/unter MA liegt"""
+    trade_return, signal_return = returns[:, :, 0], returns[:, :, 1]
+    signal_price = np.cumprod(1 + signal_return, axis=1)
+    regime = signal_price > _moving_average(signal_price, ma_window)
+
+    invested = regime[:, warmup:-1] if position == 'over' else ~regime[:, warmup:-1]
+    direction_return = -trade_return if direction == 'short' else trade_return
+    strategy_return = np.where(invested, direction_return[:, warmup + 1:] * leverage, 0.0)
+
+    values = 100 * np.cumprod(1 + strategy_return, axis=1)
+    return values[:, -1], np.minimum(_max_drawdown(values), 0.0)
+
+
+def _buy_hold(returns, warmup, leverage=1):
+    values = 100 * np.cumprod(1 + returns[:, warmup + 1:, 0] * leverage, axis=1)
+    return values[:, -1], np.minimum(_max_drawdown(values), 0.0)
+
+
+STRATEGIES = {
+    'trading_strategy': _trading_strategy,
+    'leveraged_portfolio': _leveraged_portfolio,
+    'buy_hold': _buy_hold,
+}
+
+
+# ---------------------------------------------------------------------------
+# Streaming-Perzentile
+# ---------------------------------------------------------------------------
+
+def new_accumulator(low, high, bins=5000):
+    """Histogramm mit festen Klassen; Werte außerhalb landen in der Randklasse"""
+    return {
+        'edges': np.linspace(low, high, bins + 1),
+        'counts': np.zeros(bins, dtype=np.int64),
+        'count': 0,
+        'sum': 0.0,
+        'min': np.inf,
+        'max': -np.inf,
+    }
+
+
+def accumulate(accumulator, values):
+    values = values[np.isfinite(values)]
+    if not len(values):
+        return
+    edges = accumulator['edges']
+    accumulator['counts'] += np.histogram(np.clip(values, edges[0], edges[-1]), edges)[0]
+    accumulator['count'] += len(values)
+    accumulator['sum'] += values.sum()
+    accumulator['min'] = min(accumulator['min'], values.min())
+    accumulator['max'] = max(accumulator['max'], values.max())
+
+
+def percentile(accumulator, q):
+    """Perzentil (0-100) mit linearer Interpolation innerhalb der Klasse"""
+    cumulative = np.cumsum(accumulator['counts'])
+    target = q / 100 * accumulator['count']
+    b = min(np.searchsorted(cumulative, target), len(cumulative) - 1)
+    below = cumulative[b - 1] if b > 0 else 0
+    fraction = (target - below) / accumulator['counts'][b] if accumulator['counts'][b] else 0.0
+    edges = accumulator['edges']
+    value = edges[b] + fraction * (edges[b + 1] - edges[b])
+    return float(np.clip(value, accumulator['min'], accumulator['max']))
+
+
+# ---------------------------------------------------------------------------
+# Simulation
+# ---------------------------------------------------------------------------
+
+def simulate(strategy='trading_strategy', tickers=('^GSPC', 'GC=F'), n_paths=100_000, years=10,
+             block_length=20, chunk_size=2000, seed=0, percentiles=(5, 25, 50, 75, 95), **params):
+    """Verteilung von jährlicher Rendite und Max Drawdown über n_paths Bootstrap-Pfade.
+
+    tickers legt die gemeinsam gezogenen Assets fest (Reihenfolge wie von der
+    Strategie erwartet, z.B. Index und Gold oder Handels- und Signal-Asset).
+    params gehen an die Strategie (tax_rate, lev, which_lev, leverage, position, ...).
+    """
+    if strategy not in STRATEGIES:
+        raise ValueError(f"Unbekannte Strategie {strategy}. Wählen Sie aus: {', '.join(STRATEGIES)}")
+
+    returns = load_joint_returns(tickers).to_numpy()
+    warmup = 0 if strategy == 'buy_hold' else params.get('ma_window', 200)
+    horizon = int(years * TRADING_DAYS)
+    rng = np.random.default_rng(seed)
+
+    accumulators = {
+        'Jährliche Rendite': new_accumulator(-1.0, 5.0),
+        'Max Drawdown': new_accumulator(-1.0, 0.0),
+    }
+
+    for chunk_start in range(0, n_paths, chunk_size):
+        n_chunk = min(chunk_size, n_paths - chunk_start)
+        with profiling.stage('simulate', step='montecarlo.simulate', paths=n_chunk):
+            paths = bootstrap_returns(returns, n_chunk, warmup + horizon, block_length, rng)
+            final_value, max_drawdown = STRATEGIES[strategy](paths, warmup, **params)
+
+        with profiling.stage('metrics', step='montecarlo.simulate', paths=n_chunk):
+            with np.errstate(invalid='ignore'):
+                annual_return = (final_value / 100) ** (1 / years) - 1
+            accumulate(accumulators['Jährliche Rendite'], annual_return)
+            accumulate(accumulators['Max Drawdown'], max_drawdown)
+
+    rows = {'Mittelwert': {name: acc['sum'] / acc['count'] for name, acc in accumulators.items()}}
+    for q in percentiles:
+        rows[f'P{q}'] = {name: percentile(acc, q) for name, acc in accumulators.items()}
+    rows['Min'] = {name: acc['min'] for name, acc in accumulators.items()}
+    rows['Max'] = {name: acc['max'] for name, acc in accumulators.items()}
+    return pd.DataFrame(rows).T
@@ -1,181 +1,228 @@
-import yfinance as yf
 import pandas as pd
 import numpy as np
 from datetime import datetime
 
+import calendar_align
+import ma_cache
+import profiling
 
-def calculate_ma_correlation(ma_period=200):
-    # Dictionary für die Ticker-Symbole
-    ticker_map = {
-        "S&P 500": "^GSPC",
-        "DAX": "^GDAXI",
-        "NASDAQ 100": "^NDX",
-        "Gold": "GC=F",
-        "Bitcoin": "BTC-USD"
-    }
 
-    # DataFrame für die Regime-Daten erstellen
-    regimes = pd.DataFrame()
+# Dictionary für die Ticker-Symbole
+TICKER_MAP = {
+    "S&P 500": "^GSPC",
+    "DAX": "^GDAXI",
+    "NASDAQ 100": "^NDX",
+    "Gold": "GC=F",
+    "Bitcoin": "BTC-USD"
+}
 
-    # Für jedes Asset Moving Average und Regime berechnen
-    for name, ticker in ticker_map.items():
-        # Daten laden
-        data = yf.download(ticker, start="1900-01-01")
 
-        # Moving Average berechnen
-        data['MA'] = data['Close'].rolling(window=ma_period).mean()
+@profiling.traced('signal')
+def calculate_window_sensitivity(windows=range(10, 401, 10)):
+    """Anteil der Tage über dem MA je Asset und Fenster (eine Präfixsumme pro Asset)"""
+    windows = list(windows)
+    sensitivity = pd.DataFrame(index=pd.Index(windows, name='MA-Fenster'))
+    for name, ticker in TICKER_MAP.items():
+        signals = ma_cache.ticker_signal_matrix(ticker, windows)
+        sensitivity[name] = signals.to_numpy().mean(axis=1) * 100
+    return sensitivity
+
+
+# Kurznamen für die Beschriftung der Kombinationen
+SHORT_NAMES = {
+    "S&P 500": "S&P",
+    "Bitcoin": "BTC"
+}
+
+# Anzahl gesetzter Bits je Byte
+_POPCOUNT = np.array([bin(value).count('1') for value in range(256)], dtype=np.int64)
 
-        # Regime bestimmen (True wenn über MA)
-        data['Regime'] = data['Close'] > data['MA']
 
-        # Zum Regime DataFrame hinzufügen
-        regimes[name] = data['Regime']
+@profiling.traced('signal')
+def regime_bitsets(ma_period=200, ticker_map=TICKER_MAP):
+    """Regime aller Assets als gepackte Bitsets auf dem Kalender des ersten Assets.
 
-    # Leere Matrix für die Ergebnisse erstellen
+    'above' enthält ein Bit pro Tag (Kurs über MA), 'valid' markiert die Tage,
+    an denen das Asset gehandelt wurde. Beide sind (Assets x Bytes) uint8.
+    """
     assets = list(ticker_map.keys())
-    n_assets = len(assets)
-    correlation_matrix = pd.DataFrame(np.zeros((n_assets, n_assets)),
-                                      columns=assets,
-                                      index=assets)
+    tickers = list(ticker_map.values())
+    above_rows = []
+    valid_rows = []
+
+    # Tage aller Assets auf den Kalender des ersten Assets abbilden
+    joined = calendar_align.join(calendar_align.ticker_calendar(tickers), 'native', base=tickers[0])
+    master = pd.DatetimeIndex(joined['dates'], name='Date')
+
+    for name, ticker in ticker_map.items():
+        entry = ma_cache.ticker_prefix(ticker)
+        ma = ma_cache.moving_average(entry['prefix'], ma_period)
+
+        # Regime bestimmen (True wenn über MA)
+        with np.errstate(invalid='ignore'):
+            above = entry['values'] > ma
+
+        rows = joined['rows'][ticker]
+        valid = rows >= 0
+
+        above_rows.append(np.packbits(valid & above[np.maximum(rows, 0)]))
+        valid_rows.append(np.packbits(valid))
+
+    return {
+        'assets': assets,
+        'index': master,
+        'above': np.vstack(above_rows),
+        'valid': np.vstack(valid_rows),
+    }
+
+
+@profiling.traced('metrics')
+def agreement_matrix(bitsets, chunk_bytes=8192):
+    """Anteil gemeinsamer Tage im gleichen Regime für alle Asset-Paare.
+
+    Die Bitsets werden blockweise entpackt; gemeinsame Tage und Übereinstimmungen
+    ergeben sich als Matrixprodukte (über MA mit über MA, unter MA mit unter MA).
+    """
+    n_assets = len(bitsets['assets'])
+    common_days = np.zeros((n_assets, n_assets))
+    same_days = np.zeros((n_assets, n_assets))
+
+    for start in range(0, bitsets['valid'].shape[1], chunk_bytes):
+        block = slice(start, start + chunk_bytes)
+        valid = np.unpackbits(bitsets['valid'][:, block], axis=1).astype(np.float32)
+        above = np.unpackbits(bitsets['above'][:, block], axis=1).astype(np.float32)
+        below = valid - above
+
+        common_days += valid @ valid.T
+        same_days += above @ above.T + below @ below.T
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        agreement = same_days / common_days
+    np.fill_diagonal(agreement, 1.0)
+    return agreement
+
+
+def combination_counts(bitsets, subset):
+    """Tage je Regime-Kombination einer Asset-Auswahl (nur Tage, an denen alle gehandelt wurden).
+
+    Code einer Kombination: erstes Asset = höchstes Bit, Bit gesetzt = über MA.
+    Gibt (Anzahl je Code, Maske der gemeinsamen Tage) zurück.
+    """
+    rows = [bitsets['assets'].index(asset) for asset in subset]
+    n_days = len(bitsets['index'])
+
+    common = np.unpackbits(np.bitwise_and.reduce(bitsets['valid'][rows], axis=0), count=n_days).astype(bool)
+    codes = np.zeros(n_days, dtype=np.int64)
+    for row in rows:
+        codes = 2 * codes + np.unpackbits(bitsets['above'][row], count=n_days)
+
+    return np.bincount(codes[common], minlength=2 ** len(rows)), common
+
+
+def calculate_ma_correlation(ma_period=200, ticker_map=TICKER_MAP, combination_assets=("S&P 500", "Gold", "Bitcoin")):
+    bitsets = regime_bitsets(ma_period, ticker_map)
+    assets = bitsets['assets']
+    index = bitsets['index']
 
     # Matrix füllen
-    for i in range(n_assets):
-        for j in range(n_assets):
-            # Gemeinsame Zeiträume finden
-            mask = regimes[assets[i]].notna() & regimes[assets[j]].notna()
-
-            if i == j:
-                correlation_matrix.iloc[i, j] = 1.0
-            else:
-                # Berechne den Anteil der Zeit, wo beide Assets im gleichen Regime sind
-                same_regime = (regimes[assets[i]][mask] == regimes[assets[j]][mask])
-                correlation = same_regime.mean()
-                correlation_matrix.iloc[i, j] = round(correlation, 3)
+    correlation_matrix = pd.DataFrame(np.round(agreement_matrix(bitsets), 3),
+                                      columns=assets,
+                                      index=assets)
 
     # Zusätzliche Informationen berechnen
     info = {}
-    for asset in assets:
-        mask = regimes[asset].notna()
-        if mask.any():
-            total_days = mask.sum()
-            days_above = regimes[asset][mask].sum()
+    for row, asset in enumerate(assets):
+        total_days = int(_POPCOUNT[bitsets['valid'][row]].sum())
+        if total_days:
+            days_above = int(_POPCOUNT[bitsets['above'][row]].sum())
             days_below = total_days - days_above
+            mask = np.unpackbits(bitsets['valid'][row], count=len(index)).astype(bool)
 
             info[asset] = {
-                'Zeitraum': f"{regimes[asset][mask].index[0].strftime('%Y-%m-%d')} bis {regimes[asset][mask].index[-1].strftime('%Y-%m-%d')}",
+                'Zeitraum': f"{index[mask][0].strftime('%Y-%m-%d')} bis {index[mask][-1].strftime('%Y-%m-%d')}",
                 'Tage über MA': f"{(days_above / total_days * 100):.1f}%",
                 'Tage unter MA': f"{(days_below / total_days * 100):.1f}%",
                 'Gesamte Tage': total_days
             }
 
-    # Gemeinsame Zeiträume für alle drei Assets finden
-    common_mask = (regimes['S&P 500'].notna() &
-                   regimes['Gold'].notna() &
-                   regimes['Bitcoin'].notna())
-
-    if common_mask.any():
-        total_common_days = common_mask.sum()
-
-        # Analyse für gleiche Regime (über oder unter)
-        all_same = ((regimes['S&P 500'][common_mask] == regimes['Gold'][common_mask]) &
-                    (regimes['Gold'][common_mask] == regimes['Bitcoin'][common_mask]))
-        all_same_pct = round(all_same.mean() * 100, 1)
-
-        gold_btc_same = ((regimes['Gold'][common_mask] == regimes['Bitcoin'][common_mask]) &
-                         (regimes['Gold'][common_mask] != regimes['S&P 500'][common_mask]))
-        gold_btc_same_pct = round(gold_btc_same.mean() * 100, 1)
-
-        sp_gold_same = ((regimes['S&P 500'][common_mask] == regimes['Gold'][common_mask]) &
-                        (regimes['Gold'][common_mask] != regimes['Bitcoin'][common_mask]))
-        sp_gold_same_pct = round(sp_gold_same.mean() * 100, 1)
-
-        sp_btc_same = ((regimes['S&P 500'][common_mask] == regimes['Bitcoin'][common_mask]) &
-                       (regimes['Bitcoin'][common_mask] != regimes['Gold'][common_mask]))
-        sp_btc_same_pct = round(sp_btc_same.mean() * 100, 1)
-
-        # Analyse speziell für "Unter MA" Szenarien
-        all_under = ((~regimes['S&P 500'][common_mask]) &
-                     (~regimes['Gold'][common_mask]) &
-                     (~regimes['Bitcoin'][common_mask]))
-        all_under_pct = round(all_under.mean() * 100, 1)
-
-        gold_btc_under = ((~regimes['Gold'][common_mask]) &
-                          (~regimes['Bitcoin'][common_mask]) &
-                          (regimes['S&P 500'][common_mask]))
-        gold_btc_under_pct = round(gold_btc_under.mean() * 100, 1)
-
-        sp_gold_under = ((~regimes['S&P 500'][common_mask]) &
-                         (~regimes['Gold'][common_mask]) &
-                         (regimes['Bitcoin'][common_mask]))
-        sp_gold_under_pct = round(sp_gold_under.mean() * 100, 1)
-
-        sp_btc_under = ((~regimes['S&P 500'][common_mask]) &
-                        (~regimes['Bitcoin'][common_mask]) &
-                        (regimes['Gold'][common_mask]))
-        sp_btc_under_pct = round(sp_btc_under.mean() * 100, 1)
-
-        # Bedingte Wahrscheinlichkeiten berechnen
-        # Gesamtanzahl Tage, an denen S&P 500 unter MA ist
-        sp_under_days = (~regimes['S&P 500'][common_mask]).sum()
-
-        if sp_under_days > 0:
-            # Tage zählen, an denen S&P 500 UND Gold unter MA sind
-            sp_and_gold_under = ((~regimes['S&P 500'][common_mask]) &
-                                 (~regimes['Gold'][common_mask])).sum()
-
-            # Tage zählen, an denen S&P 500 UND Bitcoin unter MA sind
-            sp_and_btc_under = ((~regimes['S&P 500'][common_mask]) &
-                                (~regimes['Bitcoin'][common_mask])).sum()
-
-            # Tage zählen, an denen ALLE drei unter MA sind
-            all_three_under = ((~regimes['S&P 500'][common_mask]) &
-                               (~regimes['Gold'][common_mask]) &
-                               (~regimes['Bitcoin'][common_mask])).sum()
-
-            # Bedingte Wahrscheinlichkeiten berechnen
-            gold_under_prob = sp_and_gold_under / sp_under_days
-            btc_under_prob = sp_and_btc_under / sp_under_days
-            both_under_prob = all_three_under / sp_under_days
-
-            conditional_probabilities = {
-                'Gegeben S&P 500 unter MA': {
-                    'Gold auch unter MA': f"{round(gold_under_prob * 100, 1)}%",
-                    'Bitcoin auch unter MA': f"{round(btc_under_prob * 100, 1)}%",
-                    'Beide auch unter MA': f"{round(both_under_prob * 100, 1)}%",
-                    'Anzahl Tage S&P unter MA': sp_under_days,
-                    'Anteil Tage S&P unter MA': f"{round(sp_under_days / len(common_mask) * 100, 1)}%"
-                }
-            }
-        else:
-            conditional_probabilities = {
-                'Fehler': 'Keine Tage gefunden, an denen S&P 500 unter MA war'
-            }
+    special_combinations = calculate_combination_statistics(bitsets, combination_assets)
 
-        special_combinations = {
-            'Gleiche Regime (über oder unter)': {
-                'Alle drei gleich': f"{all_same_pct}%",
-                'Gold & BTC gleich, S&P anders': f"{gold_btc_same_pct}%",
-                'S&P & Gold gleich, BTC anders': f"{sp_gold_same_pct}%",
-                'S&P & BTC gleich, Gold anders': f"{sp_btc_same_pct}%"
-            },
-            'Unter MA Szenarien': {
-                'Alle drei unter MA': f"{all_under_pct}%",
-                'Nur Gold & BTC unter MA': f"{gold_btc_under_pct}%",
-                'Nur S&P & Gold unter MA': f"{sp_gold_under_pct}%",
-                'Nur S&P & BTC unter MA': f"{sp_btc_under_pct}%"
-            },
-            'Bedingte Wahrscheinlichkeiten': conditional_probabilities,
-            'Zeitraum': {
-                'Gemeinsamer Zeitraum': f"{regimes[common_mask].index[0].strftime('%Y-%m-%d')} bis {regimes[common_mask].index[-1].strftime('%Y-%m-%d')}",
-                'Anzahl gemeinsamer Tage': total_common_days
+    return correlation_matrix, info, special_combinations
+
+
+@profiling.traced('metrics')
+def calculate_combination_statistics(bitsets, combination_assets=("S&P 500", "Gold", "Bitcoin")):
+    """Gleiche/unterschiedliche Regime und bedingte Wahrscheinlichkeiten für drei Assets"""
+    first, second, third = combination_assets
+    short = {asset: SHORT_NAMES.get(asset, asset) for asset in combination_assets}
+
+    # Codes: first*4 + second*2 + third (1 = über MA)
+    counts, common_mask = combination_counts(bitsets, combination_assets)
+    total_common_days = int(common_mask.sum())
+
+    if not total_common_days:
+        return {
+            'Fehler': 'Keine gemeinsamen Daten für alle drei Assets gefunden'
+        }
+
+    def share(*codes):
+        return round(counts[list(codes)].sum() / total_common_days * 100, 1)
+
+    # Analyse für gleiche Regime (über oder unter)
+    all_same_pct = share(0, 7)
+    second_third_same_pct = share(3, 4)
+    first_second_same_pct = share(1, 6)
+    first_third_same_pct = share(2, 5)
+
+    # Analyse speziell für "Unter MA" Szenarien
+    all_under_pct = share(0)
+    second_third_under_pct = share(4)
+    first_second_under_pct = share(1)
+    first_third_under_pct = share(2)
+
+    # Bedingte Wahrscheinlichkeiten berechnen
+    # Gesamtanzahl Tage, an denen das erste Asset unter MA ist
+    first_under_days = int(counts[:4].sum())
+
+    if first_under_days > 0:
+        second_under_prob = counts[[0, 1]].sum() / first_under_days
+        third_under_prob = counts[[0, 2]].sum() / first_under_days
+        both_under_prob = counts[0] / first_under_days
+
+        conditional_probabilities = {
+            f'Gegeben {first} unter MA': {
+                f'{second} auch unter MA': f"{round(second_under_prob * 100, 1)}%",
+                f'{third} auch unter MA': f"{round(third_under_prob * 100, 1)}%",
+                'Beide auch unter MA': f"{round(both_under_prob * 100, 1)}%",
+                f'Anzahl Tage {short[first]} unter MA': first_under_days,
+                f'Anteil Tage {short[first]} unter MA': f"{round(first_under_days / len(common_mask) * 100, 1)}%"
             }
         }
     else:
-        special_combinations = {
-            'Fehler': 'Keine gemeinsamen Daten für alle drei Assets gefunden'
+        conditional_probabilities = {
+            'Fehler': f'Keine Tage gefunden, an denen {first} unter MA war'
         }
 
-    return correlation_matrix, info, special_combinations
+    common_dates = bitsets['index'][common_mask]
+    return {
+        'Gleiche Regime (über oder unter)': {
+            'Alle drei gleich': f"{all_same_pct}%",
+            f'{short[second]} & {short[third]} gleich, {short[first]} anders': f"{second_third_same_pct}%",
+            f'{short[first]} & {short[second]} gleich, {short[third]} anders': f"{first_second_same_pct}%",
+            f'{short[first]} & {short[third]} gleich, {short[second]} anders': f"{first_third_same_pct}%"
+        },
+        'Unter MA Szenarien': {
+            'Alle drei unter MA': f"{all_under_pct}%",
+            f'Nur {short[second]} & {short[third]} unter MA': f"{second_third_under_pct}%",
+            f'Nur {short[first]} & {short[second]} unter MA': f"{first_second_under_pct}%",
+            f'Nur {short[first]} & {short[third]} unter MA': f"{first_third_under_pct}%"
+        },
+        'Bedingte Wahrscheinlichkeiten': conditional_probabilities,
+        'Zeitraum': {
+            'Gemeinsamer Zeitraum': f"{common_dates[0].strftime('%Y-%m-%d')} bis {common_dates[-1].strftime('%Y-%m-%d')}",
+            'Anzahl gemeinsamer Tage': total_common_days
+        }
+    }
 
 
 def print_results(ma_period=200):
@@ -0,0 +1,204 @@
+"""Lokaler Kursspeicher: eine memory-mappbare .npy-Datei pro Ticker.
+
+Beim ersten Zugriff wird die komplette Historie geladen, danach werden nur
+noch die fehlenden Tage am Ende nachgeladen (höchstens einmal pro Tag).
+
+Umgebungsvariablen:
+    LEVTAX_CACHE_DIR  Verzeichnis für die Kursdateien (Standard: ./price_cache)
+    LEVTAX_OFFLINE    "1" = niemals herunterladen, nur lokale Daten verwenden
+
+Heruntergeladen wird über providers (Standard yfinance, siehe LEVTAX_PROVIDER);
+update_many lädt mehrere Ticker gleichzeitig. pandas und yfinance werden erst
+bei Bedarf importiert; get_array liest den Speicher nur mit numpy (schneller
+Start für die Kommandozeile).
+"""
+import os
+import re
+from datetime import date
+
+import numpy as np
+
+import profiling
+
+HISTORY_START = '1900-01-01'
+FIELDS = ['Open', 'High', 'Low', 'Close', 'Adj Close', 'Volume']
+PRICE_DTYPE = np.dtype([('Date', 'M8[ns]')] + [(field, 'f8') for field in FIELDS])
+
+# Bereits gemappte Dateien: Pfad -> (mtime_ns, Array)
+_loaded = {}
+
+
+def cache_dir():
+    return os.environ.get('LEVTAX_CACHE_DIR',
+                          os.path.join(os.path.dirname(os.path.abspath(__file__)), 'price_cache'))
+
+
+def is_offline(offline=None):
+    if offline is not None:
+        return offline
+    return os.environ.get('LEVTAX_OFFLINE', '').lower() in ('1', 'true', 'yes')
+
+
+def ticker_path(ticker):
+    """Dateipfad für einen Ticker ('^GSPC' -> '_GSPC.npy', 'GC=F' -> 'GC_F.npy')"""
+    return os.path.join(cache_dir(), re.sub(r'[^A-Za-z0-9.\-]', '_', ticker) + '.npy')
+
+
+def load_array(ticker):
+    """Gespeicherte Kurse als memory-mapped Structured Array (oder None)"""
+    path = ticker_path(ticker)
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        _loaded.pop(path, None)
+        return None
+
+    cached = _loaded.get(path)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+
+    array = np.load(path, mmap_mode='r')
+    _loaded[path] = (mtime, array)
+    return array
+
+
+def save_array(ticker, array):
+    """Schreibt die Kurse atomar (erst temporäre Datei, dann umbenennen)"""
+    path = ticker_path(ticker)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + '.tmp.npy'
+    np.save(tmp_path, np.ascontiguousarray(array, dtype=PRICE_DTYPE))
+    _loaded.pop(path, None)
+    os.replace(tmp_path, path)
+
+
+def frame_to_array(data):
+    """Wandelt einen yfinance-DataFrame in das Speicherformat um"""
+    import pandas as pd
+
+    if isinstance(data.columns, pd.MultiIndex):
+        data = data.droplevel(list(range(1, data.columns.nlevels)), axis=1)
+    data = data.dropna(how='all')
+
+    array = np.empty(len(data), dtype=PRICE_DTYPE)
+    array['Date'] = pd.DatetimeIndex(data.index).tz_localize(None).values.astype('M8[ns]')
+    for field in FIELDS:
+        if field in data.columns:
+            array[field] = data[field].to_numpy(dtype='f8')
+        elif field == 'Adj Close' and 'Close' in data.columns:
+            array[field] = data['Close'].to_numpy(dtype='f8')
+        else:
+            array[field] = np.nan
+    return array
+
+
+def _download(ticker, start):
+    import providers
+
+    result = providers.download({ticker: start})[ticker]
+    if isinstance(result, BaseException):
+        raise result
+    return result
+
+
+def _checked_today(path):
+    return date.fromtimestamp(os.path.getmtime(path)) >= date.today()
+
+
+def _pending_start(ticker, stored):
+    """Ab welchem Tag nachgeladen werden muss (None = heute schon geprüft)"""
+    if stored is None or len(stored) == 0:
+        return HISTORY_START
+    if _checked_today(ticker_path(ticker)):
+        return None
+    return np.datetime_as_string(stored['Date'][-1], unit='D')
+
+
+def _store(ticker, stored, fetched):
+    """Hängt neu geladene Kurse an den Speicher an"""
+    if stored is None or len(stored) == 0:
+        if len(fetched) == 0:
+            raise ValueError(f"Keine Kursdaten für {ticker} gefunden")
+        save_array(ticker, fetched)
+        return load_array(ticker)
+
+    if len(fetched) == 0:
+        # Nichts Neues, trotzdem als "heute geprüft" markieren
+        os.utime(ticker_path(ticker))
+        return load_array(ticker)
+
+    keep = stored[stored['Date'] < fetched['Date'][0]]
+    save_array(ticker, np.concatenate([keep, fetched]))
+    return load_array(ticker)
+
+
+def update(ticker, offline=None):
+    """Bringt den Speicher für einen Ticker auf den neuesten Stand.
+
+    Geladen wird nur ab dem letzten gespeicherten Tag (dieser wird ersetzt,
+    da er beim letzten Abruf noch unvollständig gewesen sein kann).
+    """
+    stored = load_array(ticker)
+
+    if is_offline(offline):
+        if stored is None:
+            raise FileNotFoundError(f"Keine lokalen Kursdaten für {ticker} in {cache_dir()} (Offline-Modus)")
+        return stored
+
+    start = _pending_start(ticker, stored)
+    if start is None:
+        return stored
+    return _store(ticker, stored, _download(ticker, start))
+
+
+def update_many(tickers, offline=None):
+    """Wie update für mehrere Ticker; fehlende Tage aller Ticker werden gleichzeitig geladen"""
+    tickers = list(dict.fromkeys(tickers))
+    if is_offline(offline):
+        return {ticker: update(ticker, offline) for ticker in tickers}
+
+    stored = {ticker: load_array(ticker) for ticker in tickers}
+    arrays, pending = {}, {}
+    for ticker in tickers:
+        start = _pending_start(ticker, stored[ticker])
+        if start is None:
+            arrays[ticker] = stored[ticker]
+        else:
+            pending[ticker] = start
+
+    if pending:
+        import providers
+
+        errors = []
+        for ticker, fetched in providers.download(pending).items():
+            if isinstance(fetched, BaseException):
+                errors.append(fetched)
+            else:
+                arrays[ticker] = _store(ticker, stored[ticker], fetched)
+        if errors:
+            raise errors[0]
+    return {ticker: arrays[ticker] for ticker in tickers}
+
+
+def get_array(ticker, start=None, end=None, offline=None):
+    """Kurse eines Tickers als Structured Array (end exklusiv), ohne pandas"""
+    with profiling.stage('fetch', step='price_store.get_array', ticker=ticker):
+        array = update(ticker, offline=offline)
+
+        dates = array['Date']
+        lo = 0 if start is None else np.searchsorted(dates, np.datetime64(start, 'ns'), side='left')
+        hi = len(array) if end is None else np.searchsorted(dates, np.datetime64(end, 'ns'), side='left')
+        return array[lo:hi]
+
+
+def get_prices(ticker, start=None, end=None, offline=None):
+    """Kurse eines Tickers als DataFrame (wie yf.download, end exklusiv)"""
+    import pandas as pd
+
+    window = get_array(ticker,
+                       None if start is None else pd.Timestamp(start).to_datetime64(),
+                       None if end is None else pd.Timestamp(end).to_datetime64(),
+                       offline)
+
+    index = pd.DatetimeIndex(np.asarray(window['Date']), name='Date')
+    return pd.DataFrame({field: np.asarray(window[field]) for field in FIELDS}, index=index)
@@ -0,0 +1,192 @@
+"""Zeit- und Speichermessung der Pipeline-Stufen als JSON-Trace.
+
+Die Module markieren ihre Stufen mit
+
+    with profiling.stage('align', step='calculator.build_strategy_frame'):
+        ...
+
+oder dem Dekorator @profiling.traced('metrics'). Stufen: fetch (Kurse
+laden), align (Daten zusammenführen), signal (MA/Regime), simulate
+(Portfolio-Verlauf), metrics (Kennzahlen). Ausgeschaltet ist stage() ein
+Flag-Test und gibt einen wiederverwendeten leeren Kontext zurück.
+
+Einschalten:
+    LEVTAX_PROFILE=1 | -          JSON-Zeilen auf stderr
+    LEVTAX_PROFILE=trace.jsonl    JSON-Zeilen an die Datei anhängen
+    LEVTAX_PROFILE_MEMORY=1       zusätzlich Spitzen-Speicher je Stufe (tracemalloc, langsamer)
+oder im Code mit enable(target, memory) / disable().
+
+Jede Zeile enthält run, pid, stage, step, path (verschachtelte Stufen),
+start, seconds (inklusive), self_seconds (ohne Unterstufen) und bei
+Speichermessung peak_mb (Zuwachs über den Stand beim Eintritt).
+summarize() fasst Traces mehrerer Läufe zusammen.
+"""
+import contextlib
+import functools
+import json
+import os
+import sys
+import time
+import tracemalloc
+import uuid
+
+STAGES = ('fetch', 'align', 'signal', 'simulate', 'metrics')
+
+_state = {
+    'enabled': False,
+    'target': None,
+    'memory': False,
+    'run': None,
+    'stack': [],
+}
+
+_NULL = contextlib.nullcontext()
+
+
+def enable(target='-', memory=False, run=None):
+    """Schaltet die Messung ein; target ist '-' (stderr), ein Dateipfad oder eine Liste"""
+    _state.update(enabled=True, target=target, memory=memory, run=run or uuid.uuid4().hex[:12], stack=[])
+    if memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+
+def disable():
+    if _state['memory'] and tracemalloc.is_tracing():
+        tracemalloc.stop()
+    _state.update(enabled=False, target=None, memory=False, stack=[])
+
+
+def is_enabled():
+    return _state['enabled']
+
+
+@contextlib.contextmanager
+def enabled(target='-', memory=False, run=None):
+    """Messung nur innerhalb des with-Blocks; danach gilt wieder der vorherige Zustand"""
+    previous = dict(_state, stack=list(_state['stack']))
+    enable(target, memory, run)
+    try:
+        yield
+    finally:
+        disable()
+        _state.update(previous)
+        if previous['memory'] and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+
+def _emit(record):
+    target = _state['target']
+    if isinstance(target, list):
+        target.append(record)
+        return
+    line = json.dumps(record, default=str)
+    if target in (None, '-', '1'):
+        print(line, file=sys.stderr)
+    else:
+        with open(target, 'a', encoding='utf-8') as file:
+            file.write(line + '\n')
+
+
+@contextlib.contextmanager
+def _measure(name, step, fields):
+    stack = _state['stack']
+    entry = {'child_seconds': 0.0, 'child_peak': 0}
+    if _state['memory']:
+        current, outer_peak = tracemalloc.get_traced_memory()
+        entry['base'] = current
+        if stack:
+            stack[-1]['child_peak'] = max(stack[-1]['child_peak'], outer_peak)
+        tracemalloc.reset_peak()
+
+    path = '/'.join([parent['name'] for parent in stack] + [name])
+    entry['name'] = name
+    stack.append(entry)
+    start_wall = time.time()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        stack.pop()
+        record = {
+            'run': _state['run'],
+            'pid': os.getpid(),
+            'stage': name,
+            'step': step,
+            'path': path,
+            'start': start_wall,
+            'seconds': seconds,
+            'self_seconds': seconds - entry['child_seconds'],
+        }
+        if stack:
+            stack[-1]['child_seconds'] += seconds
+
+        if _state['memory']:
+            peak = max(tracemalloc.get_traced_memory()[1], entry['child_peak'])
+            record['peak_mb'] = (peak - entry['base']) / 2 ** 20
+            if stack:
+                stack[-1]['child_peak'] = max(stack[-1]['child_peak'], peak)
+
+        record.update(fields)
+        _emit(record)
+
+
+def stage(name, step=None, **fields):
+    """Kontext für eine Stufe; zusätzliche Felder landen im Trace (z.B. ticker)"""
+    if not _state['enabled']:
+        return _NULL
+    return _measure(name, step, fields)
+
+
+def traced(name, step=None):
+    """Dekorator: der ganze Funktionsaufruf ist eine Stufe"""
+    def decorator(function):
+        label = step or f'{function.__module__}.{function.__qualname__}'
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not _state['enabled']:
+                return function(*args, **kwargs)
+            with _measure(name, label, {}):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def load_traces(*paths):
+    """Liest JSON-Zeilen aus einer oder mehreren Trace-Dateien"""
+    records = []
+    for path in paths:
+        with open(path, encoding='utf-8') as file:
+            records.extend(json.loads(line) for line in file if line.strip())
+    return records
+
+
+def summarize(records, by=('stage',)):
+    """Summen und Verteilung je Gruppe über alle Läufe (Sekunden; peak_mb als Maximum)"""
+    import pandas as pd
+
+    frame = pd.DataFrame(records)
+    aggregations = {
+        'Aufrufe': ('seconds', 'size'),
+        'Läufe': ('run', 'nunique'),
+        'Sekunden': ('seconds', 'sum'),
+        'Eigene Sekunden': ('self_seconds', 'sum'),
+        'Mittel': ('seconds', 'mean'),
+        'Maximum': ('seconds', 'max'),
+    }
+    if 'peak_mb' in frame:
+        aggregations['Spitze MB'] = ('peak_mb', 'max')
+    summary = frame.groupby(list(by)).agg(**aggregations)
+    return summary.sort_values('Eigene Sekunden', ascending=False)
+
+
+def _configure_from_environment():
+    target = os.environ.get('LEVTAX_PROFILE', '')
+    if target and target.lower() not in ('0', 'false', 'no'):
+        memory = os.environ.get('LEVTAX_PROFILE_MEMORY', '').lower() in ('1', 'true', 'yes')
+        enable('-' if target.lower() in ('1', 'true', 'yes') else target, memory,
+               os.environ.get('LEVTAX_PROFILE_RUN'))
+
+
+_configure_from_environment()
@@ -0,0 +1,367 @@
+"""Kursquellen für den price_store, asynchron und austauschbar.
+
+Ein Provider ist ein Dictionary mit
+
+    'name'   Bezeichnung
+    'fetch'  async fetch(ticker, start) -> Structured Array im price_store-Format
+    'close'  async close(), gibt Verbindungen frei
+
+Semaphoren und offene Verbindungen sind an ihren Event-Loop gebunden; ein
+Provider hält sie daher je Loop (_per_loop), und download() schließt am
+Ende seines asyncio.run die Verbindungen des Providers. So lässt sich ein
+Provider für beliebig viele download()-Aufrufe verwenden.
+
+fetch_all() lädt alle Ticker eines Laufs gleichzeitig: gleiche Ticker werden
+zu einer Anfrage zusammengefasst (frühester Start gewinnt, auch über
+gleichzeitige Aufrufe hinweg), fehlgeschlagene Anfragen werden mit
+exponentiellem Backoff wiederholt. download() ist der synchrone Einstieg für
+price_store.
+
+Provider (Auswahl über LEVTAX_PROVIDER):
+    yfinance              Standard; yfinance je Ticker in einem Thread
+    file:<Verzeichnis>    Kursdateien eines anderen price_store-Verzeichnisses
+    http://host:port      lokaler Stand-in-Server (serve()), Verbindungen
+                          werden per HTTP/1.1 Keep-Alive wiederverwendet
+
+Stand-in-Server und Benchmark ohne Netzwerk:
+    python providers.py serve --dir price_cache --port 8765
+    python providers.py bench --dir price_cache --latency 0.2
+"""
+import argparse
+import asyncio
+import io
+import os
+import random
+import sys
+import threading
+import time
+import weakref
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, quote, unquote, urlsplit
+
+import numpy as np
+
+import price_store
+
+DEFAULT_PROVIDER = 'yfinance'
+CONCURRENCY = 8
+RETRIES = 3
+BACKOFF = 0.5
+TIMEOUT = 60.0
+
+# Netzwerkfehler werden wiederholt, fehlende Daten nicht
+RETRY_ERRORS = (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError)
+FINAL_ERRORS = (FileNotFoundError, PermissionError)
+
+
+# ---------------------------------------------------------------------------
+# Provider
+# ---------------------------------------------------------------------------
+
+def _window(array, start):
+    return array[array['Date'] >= np.datetime64(start, 'ns')]
+
+
+def _per_loop(create):
+    """Zustand je laufendem Event-Loop, beim ersten Zugriff im Loop mit create() angelegt"""
+    states = weakref.WeakKeyDictionary()
+
+    def current():
+        loop = asyncio.get_running_loop()
+        if loop not in states:
+            states[loop] = create()
+        return states[loop]
+    return current
+
+
+def yfinance_provider(concurrency=CONCURRENCY):
+    """yfinance, je Ticker ein Thread (Ticker.history ist im Gegensatz zu yf.download threadsicher)"""
+    limit = _per_loop(lambda: asyncio.Semaphore(concurrency))
+
+    def download(ticker, start):
+        import yfinance as yf
+
+        data = yf.Ticker(ticker).history(start=start, auto_adjust=False, actions=False, raise_errors=True)
+        return price_store.frame_to_array(data)
+
+    async def fetch(ticker, start):
+        async with limit():
+            return await asyncio.to_thread(download, ticker, start)
+
+    async def close():
+        pass
+
+    return {'name': 'yfinance', 'fetch': fetch, 'close': close}
+
+
+def file_provider(directory, latency=0.0):
+    """Kursdateien aus einem Verzeichnis im price_store-Format (optional mit künstlicher Latenz)"""
+
+    def read(ticker):
+        path = os.path.join(directory, os.path.basename(price_store.ticker_path(ticker)))
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"Keine Kursdatei für {ticker} in {directory}")
+        return np.load(path)
+
+    async def fetch(ticker, start):
+        if latency:
+            await asyncio.sleep(latency)
+        return _window(await asyncio.to_thread(read, ticker), start)
+
+    async def close():
+        pass
+
+    return {'name': f'file:{directory}', 'fetch': fetch, 'close': close}
+
+
+def http_provider(url, concurrency=CONCURRENCY, timeout=TIMEOUT):
+    """Client für den Stand-in-Server: höchstens concurrency offene Keep-Alive-Verbindungen"""
+    parts = urlsplit(url)
+    host, port = parts.hostname, parts.port or 80
+    prefix = parts.path.rstrip('/')
+    state = _per_loop(lambda: {'limit': asyncio.Semaphore(concurrency), 'idle': []})
+
+    async def request(path):
+        idle = state()['idle']
+        if idle:
+            reader, writer = idle.pop()
+        else:
+            reader, writer = await asyncio.open_connection(host, port)
+        try:
+            writer.write(f"GET {prefix}{path} HTTP/1.1\r\nHost: {host}:{port}\r\n\r\n".encode('ascii'))
+            await writer.drain()
+
+            status_line = await reader.readline()
+            if not status_line:
+                raise ConnectionResetError("Verbindung vom Server geschlossen")
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b'\r\n', b'\n', b''):
+                    break
+                key, _, value = line.decode('latin-1').partition(':')
+                headers[key.strip().lower()] = value.strip()
+            body = await reader.readexactly(int(headers.get('content-length', 0)))
+        except BaseException:
+            writer.close()
+            raise
+
+        if headers.get('connection', '').lower() == 'close':
+            writer.close()
+        else:
+            idle.append((reader, writer))
+        return int(status_line.split()[1]), body
+
+    async def fetch(ticker, start):
+        async with state()['limit']:
+            status, body = await asyncio.wait_for(request(f"/prices/{quote(ticker, safe='')}?start={start}"),
+                                                  timeout)
+        message = f"{ticker}: HTTP {status} {body.decode('utf-8', 'replace')}"
+        if status == 429 or status >= 500:
+            raise ConnectionError(message)
+        if status == 404:
+            raise FileNotFoundError(message)
+        if status != 200:
+            raise ValueError(message)
+        return np.load(io.BytesIO(body))
+
+    async def close():
+        idle = state()['idle']
+        while idle:
+            _, writer = idle.pop()
+            writer.close()
+
+    return {'name': url, 'fetch': fetch, 'close': close}
+
+
+def get_provider(spec=None):
+    """Provider aus einer Angabe wie in LEVTAX_PROVIDER (Standard: yfinance)"""
+    spec = spec or os.environ.get('LEVTAX_PROVIDER') or DEFAULT_PROVIDER
+    if spec == 'yfinance':
+        return yfinance_provider()
+    if spec.startswith('file:'):
+        return file_provider(spec[len('file:'):])
+    if spec.startswith('http://'):
+        return http_provider(spec)
+    raise ValueError(f"Unbekannter Provider {spec}. Wählen Sie aus: yfinance, file:<Verzeichnis>, http://host:port")
+
+
+# ---------------------------------------------------------------------------
+# Gleichzeitiges Laden
+# ---------------------------------------------------------------------------
+
+# Laufende Anfragen je (Provider, Ticker): (Start, Task)
+_inflight = {}
+
+
+async def _fetch_with_retry(provider, ticker, start, retries, backoff):
+    for attempt in range(retries + 1):
+        try:
+            return await provider['fetch'](ticker, start)
+        except FINAL_ERRORS:
+            raise
+        except RETRY_ERRORS:
+            if attempt == retries:
+                raise
+        # Exponentieller Backoff mit Jitter
+        await asyncio.sleep(backoff * 2 ** attempt * (0.5 + random.random()))
+
+
+async def _shared_fetch(provider, ticker, start, retries, backoff):
+    """Hängt sich an eine laufende Anfrage für den Ticker, wenn sie früh genug beginnt"""
+    key = (provider['name'], ticker)
+    running = _inflight.get(key)
+    if running is None or running[0] > start:
+        task = asyncio.ensure_future(_fetch_with_retry(provider, ticker, start, retries, backoff))
+        running = _inflight[key] = (start, task)
+
+        def finished(_, running=running):
+            if _inflight.get(key) is running:
+                del _inflight[key]
+        task.add_done_callback(finished)
+    return _window(await asyncio.shield(running[1]), start)
+
+
+async def fetch_all(requests, provider=None, retries=RETRIES, backoff=BACKOFF):
+    """Lädt {Ticker: Startdatum} gleichzeitig; Ergebnis {Ticker: Array oder Exception}"""
+    own_provider = provider is None
+    provider = get_provider() if own_provider else provider
+    try:
+        tickers = list(requests)
+        results = await asyncio.gather(
+            *(_shared_fetch(provider, ticker, str(requests[ticker]), retries, backoff) for ticker in tickers),
+            return_exceptions=True,
+        )
+        return dict(zip(tickers, results))
+    finally:
+        if own_provider:
+            await provider['close']()
+
+
+def download(requests, provider=None, retries=RETRIES, backoff=BACKOFF):
+    """Synchroner Einstieg: {Ticker: Startdatum} -> {Ticker: Array oder Exception}"""
+    if isinstance(provider, str):
+        provider = get_provider(provider)
+
+    async def run():
+        try:
+            return await fetch_all(requests, provider, retries, backoff)
+        finally:
+            # Verbindungen gehören zu diesem Loop, der mit asyncio.run endet
+            if provider is not None:
+                await provider['close']()
+
+    return asyncio.run(run())
+
+
+# ---------------------------------------------------------------------------
+# Stand-in-Server
+# ---------------------------------------------------------------------------
+
+def _handler(directory, latency, fail_rate):
+    class PriceHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self):
+            if latency:
+                time.sleep(latency)
+            parts = urlsplit(self.path)
+            if not parts.path.startswith('/prices/'):
+                return self._send(404, b'Unbekannter Pfad')
+            if fail_rate and random.random() < fail_rate:
+                return self._send(503, b'Simulierter Ausfall')
+
+            ticker = unquote(parts.path[len('/prices/'):])
+            path = os.path.join(directory, os.path.basename(price_store.ticker_path(ticker)))
+            if not os.path.exists(path):
+                return self._send(404, f'Keine Kurse für {ticker}'.encode('utf-8'))
+
+            array = np.load(path, mmap_mode='r')
+            start = parse_qs(parts.query).get('start')
+            if start:
+                array = _window(array, start[0])
+            buffer = io.BytesIO()
+            np.save(buffer, np.ascontiguousarray(array))
+            self._send(200, buffer.getvalue(), 'application/octet-stream')
+
+        def _send(self, status, body, content_type='text/plain; charset=utf-8'):
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return PriceHandler
+
+
+def serve(directory=None, host='127.0.0.1', port=0, latency=0.0, fail_rate=0.0):
+    """Startet den Stand-in-Server in einem Hintergrund-Thread; gibt (Server, URL) zurück.
+
+    Er liefert GET /prices/<Ticker>?start=YYYY-MM-DD als .npy aus einem
+    price_store-Verzeichnis. latency und fail_rate (Anteil HTTP 503) simulieren
+    eine langsame bzw. unzuverlässige Quelle. Beenden mit server.shutdown().
+    """
+    server = ThreadingHTTPServer((host, port), _handler(directory or price_store.cache_dir(), latency, fail_rate))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://{host}:{server.server_address[1]}'
+
+
+def bench(directory=None, latency=0.2, tickers=None):
+    """Sequentielles gegen gleichzeitiges Laden über den Stand-in-Server (Sekunden)"""
+    directory = directory or price_store.cache_dir()
+    if tickers is None:
+        tickers = [name[:-len('.npy')] for name in sorted(os.listdir(directory))
+                   if name.endswith('.npy') and not name.endswith('.tmp.npy')]
+    requests = {ticker: price_store.HISTORY_START for ticker in tickers}
+
+    server, url = serve(directory, latency=latency)
+    try:
+        start = time.perf_counter()
+        for ticker in tickers:
+            download({ticker: requests[ticker]}, url)
+        sequential = time.perf_counter() - start
+
+        start = time.perf_counter()
+        download(requests, url)
+        concurrent = time.perf_counter() - start
+    finally:
+        server.shutdown()
+    return {'Ticker': len(tickers), 'Sequentiell': sequential, 'Gleichzeitig': concurrent}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    command = commands.add_parser('serve', help='Stand-in-Server starten')
+    command.add_argument('--dir', help='price_store-Verzeichnis (Standard: LEVTAX_CACHE_DIR)')
+    command.add_argument('--host', default='127.0.0.1')
+    command.add_argument('--port', type=int, default=8765)
+    command.add_argument('--latency', type=float, default=0.0)
+    command.add_argument('--fail-rate', type=float, default=0.0)
+
+    command = commands.add_parser('bench', help='sequentiell gegen gleichzeitig laden')
+    command.add_argument('--dir', help='price_store-Verzeichnis (Standard: LEVTAX_CACHE_DIR)')
+    command.add_argument('--latency', type=float, default=0.2)
+    args = parser.parse_args(argv)
+
+    if args.command == 'bench':
+        for key, value in bench(args.dir, args.latency).items():
+            print(f"{key}: {value:.3f}" if isinstance(value, float) else f"{key}: {value}")
+        return 0
+
+    server, url = serve(args.dir, args.host, args.port, args.latency, args.fail_rate)
+    print(f"Stand-in-Server auf {url} (Strg+C beendet)")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,593 @@
+"""Lokaler Abfrage-Dienst mit warmen Daten.
+
+Der Dienst lädt Kurse, gemeinsame Kalender, MA-/Signal-Regime und die
+Frames der Trading-Strategie einmal und hält sie im Speicher. Abfragen
+laufen über die vektorisierten Engines (scenario_runner.evaluate_pair,
+calculator.evaluate_scenarios), nicht über DataFrame-Pipelines:
+
+    GET  /leveraged?trade=nasdaq 100&signal=s%26p 500&leverage=3
+         optional position=over|under, direction=long|short, ma=200|ema:100|...
+    GET  /trading?index=S%26P 500&lev=2
+         optional tax_rate=0.25, which_lev=both, ma_window=200, signal=band:200:0.02
+    POST /query     JSON-Objekt oder -Liste solcher Abfragen mit 'kind'
+    POST /refresh   Daten neu laden (z.B. nach einem price_store-Update)
+    GET  /stats     Anzahl, p50/p99/Mittel der Latenz je Endpunkt (ms), Batch-Größen
+
+Gleichzeitige Abfragen sammelt ein Batcher-Thread für batch_window
+Sekunden; Abfragen, die dieselben Daten teilen (Trading/Signal-Paar mit
+gleicher Regel bzw. gleicher Index), werden in einem Aufruf ausgewertet.
+Nur der Batcher greift auf die warmen Daten zu, daher ohne Locks. Fehlen
+einer Gruppe Daten (neue Regel, neues Fenster), lädt ein Loader-Thread sie,
+während der Batcher weiter warme Abfragen beantwortet; das Ergebnis kommt
+über die Queue zurück und wird erst vom Batcher eingetragen. Regime-Daten je
+Regel und Frames je Index sind LRU-begrenzt (SCENARIO_CACHE, FRAME_CACHE),
+die Standard-Regel bleibt immer geladen. Schlägt
+eine Gruppe fehl, werden ihre Abfragen einzeln ausgewertet, sodass nur die
+fehlerhafte Abfrage den Fehler erhält. Ungültige Parameter (z.B. Fenster
+außerhalb 1 bis MAX_WINDOW) lehnt normalize() vorab ab (HTTP 400).
+
+Mit --offline nur gegen den lokalen Kursspeicher:
+    python query_service.py serve --offline --port 8766
+    python query_service.py bench --offline --requests 2000 --clients 16
+"""
+import argparse
+import json
+import os
+import queue
+import sys
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+import pandas as pd
+
+import calculator
+import general_performance
+import profiling
+import scenario_runner
+import signals
+
+# Sekunden, die der Batcher nach der ersten Abfrage auf weitere wartet
+BATCH_WINDOW = 0.002
+# Letzte Latenzen je Endpunkt für die Perzentile
+LATENCY_WINDOW = 10_000
+# Sekunden, die eine Abfrage auf ihr Ergebnis wartet
+QUERY_TIMEOUT = 60
+
+DEFAULT_RULE = 200
+# Regeln mit geladenen Regime-Daten aller Assets (LRU, je Eintrag alle Kurse)
+SCENARIO_CACHE = 8
+# Trading-Frames je Index (LRU)
+FRAME_CACHE = 64
+# Threads, die fehlende Daten abseits des Batchers laden
+LOADERS = 2
+# Längstes zulässiges MA-/Signal-Fenster in Handelstagen (rund zehn Jahre)
+MAX_WINDOW = 2520
+
+# Beendet den Batcher-Thread
+STOP = object()
+
+
+# ---------------------------------------------------------------------------
+# Abfragen
+# ---------------------------------------------------------------------------
+
+def _window(value):
+    """MA-Fenster als int im Bereich 1 bis MAX_WINDOW (ValueError sonst)"""
+    window = int(value)
+    if not 1 <= window <= MAX_WINDOW:
+        raise ValueError(f"Fenster muss zwischen 1 und {MAX_WINDOW} Tagen liegen ({window})")
+    return window
+
+
+def _rule(value):
+    """MA-Fenster oder Signal-Definition als Label ('sma:200', 'ema:100', ...), Fenster geprüft"""
+    if isinstance(value, str) and value.strip().lstrip('-').isdigit():
+        value = int(value)
+    if isinstance(value, (int, np.integer)):
+        value = _window(value)
+    _window(signals.warmup(value))
+    return signals.label(value)
+
+
+def normalize(query):
+    """Prüft eine Abfrage und bringt die Parameter in feste Typen (ValueError bei Fehlern)"""
+    kind = query.get('kind')
+    if kind == 'leveraged':
+        names = list(general_performance.TICKER_MAP)
+        trade, signal = str(query['trade']).lower(), str(query['signal']).lower()
+        for name in (trade, signal):
+            if name not in names:
+                raise ValueError(f"Unbekanntes Asset {name!r}. Erlaubt: {names}")
+        position = str(query.get('position', 'over')).lower()
+        direction = str(query.get('direction', 'long')).lower()
+        if position not in ('over', 'under'):
+            raise ValueError("position muss 'over' oder 'under' sein")
+        if direction not in ('long', 'short'):
+            raise ValueError("direction muss 'long' oder 'short' sein")
+        return {'kind': kind, 'trade': trade, 'signal': signal, 'leverage': float(query.get('leverage', 1)),
+                'position': position, 'direction': direction, 'rule': _rule(query.get('ma', DEFAULT_RULE))}
+
+    if kind == 'trading':
+        index = str(query.get('index', 'S&P 500'))
+        if index not in calculator.INDEX_TICKERS:
+            raise ValueError(f"Unbekannter Index {index!r}. Erlaubt: {list(calculator.INDEX_TICKERS)}")
+        which_lev = str(query.get('which_lev', 'both'))
+        if which_lev not in ('index', 'gold', 'both'):
+            raise ValueError("which_lev muss 'index', 'gold' oder 'both' sein")
+        signal = query.get('signal')
+        key = _window(query.get('ma_window', DEFAULT_RULE)) if signal is None else _rule(signal)
+        return {'kind': kind, 'index': index, 'lev': float(query.get('lev', 1)),
+                'tax_rate': float(query.get('tax_rate', 0.25)), 'which_lev': which_lev, 'key': key}
+
+    raise ValueError(f"Unbekannte Abfrage {kind!r}. Erlaubt: 'leveraged', 'trading'")
+
+
+def _group_key(query):
+    """Abfragen mit gleichem Key teilen ihre Daten und werden gemeinsam ausgewertet"""
+    if query['kind'] == 'leveraged':
+        return ('leveraged', query['rule'], query['trade'], query['signal'])
+    return ('trading', query['index'])
+
+
+# ---------------------------------------------------------------------------
+# Warme Daten
+# ---------------------------------------------------------------------------
+
+def _evict(cache, limit, keep=()):
+    """Entfernt die am längsten nicht benutzten Einträge bis auf limit (Keys in keep bleiben)"""
+    for key in [key for key in cache if key not in keep][:max(0, len(cache) - limit)]:
+        del cache[key]
+
+
+def _load_scenario(ticker_map, rule):
+    """Kurse und Regime aller Assets für eine Regel"""
+    definition = signals.definition(rule)
+    if definition['type'] == 'sma' and definition['confirm'] == 1:
+        return scenario_runner.load_scenario_data(ticker_map, ma_window=definition['window'])
+    return scenario_runner.load_scenario_data(ticker_map, signal=definition)
+
+
+def _load_frames(index_data, gold_data, keys):
+    """Trading-Frames für MA-Fenster und Signal-Labels (je Art ein Aufruf)"""
+    frames = {}
+    windows = [key for key in keys if not isinstance(key, str)]
+    labels = [key for key in keys if isinstance(key, str)]
+    if windows:
+        frames.update(calculator.strategy_frames(index_data, gold_data, windows))
+    if labels:
+        frames.update(calculator.strategy_frames(index_data, gold_data, signal=labels))
+    return frames
+
+
+def _install_scenario(service, rule, data):
+    cache = service['scenario']
+    cache[rule] = data
+    _evict(cache, SCENARIO_CACHE, keep=(rule, _rule(DEFAULT_RULE)))
+
+
+def _install_frames(service, index, prices, frames, keep=()):
+    service['prices'].setdefault(index, prices)
+    cache = service['frames'].setdefault(index, OrderedDict())
+    cache.update(frames)
+    _evict(cache, FRAME_CACHE, keep=set(keep) | {DEFAULT_RULE})
+
+
+def _scenario_data(service, rule):
+    """Kurse und Regime aller Assets für eine Regel (fehlt sie, wird direkt geladen)"""
+    cache = service['scenario']
+    if rule not in cache:
+        _install_scenario(service, rule, _load_scenario(service['ticker_map'], rule))
+    cache.move_to_end(rule)
+    return cache[rule]
+
+
+def _strategy_frames(service, index, keys):
+    """Trading-Frames eines Index; fehlende MA-Fenster und Signale werden direkt ergänzt"""
+    keys = list(dict.fromkeys(keys))
+    if index not in service['prices']:
+        _install_frames(service, index, calculator.load_strategy_prices(index), {})
+    frames = service['frames'][index]
+    missing = [key for key in keys if key not in frames]
+    if missing:
+        _install_frames(service, index, None, _load_frames(*service['prices'][index], missing), keep=keys)
+    for key in keys:
+        frames.move_to_end(key)
+    return frames
+
+
+def _cold_load(service, group):
+    """(Key, Ladefunktion) für die fehlenden Daten einer Gruppe; None, wenn alles warm ist"""
+    query = group[0]['query']
+    if query['kind'] == 'leveraged':
+        rule, ticker_map = query['rule'], service['ticker_map']
+        if rule in service['scenario']:
+            return None
+        return ('scenario', rule), lambda: _load_scenario(ticker_map, rule)
+
+    index = query['index']
+    prices = service['prices'].get(index)
+    frames = service['frames'].get(index, {})
+    missing = tuple(key for key in dict.fromkeys(item['query']['key'] for item in group) if key not in frames)
+    if prices is not None and not missing:
+        return None
+
+    def load():
+        index_data, gold_data = prices if prices is not None else calculator.load_strategy_prices(index)
+        return (index_data, gold_data), _load_frames(index_data, gold_data, missing)
+    return ('frames', index, missing), load
+
+
+def warm(service):
+    """Lädt die Standard-Daten (MA200-Regime, MA200-Frames aller Indizes)"""
+    service['scenario'], service['prices'], service['frames'] = OrderedDict(), {}, {}
+    service['generation'] = service.get('generation', 0) + 1
+    _scenario_data(service, _rule(DEFAULT_RULE))
+    for index in service['indices']:
+        _strategy_frames(service, index, [DEFAULT_RULE])
+
+
+def _evaluate_leveraged(service, queries):
+    """Eine Gruppe (gleiche Regel und gleiches Paar) über scenario_runner.evaluate_pair"""
+    data = _scenario_data(service, queries[0]['rule'])
+    names = data['names']
+    records = scenario_runner.evaluate_pair(
+        data, names.index(queries[0]['trade']), names.index(queries[0]['signal']),
+        tuple(dict.fromkeys(query['leverage'] for query in queries)),
+        tuple(dict.fromkeys(query['position'] for query in queries)),
+        tuple(dict.fromkeys(query['direction'] for query in queries)),
+        names,
+    )
+    by_key = {(record['Hebel'], record['Position'], record['Direction']): record for record in records}
+
+    results = []
+    for query in queries:
+        record = by_key.get((query['leverage'], query['position'], query['direction']))
+        if record is None:
+            raise ValueError(f"Zu wenige gemeinsame Tage für {query['trade']} / {query['signal']}")
+        result = {key: value.strftime('%Y-%m-%d') if isinstance(value, pd.Timestamp) else value
+                  for key, value in record.items()}
+        result['Regel'] = query['rule']
+        results.append(result)
+    return results
+
+
+def _evaluate_trading(service, queries):
+    """Eine Gruppe (gleicher Index) über calculator.evaluate_scenarios"""
+    frames = _strategy_frames(service, queries[0]['index'], [query['key'] for query in queries])
+    scenarios = pd.DataFrame({
+        'lev': [query['lev'] for query in queries],
+        'tax_rate': [query['tax_rate'] for query in queries],
+        'which_lev': [query['which_lev'] for query in queries],
+        'key': pd.Series([query['key'] for query in queries], dtype=object),
+    })
+    table = calculator.evaluate_scenarios(frames, scenarios, 'key')
+    # Eine große Gruppe darf das Limit kurz überschreiten; danach bleiben die zuletzt benutzten
+    _evict(frames, FRAME_CACHE, keep={DEFAULT_RULE})
+    return [
+        {'index': query['index'], 'lev': query['lev'], 'tax_rate': query['tax_rate'],
+         'which_lev': query['which_lev'], 'signal': _rule(query['key']), 'days': int(row.days),
+         'final_value': row.final_value, 'avg_yearly_return': row.avg_yearly_return}
+        for query, row in zip(queries, table.itertuples())
+    ]
+
+
+EVALUATORS = {'leveraged': _evaluate_leveraged, 'trading': _evaluate_trading}
+
+
+# ---------------------------------------------------------------------------
+# Batcher
+# ---------------------------------------------------------------------------
+
+def _group(items):
+    groups = {}
+    for item in items:
+        groups.setdefault(_group_key(item['query']), []).append(item)
+    return groups.values()
+
+
+def _dispatch(service, groups):
+    """Warme Gruppen sofort auswerten, für kalte die Daten im Loader-Thread laden"""
+    for group in groups:
+        cold = _cold_load(service, group)
+        if cold is None:
+            _run_group(service, group)
+            continue
+        key, load = cold
+        waiting = service['loading'].get(key)
+        if waiting is not None:
+            waiting.extend(group)
+            continue
+        service['loading'][key] = list(group)
+        loaded = {'loaded': key, 'generation': service['generation']}
+        service['loader'].submit(load).add_done_callback(
+            lambda future, loaded=loaded: service['queue'].put({**loaded, 'future': future}))
+
+
+def _finish_load(service, item):
+    """Trägt geladene Daten ein (nur im Batcher) und wertet die wartenden Abfragen aus"""
+    key, future = item['loaded'], item['future']
+    waiting = service['loading'].pop(key, [])
+    if future.exception() is not None:
+        # Laden fehlgeschlagen: direkt auswerten, damit nur die fehlerhaften Abfragen den Fehler erhalten
+        for group in _group(waiting):
+            _run_group(service, group)
+        return
+    if item['generation'] == service['generation']:
+        if key[0] == 'scenario':
+            _install_scenario(service, key[1], future.result())
+        else:
+            prices, frames = future.result()
+            _install_frames(service, key[1], prices, frames, keep=key[2])
+    _dispatch(service, _group(waiting))
+
+
+def _run_batch(service, items):
+    queries = []
+    for item in items:
+        if 'loaded' in item:
+            _finish_load(service, item)
+        elif item['query'] is None:
+            # Refresh: alles neu laden, danach die Gruppen mit frischen Daten
+            try:
+                warm(service)
+                item['future'].set_result({'status': 'ok'})
+            except Exception as error:
+                item['future'].set_exception(error)
+        else:
+            queries.append(item)
+
+    _dispatch(service, _group(queries))
+    if queries:
+        service['batch_sizes'].append(len(queries))
+
+
+def _run_group(service, group):
+    """Wertet eine Gruppe gemeinsam aus; schlägt das fehl, jede Abfrage einzeln (Fehler nur für die fehlerhafte)"""
+    try:
+        with profiling.stage('simulate', step='query_service.batch', queries=len(group)):
+            results = EVALUATORS[group[0]['query']['kind']](service, [item['query'] for item in group])
+    except Exception as error:
+        if len(group) == 1:
+            group[0]['future'].set_exception(error)
+        else:
+            for item in group:
+                _run_group(service, [item])
+        return
+    for item, result in zip(group, results):
+        item['future'].set_result(result)
+
+
+def _batch_loop(service):
+    pending = service['queue']
+    while True:
+        item = pending.get()
+        if item is STOP:
+            service['loader'].shutdown(wait=False)
+            return
+        items = [item]
+        deadline = time.perf_counter() + service['batch_window']
+        while True:
+            timeout = deadline - time.perf_counter()
+            try:
+                item = pending.get(timeout=timeout) if timeout > 0 else pending.get_nowait()
+            except queue.Empty:
+                break
+            if item is STOP:
+                pending.put(STOP)
+                break
+            items.append(item)
+        _run_batch(service, items)
+
+
+def submit(service, query):
+    """Reicht eine (normalisierte) Abfrage an den Batcher; gibt ein Future zurück (None = Refresh)"""
+    future = Future()
+    service['queue'].put({'query': query, 'future': future})
+    return future
+
+
+def create_service(ticker_map=general_performance.TICKER_MAP, indices=tuple(calculator.INDEX_TICKERS),
+                   batch_window=BATCH_WINDOW):
+    """Lädt die Daten und startet den Batcher-Thread"""
+    service = {
+        'ticker_map': dict(ticker_map),
+        'indices': list(indices),
+        'batch_window': batch_window,
+        'queue': queue.Queue(),
+        'latency': {},
+        'latency_lock': threading.Lock(),
+        'batch_sizes': deque(maxlen=LATENCY_WINDOW),
+        'loader': ThreadPoolExecutor(LOADERS, thread_name_prefix='query-loader'),
+        'loading': {},
+    }
+    warm(service)
+    service['thread'] = threading.Thread(target=_batch_loop, args=(service,), daemon=True)
+    service['thread'].start()
+    return service
+
+
+def evaluate(service, queries):
+    """Wertet eine oder mehrere Abfragen aus (Dictionaries mit 'kind'); blockiert bis zum Ergebnis"""
+    single = isinstance(queries, dict)
+    futures = [submit(service, normalize(item)) for item in ([queries] if single else queries)]
+    results = [future.result(QUERY_TIMEOUT) for future in futures]
+    return results[0] if single else results
+
+
+# ---------------------------------------------------------------------------
+# Latenz
+# ---------------------------------------------------------------------------
+
+def record_latency(service, endpoint, seconds):
+    with service['latency_lock']:
+        service['latency'].setdefault(endpoint, deque(maxlen=LATENCY_WINDOW)).append(seconds * 1000)
+
+
+def latency_stats(service):
+    """Anzahl, p50, p99 und Mittel (ms) der letzten Abfragen je Endpunkt, dazu Batch-Größen"""
+    with service['latency_lock']:
+        samples = {endpoint: np.array(values) for endpoint, values in service['latency'].items()}
+    stats = {
+        endpoint: {'Anzahl': len(values), 'p50 ms': float(np.percentile(values, 50)),
+                   'p99 ms': float(np.percentile(values, 99)), 'Mittel ms': float(values.mean())}
+        for endpoint, values in samples.items() if len(values)
+    }
+    batch_sizes = np.array(service['batch_sizes'])
+    if len(batch_sizes):
+        stats['Batches'] = {'Anzahl': len(batch_sizes), 'Mittlere Größe': float(batch_sizes.mean()),
+                            'Maximale Größe': int(batch_sizes.max())}
+    return stats
+
+
+# ---------------------------------------------------------------------------
+# HTTP
+# ---------------------------------------------------------------------------
+
+def _json_default(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"Nicht serialisierbar: {type(value).__name__}")
+
+
+def _handler(service):
+    class QueryHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self):
+            parts = urlsplit(self.path)
+            endpoint = parts.path.strip('/')
+            if endpoint == 'stats':
+                return self._send(200, latency_stats(service))
+            if endpoint not in EVALUATORS:
+                return self._send(404, {'error': f'Unbekannter Pfad {parts.path}'})
+            parameters = {key: values[0] for key, values in parse_qs(parts.query).items()}
+            self._answer(endpoint, lambda: evaluate(service, {**parameters, 'kind': endpoint}))
+
+        def do_POST(self):
+            endpoint = urlsplit(self.path).path.strip('/')
+            body = self.rfile.read(int(self.headers.get('Content-Length', 0)) or 0)
+            if endpoint == 'refresh':
+                return self._answer(endpoint, lambda: submit(service, None).result(QUERY_TIMEOUT))
+            if endpoint != 'query':
+                return self._send(404, {'error': f'Unbekannter Pfad /{endpoint}'})
+            self._answer(endpoint, lambda: evaluate(service, json.loads(body or b'[]')))
+
+        def _answer(self, endpoint, evaluate):
+            start = time.perf_counter()
+            try:
+                status, payload = 200, evaluate()
+            except (ValueError, KeyError, TypeError) as error:
+                status, payload = 400, {'error': str(error)}
+            except Exception as error:
+                status, payload = 500, {'error': f'{type(error).__name__}: {error}'}
+            self._send(status, payload)
+            record_latency(service, endpoint, time.perf_counter() - start)
+
+        def _send(self, status, payload):
+            body = json.dumps(payload, ensure_ascii=False, default=_json_default).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return QueryHandler
+
+
+def serve(host='127.0.0.1', port=0, **options):
+    """Startet Dienst und HTTP-Server in Hintergrund-Threads; gibt (Server, URL, Dienst) zurück.
+
+    Beenden mit server.shutdown().
+    """
+    service = create_service(**options)
+    server = ThreadingHTTPServer((host, port), _handler(service))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://{host}:{server.server_address[1]}', service
+
+
+def bench(n_requests=2000, clients=16, seed=0, **options):
+    """Zufällige Abfragen von mehreren Clients gleichzeitig über HTTP; gibt die Latenz-Statistik zurück"""
+    import http.client
+    from urllib.parse import urlencode
+
+    server, url, service = serve(**options)
+    host, port = server.server_address[:2]
+    rng = np.random.default_rng(seed)
+    names = list(service['ticker_map'])
+    paths = []
+    for _ in range(n_requests):
+        if rng.random() < 0.5:
+            parameters = {'trade': rng.choice(names), 'signal': rng.choice(names),
+                          'leverage': int(rng.integers(1, 4)), 'position': rng.choice(['over', 'under'])}
+            paths.append('/leveraged?' + urlencode(parameters))
+        else:
+            parameters = {'index': rng.choice(service['indices']), 'lev': int(rng.integers(1, 4)),
+                          'tax_rate': rng.choice([0.0, 0.25])}
+            paths.append('/trading?' + urlencode(parameters))
+
+    def client(chunk):
+        connection = http.client.HTTPConnection(host, port)
+        for path in chunk:
+            connection.request('GET', path)
+            connection.getresponse().read()
+        connection.close()
+
+    try:
+        start = time.perf_counter()
+        with ThreadPoolExecutor(clients) as pool:
+            list(pool.map(client, [paths[i::clients] for i in range(clients)]))
+        elapsed = time.perf_counter() - start
+    finally:
+        server.shutdown()
+        service['queue'].put(STOP)
+
+    stats = latency_stats(service)
+    stats['Durchsatz'] = {'Abfragen': n_requests, 'Sekunden': elapsed, 'Abfragen/s': n_requests / elapsed}
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--offline', action='store_true', help='nur lokale Kursdaten verwenden')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    command = commands.add_parser('serve', help='Dienst starten')
+    command.add_argument('--host', default='127.0.0.1')
+    command.add_argument('--port', type=int, default=8766)
+    command.add_argument('--batch-window', type=float, default=BATCH_WINDOW)
+
+    command = commands.add_parser('bench', help='Latenz unter gleichzeitigen Abfragen messen')
+    command.add_argument('--requests', type=int, default=2000)
+    command.add_argument('--clients', type=int, default=16)
+    command.add_argument('--batch-window', type=float, default=BATCH_WINDOW)
+    args = parser.parse_args(argv)
+
+    if args.offline:
+        os.environ['LEVTAX_OFFLINE'] = '1'
+
+    if args.command == 'bench':
+        for endpoint, values in bench(args.requests, args.clients, batch_window=args.batch_window).items():
+            print(f"{endpoint}: " + ', '.join(f"{key} {value:.2f}" if isinstance(value, float) else f"{key} {value}"
+                                              for key, value in values.items()))
+        return 0
+
+    server, url, _ = serve(args.host, args.port, batch_window=args.batch_window)
+    print(f"Abfrage-Dienst auf {url} (Strg+C beendet)")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,65 @@
+"""Vektorisierte Regime-Logik für die S&P 500 / Gold Strategien.
+
+Ein Regime wird erst übernommen, wenn die MA-Signale beider Assets an zwei
+aufeinanderfolgenden Tagen gleich sind ("Zwei-Tage-Bestätigung"). Die Returns
+eines Tages richten sich nach dem Regime, das am Vortag gültig war.
+"""
+import numpy as np
+
+# Regime-Codes: 2 * SP500_über_MA + Gold_über_MA, dazu der Startzustand
+BOTH_BELOW = 0
+GOLD_ABOVE_ONLY = 1
+SP500_ABOVE_ONLY = 2
+BOTH_ABOVE = 3
+INITIAL = 4
+
+REGIME_NAMES = np.array(['Both_Below', 'Gold_Above_Only', 'SP500_Above_Only', 'Both_Above', 'Initial'])
+
+
+def encode_regime(*above):
+    """Kodiert MA-Signale als Integer, das erste Signal ist das höchste Bit.
+
+    Mit (SP500_über_MA, Gold_über_MA) ergeben sich die Codes 0-3 von oben.
+    """
+    codes = np.zeros(len(above[0]), dtype=np.int16)
+    for flags in above:
+        codes = 2 * codes + np.asarray(flags, dtype=np.int16)
+    return codes.astype(np.int8) if len(above) < 7 else codes
+
+
+def confirmed_regime(codes, initial=INITIAL, days=2):
+    """Regime, mit dem an jedem Tag gehandelt wird.
+
+    Ein Code gilt als bestätigt, sobald er an `days` aufeinanderfolgenden
+    Tagen vorliegt (Standard: Tag i und Vortag). Der bestätigte Code wird per
+    Forward-Fill gehalten und gilt ab dem nächsten Tag. Bis zur ersten
+    Bestätigung gilt `initial`.
+    """
+    codes = np.asarray(codes)
+    n = len(codes)
+    if n == 0:
+        return np.empty(0, dtype=np.int8)
+
+    # Länge der aktuellen Serie gleicher Codes
+    index = np.arange(n)
+    run_start = np.zeros(n, dtype=np.intp)
+    run_start[1:] = np.where(codes[1:] != codes[:-1], index[1:], 0)
+    np.maximum.accumulate(run_start, out=run_start)
+    confirmed = index - run_start + 1 >= days
+
+    # Index des letzten bestätigten Tages (Forward-Fill)
+    last_confirmed = np.where(confirmed, index, -1)
+    np.maximum.accumulate(last_confirmed, out=last_confirmed)
+    state = np.where(last_confirmed >= 0, codes[last_confirmed], initial)
+
+    regime = np.empty(n, dtype=np.int8 if initial < 128 else np.int16)
+    regime[0] = initial
+    regime[1:] = state[:-1]
+    return regime
+
+
+def regime_returns(regime, weights, asset_returns):
+    """Tägliche Portfolio-Returns aus einer Gewichtsmatrix (Regime x Assets)"""
+    weights = np.asarray(weights, dtype=float)
+    asset_returns = np.asarray(asset_returns, dtype=float)
+    return np.einsum('ij,ij->i', weights[regime], asset_returns)
@@ -0,0 +1,347 @@
+"""Memoisierung von Strategie-Ergebnissen, adressiert über den Inhalt der Kursdaten.
+
+Ein Eintrag heißt
+
+    <Key>+<Ticker>@<Digest>+...
+
+Key ist ein SHA-256 über Funktionsname, normalisierte Parameter (Zahlen als
+float, Tupel als Listen, Defaults ergänzt) und den Stand des Codes (alle
+.py-Dateien dieses Verzeichnisses). Digest ist ein SHA-256 über die
+Kursdatei jedes beteiligten Tickers, je Datei nur neu berechnet, wenn sich
+Größe oder mtime geändert haben. Vor dem Nachschlagen wird der price_store
+aktualisiert; kommen neue Kurse hinzu, ändert sich der Digest und alle
+Einträge mit dem alten Digest des Tickers werden aus beiden Stufen entfernt.
+
+Zwei Stufen, beide LRU und nach Bytes begrenzt:
+    Speicher  gepickelte Ergebnisse (ein Treffer liefert eine eigene Kopie)
+    Platte    eine Datei je Eintrag; Treffer aktualisieren die mtime. Gezählt
+              wird der belegte Platz (Blöcke), nicht die Dateigröße
+
+Umgebungsvariable:
+    LEVTAX_RESULT_CACHE  Verzeichnis der Platten-Stufe (Standard:
+                         <LEVTAX_CACHE_DIR>/results), "0" schaltet ab
+
+Beispiel:
+    @result_cache.memoize(lambda args: [INDEX_TICKERS[args['index']], 'GC=F'])
+    def calculate_trading_strategy(index='SPX', ...):
+"""
+import functools
+import hashlib
+import inspect
+import json
+import os
+import pickle
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+import price_store
+
+MEMORY_LIMIT = 64 * 2**20
+DISK_LIMIT = 512 * 2**20
+# Nach einer Räumung der Platte bleibt dieser Anteil des Limits belegt
+DISK_TARGET = 0.9
+
+SUFFIX = '.pkl'
+# Platzhalter für "nicht im Cache" (None ist ein gültiges Ergebnis)
+MISSING = object()
+
+_lock = threading.RLock()
+_memory = OrderedDict()
+# Ticker -> (mtime_ns, Größe, Digest)
+_fingerprints = {}
+_state = {'memory_bytes': 0, 'disk_bytes': None, 'memory_limit': MEMORY_LIMIT, 'disk_limit': DISK_LIMIT}
+_counts = {'memory': 0, 'disk': 0, 'miss': 0}
+
+
+def directory():
+    """Verzeichnis der Platten-Stufe (None = Cache abgeschaltet)"""
+    setting = os.environ.get('LEVTAX_RESULT_CACHE', '')
+    if setting.lower() in ('0', 'false', 'no', 'off'):
+        return None
+    return setting or os.path.join(price_store.cache_dir(), 'results')
+
+
+def configure(memory_limit=None, disk_limit=None):
+    """Setzt die Größenlimits (Bytes) der beiden Stufen"""
+    with _lock:
+        if memory_limit is not None:
+            _state['memory_limit'] = memory_limit
+            _evict_memory()
+        if disk_limit is not None:
+            _state['disk_limit'] = disk_limit
+            _evict_disk(directory())
+
+
+# ---------------------------------------------------------------------------
+# Namen
+# ---------------------------------------------------------------------------
+
+@functools.lru_cache(maxsize=1)
+def code_version():
+    """Digest über alle Python-Dateien des Projekts (ändert sich mit jeder Code-Änderung)"""
+    digest = hashlib.sha256()
+    base = os.path.dirname(os.path.abspath(__file__))
+    for name in sorted(os.listdir(base)):
+        if name.endswith('.py'):
+            with open(os.path.join(base, name), 'rb') as file:
+                digest.update(name.encode('utf-8') + b'\0' + file.read())
+    return digest.hexdigest()[:16]
+
+
+def _safe(ticker):
+    return os.path.basename(price_store.ticker_path(ticker))[:-len('.npy')]
+
+
+def fingerprint(ticker):
+    """Digest der Kursdatei eines Tickers; bei neuem Inhalt werden alte Einträge entfernt"""
+    path = price_store.ticker_path(ticker)
+    stat = os.stat(path)
+    with _lock:
+        known = _fingerprints.get(ticker)
+        if known is not None and known[:2] == (stat.st_mtime_ns, stat.st_size):
+            return known[2]
+
+    array = price_store.load_array(ticker)
+    digest = hashlib.sha256(np.ascontiguousarray(array).tobytes()).hexdigest()[:12]
+    with _lock:
+        previous = _fingerprints.get(ticker)
+        _fingerprints[ticker] = (stat.st_mtime_ns, stat.st_size, digest)
+        if previous is None or previous[2] != digest:
+            _purge(ticker, digest)
+    return digest
+
+
+def _normalize(value):
+    """Parameter in eine JSON-feste Form (2 und 2.0 ergeben denselben Key)"""
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, bool) or value is None or isinstance(value, str):
+        return value
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, dict):
+        return {str(key): _normalize(item) for key, item in sorted(value.items(), key=lambda pair: str(pair[0]))}
+    if isinstance(value, (list, tuple, np.ndarray)):
+        return [_normalize(item) for item in value]
+    return repr(value)
+
+
+def data_suffix(tickers):
+    """Stand der Kursdaten als Namensteil ('+<Ticker>@<Digest>' je Ticker, nach Aktualisierung)"""
+    tickers = sorted(dict.fromkeys(tickers))
+    price_store.update_many(tickers)
+    return ''.join(f'+{_safe(ticker)}@{fingerprint(ticker)}' for ticker in tickers)
+
+
+def entry_name(name, parameters, suffix):
+    """Name eines Eintrags aus Funktionsname, Parametern und data_suffix()"""
+    payload = json.dumps({'name': name, 'parameters': _normalize(parameters), 'code': code_version()},
+                         sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:32] + suffix
+
+
+# ---------------------------------------------------------------------------
+# Speicher- und Platten-Stufe
+# ---------------------------------------------------------------------------
+
+def _path(base, name):
+    return os.path.join(base, name[:2], name + SUFFIX)
+
+
+def _remember(name, blob):
+    """Legt einen Eintrag in die Speicher-Stufe (als zuletzt benutzt)"""
+    previous = _memory.pop(name, None)
+    if previous is not None:
+        _state['memory_bytes'] -= len(previous)
+    if len(blob) > _state['memory_limit']:
+        return
+    _memory[name] = blob
+    _state['memory_bytes'] += len(blob)
+    _evict_memory()
+
+
+def _evict_memory():
+    while _memory and _state['memory_bytes'] > _state['memory_limit']:
+        _, blob = _memory.popitem(last=False)
+        _state['memory_bytes'] -= len(blob)
+
+
+def _allocated(stat):
+    """Auf der Platte belegte Bytes einer Datei (ganze Blöcke, wo das System sie meldet)"""
+    blocks = getattr(stat, 'st_blocks', None)
+    return blocks * 512 if blocks is not None else stat.st_size
+
+
+def _disk_entries(base):
+    """(Pfad, Größe, mtime) aller Einträge der Platten-Stufe"""
+    entries = []
+    if base is None or not os.path.isdir(base):
+        return entries
+    for folder in os.scandir(base):
+        if not folder.is_dir():
+            continue
+        for entry in os.scandir(folder.path):
+            if entry.name.endswith(SUFFIX):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((entry.path, _allocated(stat), stat.st_mtime_ns))
+    return entries
+
+
+def _remove(path):
+    try:
+        size = _allocated(os.stat(path))
+        os.remove(path)
+    except FileNotFoundError:
+        return 0
+    return size
+
+
+def _evict_disk(base):
+    """Entfernt die am längsten nicht benutzten Dateien, bis die Platten-Stufe unter dem Ziel liegt"""
+    if base is None:
+        return
+    if _state['disk_bytes'] is None:
+        _state['disk_bytes'] = sum(size for _, size, _ in _disk_entries(base))
+    if _state['disk_bytes'] <= _state['disk_limit']:
+        return
+
+    entries = sorted(_disk_entries(base), key=lambda entry: entry[2])
+    total = sum(size for _, size, _ in entries)
+    for path, _, _ in entries:
+        if total <= DISK_TARGET * _state['disk_limit']:
+            break
+        total -= _remove(path)
+    _state['disk_bytes'] = total
+
+
+def _purge(ticker, digest):
+    """Entfernt alle Einträge, die den Ticker mit einem anderen Digest enthalten"""
+    marker = f'+{_safe(ticker)}@'
+    current = marker + digest
+
+    def stale(name):
+        return marker in name and current + '+' not in name + '+'
+
+    for name in [name for name in _memory if stale(name)]:
+        _state['memory_bytes'] -= len(_memory.pop(name))
+
+    removed = sum(_remove(path) for path, _, _ in _disk_entries(directory())
+                  if stale(os.path.basename(path)[:-len(SUFFIX)]))
+    if removed and _state['disk_bytes'] is not None:
+        _state['disk_bytes'] -= removed
+
+
+def get(name):
+    """Ergebnis eines Eintrags oder MISSING (Speicher zuerst, dann Platte)"""
+    with _lock:
+        blob = _memory.get(name)
+        if blob is not None:
+            _memory.move_to_end(name)
+            _counts['memory'] += 1
+            return pickle.loads(blob)
+
+    base = directory()
+    path = _path(base, name)
+    try:
+        with open(path, 'rb') as file:
+            blob = file.read()
+        os.utime(path)
+    except FileNotFoundError:
+        with _lock:
+            _counts['miss'] += 1
+        return MISSING
+
+    with _lock:
+        _remember(name, blob)
+        _counts['disk'] += 1
+    return pickle.loads(blob)
+
+
+def put(name, value):
+    """Speichert ein Ergebnis in beiden Stufen"""
+    blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+    base = directory()
+    path = _path(base, name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(tmp_path, 'wb') as file:
+        file.write(blob)
+
+    with _lock:
+        # Ein überschriebener Eintrag gibt seinen Platz frei
+        try:
+            previous = _allocated(os.stat(path))
+        except FileNotFoundError:
+            previous = 0
+        os.replace(tmp_path, path)
+        _remember(name, blob)
+        if _state['disk_bytes'] is not None:
+            _state['disk_bytes'] += _allocated(os.stat(path)) - previous
+        _evict_disk(base)
+
+
+def clear():
+    """Leert beide Stufen"""
+    with _lock:
+        _memory.clear()
+        _state['memory_bytes'] = 0
+        for path, _, _ in _disk_entries(directory()):
+            _remove(path)
+        _state['disk_bytes'] = 0
+
+
+def stats():
+    """Treffer je Stufe, Fehlschläge und Belegung (Bytes)"""
+    with _lock:
+        return {
+            'Treffer Speicher': _counts['memory'],
+            'Treffer Platte': _counts['disk'],
+            'Fehlschläge': _counts['miss'],
+            'Einträge Speicher': len(_memory),
+            'Bytes Speicher': _state['memory_bytes'],
+            'Bytes Platte': sum(size for _, size, _ in _disk_entries(directory())),
+        }
+
+
+# ---------------------------------------------------------------------------
+# Einstiegspunkte
+# ---------------------------------------------------------------------------
+
+def memoize(tickers, name=None):
+    """Dekorator: Ergebnis je (Parameter, Kursdaten) aus dem Cache.
+
+    tickers bekommt die gebundenen Argumente (mit Defaults) als Dictionary
+    und gibt die Ticker zurück, deren Kurse in das Ergebnis eingehen. Löst
+    es einen Fehler aus (z.B. unbekannter Index), läuft die Funktion ohne
+    Cache und meldet den Fehler selbst. Die ungecachte Funktion bleibt als
+    .uncached erreichbar.
+    """
+    def decorator(function):
+        label = name or f'{function.__module__}.{function.__qualname__}'
+        signature = inspect.signature(function)
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if directory() is None:
+                return function(*args, **kwargs)
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            try:
+                entry = entry_name(label, bound.arguments, data_suffix(tickers(bound.arguments)))
+            except (KeyError, ValueError, AttributeError, FileNotFoundError):
+                return function(*args, **kwargs)
+
+            result = get(entry)
+            if result is MISSING:
+                result = function(*args, **kwargs)
+                put(entry, result)
+            return result
+
+        wrapper.uncached = function
+        return wrapper
+    return decorator
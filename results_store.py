@@ -0,0 +1,313 @@
+"""Spaltenorientierter Ergebnisspeicher für Sweeps.
+
+Statt DataFrames mit Text-Spalten hält ein Store je Lauf:
+    - die Wertkurve als float32 (oder float64) in einer gemeinsamen Datei
+    - Code-Reihen (z.B. Regime, BTC_Allocation) als int8, Texte über Kategorien
+    - Parameter und Kennzahlen als eine Zeile einer typisierten Tabelle
+Kalender werden nur einmal je unterschiedlicher Datumsreihe gespeichert.
+
+Alle Dateien sind reine Anhänge-Dateien und werden memory-mapped gelesen:
+select() filtert die Tabelle nach Parametern, curve() liefert nur die Kurve
+eines Laufs, ohne die anderen zu laden. Geschrieben wird erst die Kurve,
+zuletzt die Tabellenzeile; ein abgebrochener Lauf hinterlässt also keine
+halbe Zeile. Was er an Kurven und Codes schon geschrieben hat, schneidet
+der nächste Anhang ab.
+
+Verzeichnis:
+    meta.json             Tabellen-Schema, Kategorien, Kalender
+    table.bin             Parameter und Kennzahlen (Structured Array)
+    curves.bin            alle Kurven hintereinander
+    codes_<Name>.bin      int8, gleiche Offsets wie die Kurven (-1 = fehlt)
+    calendars/<id>.npy    Datumsreihen
+
+Beispiel:
+    store = create('sweep', {'Hebel': 'f8', 'Index': 'U16'}, codes=('Regime',))
+    append(store, {'Hebel': 2, 'Index': 'S&P 500'}, df['Portfolio_value'], df.index,
+           codes={'Regime': df['Regime']})
+    rows = select(store, Hebel=2)
+"""
+import hashlib
+import json
+import os
+import re
+
+import numpy as np
+
+import metrics
+
+META = 'meta.json'
+TABLE = 'table.bin'
+CURVES = 'curves.bin'
+MISSING_CODE = -1
+
+# Feste Felder je Lauf vor Parametern und Kennzahlen
+INDEX_FIELDS = [('offset', 'i8'), ('length', 'i8'), ('calendar', 'i4')]
+
+# Gemappte Dateien: Pfad -> (Größe, Array)
+_mapped = {}
+
+
+def _path(store, name):
+    return os.path.join(store['path'], name)
+
+
+def _code_file(name):
+    return 'codes_' + re.sub(r'[^A-Za-z0-9.\-]', '_', name) + '.bin'
+
+
+def _save_meta(store):
+    tmp_path = _path(store, META + '.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as file:
+        json.dump(store['meta'], file, ensure_ascii=False, indent=1)
+    os.replace(tmp_path, _path(store, META))
+
+
+def _store(path, meta):
+    return {
+        'path': path,
+        'meta': meta,
+        'dtype': np.dtype([tuple(field) for field in meta['table']]),
+        'curve_dtype': np.dtype(meta['curve_dtype']),
+    }
+
+
+def create(path, parameters, metric_names=metrics.METRICS, codes=(), curve_dtype='float32'):
+    """Legt einen Store an (oder öffnet einen vorhandenen mit gleichem Schema).
+
+    parameters ist {Name: dtype}, z.B. {'Hebel': 'f8', 'Position': 'U8'};
+    Kennzahlen werden als float64 gespeichert.
+    """
+    table = INDEX_FIELDS + [(name, np.dtype(dtype).str) for name, dtype in parameters.items()]
+    table += [(name, '<f8') for name in metric_names]
+    meta = {
+        'table': [list(field) for field in table],
+        'parameters': list(parameters),
+        'metrics': list(metric_names),
+        'curve_dtype': np.dtype(curve_dtype).str,
+        'codes': {name: [] for name in codes},
+        'calendars': [],
+    }
+
+    if os.path.exists(os.path.join(path, META)):
+        store = open_store(path)
+        if store['meta']['table'] != meta['table'] or set(store['meta']['codes']) != set(codes):
+            raise ValueError(f"Store {path} existiert bereits mit anderem Schema")
+        return store
+
+    os.makedirs(os.path.join(path, 'calendars'), exist_ok=True)
+    store = _store(path, meta)
+    _save_meta(store)
+    return store
+
+
+def open_store(path):
+    """Öffnet einen vorhandenen Store"""
+    with open(os.path.join(path, META), encoding='utf-8') as file:
+        return _store(path, json.load(file))
+
+
+def _map(path, dtype):
+    """Datei als read-only memmap (neu gemappt, wenn sie gewachsen ist)"""
+    size = os.path.getsize(path) if os.path.exists(path) else 0
+    count = size // dtype.itemsize
+    cached = _mapped.get(path)
+    if cached is not None and cached[0] == count:
+        return cached[1]
+    array = np.memmap(path, dtype=dtype, mode='r', shape=(count,)) if count else np.empty(0, dtype=dtype)
+    _mapped[path] = (count, array)
+    return array
+
+
+def _calendar_id(store, dates):
+    key = hashlib.sha1(dates.view(np.int64).tobytes()).hexdigest()[:16]
+    calendars = store['meta']['calendars']
+    if key not in calendars:
+        np.save(_path(store, os.path.join('calendars', key + '.npy')), dates)
+        calendars.append(key)
+        _save_meta(store)
+    return calendars.index(key)
+
+
+def _encode(store, name, values, n_runs, length):
+    """Code-Reihe als int8 (runs x Tage); Texte/Bools über die Kategorien des Stores"""
+    if values is None:
+        return np.full((n_runs, length), MISSING_CODE, dtype=np.int8)
+    values = np.asarray(values).reshape(n_runs, length)
+    if values.dtype.kind in 'iu':
+        return values.astype(np.int8)
+
+    categories = store['meta']['codes'][name]
+    labels, inverse = np.unique(values.astype(str), return_inverse=True)
+    new = [label for label in labels.tolist() if label not in categories]
+    if new:
+        categories.extend(new)
+        _save_meta(store)
+    lookup = np.array([categories.index(label) for label in labels.tolist()], dtype=np.int8)
+    return lookup[inverse].reshape(n_runs, length)
+
+
+def _truncate(path, size):
+    """Kürzt eine Datei auf size Bytes (falls länger) und vergisst ihre Abbildung"""
+    if os.path.exists(path) and os.path.getsize(path) > size:
+        _mapped.pop(path, None)
+        os.truncate(path, size)
+
+
+def _discard_partial(store):
+    """Entfernt Reste eines abgebrochenen Laufs; gibt den Offset für die nächste Kurve zurück.
+
+    Maßgeblich ist die Tabelle: Kurven und Codes hinter der letzten
+    vollständigen Zeile (Offset + Länge) gehören zu keinem Lauf und werden
+    abgeschnitten, ebenso eine halb geschriebene Tabellenzeile.
+    """
+    table_path = _path(store, TABLE)
+    size = os.path.getsize(table_path) if os.path.exists(table_path) else 0
+    _truncate(table_path, size - size % store['dtype'].itemsize)
+    rows = table(store)
+    offset = int(rows['offset'][-1] + rows['length'][-1]) if len(rows) else 0
+
+    _truncate(_path(store, CURVES), offset * store['curve_dtype'].itemsize)
+    for name in store['meta']['codes']:
+        _truncate(_path(store, _code_file(name)), offset)
+    return offset
+
+
+def append_batch(store, parameters, values, dates, codes=None, metric_values=None):
+    """Hängt mehrere Läufe mit gemeinsamem Kalender an (values: Läufe x Tage).
+
+    parameters ist eine Liste von Dictionaries (eine je Lauf), codes
+    {Name: Läufe x Tage}, metric_values {Kennzahl: Array je Lauf}. Fehlende
+    Kennzahlen werden mit metrics.compute_metrics aus den Kurven berechnet.
+    Gibt die neuen Zeilennummern zurück.
+    """
+    values = np.atleast_2d(np.asarray(values, dtype=float))
+    n_runs, length = values.shape
+    dates = np.asarray(dates, dtype='M8[ns]')
+    if len(dates) != length or len(parameters) != n_runs:
+        raise ValueError("Kurven, Kalender und Parameter passen nicht zusammen")
+    codes = codes or {}
+    unknown = set(codes) - set(store['meta']['codes'])
+    if unknown:
+        raise ValueError(f"Unbekannte Code-Reihen {sorted(unknown)}. Im Store: {list(store['meta']['codes'])}")
+
+    metric_values = dict(metric_values or {})
+    missing = [name for name in store['meta']['metrics'] if name not in metric_values]
+    if missing and length > 1:
+        with np.errstate(divide='ignore', invalid='ignore'):
+            computed = metrics.compute_metrics(values[:, 1:] / values[:, :-1] - 1)
+        for name in missing:
+            metric_values[name] = computed.get(name, np.full(n_runs, np.nan))
+
+    # Kurven und Codes zuerst, die Tabellenzeilen machen die Läufe sichtbar
+    offset = _discard_partial(store)
+    curve_path = _path(store, CURVES)
+    with open(curve_path, 'ab') as file:
+        file.write(values.astype(store['curve_dtype']).tobytes())
+    for name in store['meta']['codes']:
+        encoded = _encode(store, name, codes.get(name), n_runs, length)
+        code_path = _path(store, _code_file(name))
+        # Code-Dateien immer auf die Länge der Kurven bringen (z.B. nach einem Abbruch)
+        size = os.path.getsize(code_path) if os.path.exists(code_path) else 0
+        with open(code_path, 'ab') as file:
+            if size < offset:
+                file.write(np.full(offset - size, MISSING_CODE, dtype=np.int8).tobytes())
+            file.write(encoded.tobytes())
+
+    rows = np.zeros(n_runs, dtype=store['dtype'])
+    rows['offset'] = offset + length * np.arange(n_runs)
+    rows['length'] = length
+    rows['calendar'] = _calendar_id(store, dates)
+    for row, run in enumerate(parameters):
+        for name in store['meta']['parameters']:
+            rows[name][row] = run[name]
+    for name in store['meta']['metrics']:
+        rows[name] = np.asarray(metric_values.get(name, np.nan), dtype=float)
+
+    start = len(table(store))
+    with open(_path(store, TABLE), 'ab') as file:
+        file.write(rows.tobytes())
+    return np.arange(start, start + n_runs)
+
+
+def append(store, parameters, values, dates, codes=None, metric_values=None):
+    """Hängt einen Lauf an; gibt seine Zeilennummer zurück"""
+    codes = {name: np.asarray(series)[None, :] for name, series in (codes or {}).items()}
+    metric_values = {name: [value] for name, value in (metric_values or {}).items()}
+    return append_batch(store, [parameters], np.asarray(values, dtype=float)[None, :], dates,
+                        codes, metric_values)[0]
+
+
+def append_frame(store, parameters, df, value_column, code_columns=()):
+    """Lauf aus einem Ergebnis-DataFrame (z.B. Portfolio_value, Regime, BTC_Allocation)"""
+    return append(store, parameters, df[value_column].to_numpy(dtype=float), df.index.values,
+                  {column: df[column].to_numpy() for column in code_columns})
+
+
+# ---------------------------------------------------------------------------
+# Lesen
+# ---------------------------------------------------------------------------
+
+def table(store):
+    """Parameter und Kennzahlen aller Läufe (memory-mapped Structured Array)"""
+    return _map(_path(store, TABLE), store['dtype'])
+
+
+def select(store, **conditions):
+    """Zeilennummern der Läufe, deren Parameter/Kennzahlen passen.
+
+    Ein Wert ist ein Skalar (gleich), eine Liste/Tupel (einer davon) oder eine
+    Funktion auf die Spalte (z.B. Sharpe=lambda x: x > 1).
+    """
+    rows = table(store)
+    mask = np.ones(len(rows), dtype=bool)
+    for name, condition in conditions.items():
+        column = rows[name]
+        if callable(condition):
+            mask &= np.asarray(condition(column), dtype=bool)
+        elif isinstance(condition, (list, tuple, set)):
+            mask &= np.isin(column, list(condition))
+        else:
+            mask &= column == condition
+    return np.flatnonzero(mask)
+
+
+def frame(store, rows=None):
+    """Parameter und Kennzahlen als DataFrame (Index = Zeilennummer)"""
+    import pandas as pd
+
+    data = table(store)
+    rows = np.arange(len(data)) if rows is None else np.asarray(rows)
+    selected = data[rows]
+    columns = store['meta']['parameters'] + store['meta']['metrics']
+    return pd.DataFrame({name: np.asarray(selected[name]) for name in columns}, index=rows)
+
+
+def calendar(store, row):
+    """Datumsreihe eines Laufs"""
+    key = store['meta']['calendars'][table(store)['calendar'][row]]
+    return np.load(_path(store, os.path.join('calendars', key + '.npy')), mmap_mode='r')
+
+
+def curve(store, row):
+    """Wertkurve eines Laufs als memmap-Ausschnitt"""
+    entry = table(store)[row]
+    return _map(_path(store, CURVES), store['curve_dtype'])[entry['offset']:entry['offset'] + entry['length']]
+
+
+def curves(store, rows):
+    """Kurven mehrerer Läufe als (Läufe x Tage); kürzere Kurven sind am Ende mit NaN aufgefüllt"""
+    lengths = table(store)['length'][np.asarray(rows, dtype=np.int64)]
+    result = np.full((len(lengths), lengths.max() if len(lengths) else 0), np.nan, dtype=store['curve_dtype'])
+    for position, row in enumerate(rows):
+        result[position, :lengths[position]] = curve(store, row)
+    return result
+
+
+def codes(store, row, name, decode=False):
+    """Code-Reihe eines Laufs als int8 (decode=True: als Texte der Kategorien)"""
+    entry = table(store)[row]
+    values = _map(_path(store, _code_file(name)), np.dtype(np.int8))[entry['offset']:entry['offset'] + entry['length']]
+    if not decode:
+        return values
+    categories = np.array(store['meta']['codes'][name] + [''], dtype=object)
+    return categories[np.where(values == MISSING_CODE, len(categories) - 1, values)]
@@ -0,0 +1,76 @@
+"""Portfolio-Returns direkt aus Roh-Returns, ohne gehebelte Zwischenspalten.
+
+Ein gehebeltes Instrument auf Asset a mit Hebel L hat die Tagesrendite
+
+    L * r_a - (L - 1) * Finanzierung / 252 - TER / 252
+
+Da das linear in r_a ist, fallen Gewichte, Hebel und Kosten beliebig vieler
+Varianten in eine Exposure-Matrix (Varianten x Assets) und eine Konstante je
+Variante zusammen (fold_weights). Die Portfolio-Returns entstehen dann mit
+einem Matrixprodukt direkt im vorab angelegten Ausgabepuffer; außer Eingabe
+(Assets x Tage) und Ausgabe wird kein tageslanges Array angelegt.
+
+Finanzierungskosten und TER sind Jahressätze, cash_rate ist wie in den
+Specs eine Tagesrendite.
+"""
+import numpy as np
+
+TRADING_DAYS = 252
+
+
+def fold_weights(weights, leverage, assets, n_assets, cash_weight=0.0, cash_rate=0.0,
+                 financing_rate=0.0, ter=0.0, periods_per_year=TRADING_DAYS):
+    """Instrument-Gewichte (..., Instrumente) -> (Exposures (..., Assets), Konstante (...)).
+
+    assets gibt je Instrument die Asset-Spalte an, leverage den Hebel je
+    Instrument (oder wie weights je Variante und Instrument).
+    """
+    weights = np.asarray(weights, dtype=float)
+    leverage = np.broadcast_to(np.asarray(leverage, dtype=float), weights.shape)
+    assets = np.asarray(assets, dtype=np.int64)
+
+    exposures = np.zeros(weights.shape[:-1] + (n_assets,))
+    for instrument, asset in enumerate(assets):
+        exposures[..., asset] += weights[..., instrument] * leverage[..., instrument]
+
+    daily_cost = ((leverage - 1) * financing_rate + ter) / periods_per_year
+    constant = np.asarray(cash_weight, dtype=float) * cash_rate - (weights * daily_cost).sum(axis=-1)
+    return exposures, constant
+
+
+def instrument_returns(asset_returns, leverage, financing_rate=0.0, ter=0.0, periods_per_year=TRADING_DAYS):
+    """Tagesrendite eines gehebelten Instruments aus den Roh-Returns eines Assets"""
+    daily_cost = ((leverage - 1) * financing_rate + ter) / periods_per_year
+    return np.asarray(asset_returns, dtype=float) * leverage - daily_cost
+
+
+def portfolio_returns(asset_returns, exposures, constant=0.0, out=None):
+    """Portfolio-Returns (Varianten x Tage) = Exposures @ Roh-Returns + Konstante.
+
+    asset_returns ist (Assets x Tage), exposures (Varianten x Assets). out kann
+    ein vorhandener C-zusammenhängender Puffer (Varianten x Tage) sein.
+    """
+    asset_returns = np.asarray(asset_returns, dtype=float)
+    exposures = np.atleast_2d(np.asarray(exposures, dtype=float))
+    if out is None:
+        out = np.empty((exposures.shape[0], asset_returns.shape[1]))
+
+    np.dot(exposures, asset_returns, out=out)
+    out += np.broadcast_to(np.asarray(constant, dtype=float), exposures.shape[:1])[:, None]
+    return out
+
+
+def regime_portfolio_returns(asset_returns, regime, exposures, constant, out=None):
+    """Wie portfolio_returns, aber mit Exposures je Regime-Code.
+
+    exposures ist (Varianten x Codes x Assets), constant (Varianten x Codes),
+    regime der Code je Tag. Pro vorkommendem Code ein Matrixprodukt über seine Tage.
+    """
+    asset_returns = np.asarray(asset_returns, dtype=float)
+    if out is None:
+        out = np.empty((exposures.shape[0], asset_returns.shape[1]))
+
+    for code in np.unique(regime):
+        days = np.flatnonzero(regime == code)
+        out[:, days] = exposures[:, code, :] @ asset_returns[:, days] + constant[:, code][:, None]
+    return out
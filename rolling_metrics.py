@@ -0,0 +1,107 @@
+"""Rollierende Kennzahlen (CAGR, Volatilität, Drawdown) für lange Reihen.
+
+Eingabe sind Portfolio-Werte als (Reihen x Tage). Pro Reihe werden einmal
+Präfixsummen der Log-Werte, der Returns und der quadrierten Returns gebildet;
+jedes Fenster kostet danach O(1) pro Tag. Die Fenster-Maxima für den
+Drawdown kommen aus Block-Präfix-/Suffix-Maxima (van Herk/Gil-Werman), das
+ist O(n) wie eine monotone Deque, läuft aber vektorisiert über alle Reihen.
+
+Ein Fenster von w Tagen umfasst w Returns, also die Werte t-w bis t.
+Tage ohne volles Fenster sind NaN.
+"""
+import numpy as np
+import pandas as pd
+
+import profiling
+
+TRADING_DAYS = 252
+
+# Beschriftung -> Fenster in Handelstagen
+WINDOWS = {'1J': 252, '3J': 756}
+
+METRICS = ('CAGR', 'Volatilität', 'Drawdown')
+
+
+def _prefix(values):
+    """Präfixsumme entlang der Tage mit führender 0"""
+    total = np.zeros((values.shape[0], values.shape[1] + 1))
+    np.cumsum(values, axis=1, out=total[:, 1:])
+    return total
+
+
+def window_max(values, window):
+    """Maximum über die letzten `window` Werte (inkl. t) für jede Reihe; NaN davor"""
+    n_series, n_days = values.shape
+    result = np.full(values.shape, np.nan)
+    if window > n_days:
+        return result
+
+    # Auf ein Vielfaches der Fensterlänge auffüllen
+    n_blocks = -(-n_days // window)
+    padded = np.full((n_series, n_blocks * window), -np.inf)
+    padded[:, :n_days] = values
+    blocks = padded.reshape(n_series, n_blocks, window)
+
+    # Maximum vom Blockanfang bis i bzw. von i bis Blockende
+    from_start = np.maximum.accumulate(blocks, axis=2).reshape(n_series, -1)
+    to_end = np.maximum.accumulate(blocks[:, :, ::-1], axis=2)[:, :, ::-1].reshape(n_series, -1)
+
+    # Fenster [t-window+1, t] = Rest des Blocks von t-window+1 plus Anfang des Blocks von t
+    result[:, window - 1:] = np.maximum(to_end[:, :n_days - window + 1], from_start[:, window - 1:n_days])
+    return result
+
+
+@profiling.traced('metrics')
+def rolling_metrics(values, windows=WINDOWS, periods_per_year=TRADING_DAYS):
+    """Rollierende Kennzahlen für (Reihen x Tage) Portfolio-Werte; 1D wird als eine Reihe behandelt.
+
+    Gibt {Fenster-Name: {Kennzahl: Array (Reihen x Tage)}} zurück.
+    Drawdown ist der Abstand zum Hoch innerhalb des Fensters.
+    """
+    values = np.atleast_2d(np.asarray(values, dtype=float))
+    n_days = values.shape[1]
+
+    log_values = np.log(values)
+    # Returns um den ersten Return zentriert, damit lange Summen genau bleiben
+    returns = values[:, 1:] / values[:, :-1] - 1
+    centered = returns - returns[:, :1]
+    return_sum = _prefix(centered)
+    return_square_sum = _prefix(centered ** 2)
+
+    results = {}
+    for name, window in windows.items():
+        cagr = np.full(values.shape, np.nan)
+        volatility = np.full(values.shape, np.nan)
+        if window < n_days:
+            cagr[:, window:] = np.expm1((log_values[:, window:] - log_values[:, :-window]) * periods_per_year / window)
+
+            # Varianz aus zentrierten Summen: (S2 - S1^2 / w) / (w - 1)
+            s1 = return_sum[:, window:] - return_sum[:, :-window]
+            s2 = return_square_sum[:, window:] - return_square_sum[:, :-window]
+            variance = np.maximum(s2 - s1 ** 2 / window, 0.0) / (window - 1)
+            volatility[:, window:] = np.sqrt(variance * periods_per_year)
+
+        drawdown = np.full(values.shape, np.nan)
+        drawdown[:, window:] = np.expm1(log_values - window_max(log_values, window + 1))[:, window:]
+
+        results[name] = {'CAGR': cagr, 'Volatilität': volatility, 'Drawdown': drawdown}
+    return results
+
+
+def rolling_frame(values, windows=WINDOWS, periods_per_year=TRADING_DAYS):
+    """Rollierende Kennzahlen für eine Series oder einen DataFrame (Spalten = Strategien).
+
+    Werte z.B. aus calculator.trading_strategy_values, der Spalte 'portfolio'
+    von analyze_leveraged_portfolio oder 'Portfolio_value' von
+    simulate_regime_portfolio. Spalten des Ergebnisses: (Strategie, Fenster, Kennzahl).
+    """
+    if isinstance(values, pd.Series):
+        values = values.to_frame(values.name or 'Portfolio')
+
+    results = rolling_metrics(values.to_numpy().T, windows, periods_per_year)
+    columns = {}
+    for row, strategy in enumerate(values.columns):
+        for name, metrics in results.items():
+            for metric in METRICS:
+                columns[(strategy, name, metric)] = metrics[metric][row]
+    return pd.DataFrame(columns, index=values.index)
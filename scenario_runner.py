@@ -0,0 +1,218 @@
+"""Alle Kombinationen von analyze_leveraged_portfolio parallel berechnen.
+
+Der Hauptprozess lädt die Schlusskurse aller Assets einmal auf einen
+gemeinsamen Kalender (Assets x Tage) und legt sie zusammen mit dem MA-Regime
+jedes Assets in Shared Memory. Die Worker hängen sich beim Start ohne Kopie
+an diese Arrays an; eine Aufgabe ist ein (Trading-Asset, Signal-Asset)-Paar
+mit allen Hebeln, Positionen und Richtungen. Zurück kommen nur Records
+(Dictionaries mit Zahlen), keine DataFrames.
+
+Die Kennzahlen entsprechen analyze_leveraged_portfolio: Regime auf dem
+Kalender des Signal-Assets ab dem MA-Fenster, Trading-Asset per Left Join,
+Position ab dem Folgetag, jährliche Rendite über Kalenderjahre.
+
+save_scenarios() schreibt zusätzlich Wertkurve und Regime jeder Kombination
+in einen results_store.
+"""
+import itertools
+import multiprocessing
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+import calendar_align
+import general_performance
+import ma_cache
+import metrics
+import price_store
+import profiling
+import results_store
+import signals
+
+# Regime-Codes im Shared Memory
+NO_SIGNAL = -1
+BELOW_MA = 0
+ABOVE_MA = 1
+
+# Im Worker: Name -> Array (an Shared Memory angehängt), plus die Handles
+_data = {}
+_handles = []
+
+# Parameter und Kennzahlen der Records im results_store
+STORE_PARAMETERS = {'Trading Asset': 'U16', 'Signal Asset': 'U16', 'Hebel': 'f8', 'Position': 'U8',
+                    'Direction': 'U8'}
+STORE_METRICS = ('Finaler Wert', 'Jährliche Rendite', 'Volatilität', 'Max Drawdown', 'Sharpe',
+                 'Buy & Hold Leveraged Rendite')
+
+
+@profiling.traced('align')
+def load_scenario_data(ticker_map=general_performance.TICKER_MAP, ma_window=200, signal=None):
+    """Schlusskurse und MA-Regime aller Assets auf dem gemeinsamen Kalender.
+
+    signal (Definition aus signals) ersetzt den Vergleich mit dem MA-Fenster.
+    """
+    names = list(ticker_map)
+    calendar = calendar_align.ticker_calendar(ticker_map.values())
+
+    close_matrix = np.full((len(names), len(calendar['dates'])), np.nan)
+    regime_matrix = np.full((len(names), len(calendar['dates'])), NO_SIGNAL, dtype=np.int8)
+    for row, ticker in enumerate(ticker_map.values()):
+        rows = calendar['rows'][ticker]
+        close = price_store.get_array(ticker)['Close']
+        close_matrix[row] = calendar_align.gather(close, rows)
+
+        if signal is not None:
+            # Signal-Codes (1/0/-1) entsprechen den Regime-Codes
+            codes = signals.ticker_signals(ticker, [signal])[1][0]
+            regime_matrix[row, rows >= 0] = codes[rows[rows >= 0]]
+            continue
+
+        # Regime auf dem eigenen Kalender, erst ab vollem MA-Fenster
+        ma = ma_cache.ticker_ma(ticker, ma_window).to_numpy()
+        with np.errstate(invalid='ignore'):
+            above = close > ma
+        signal_days = rows >= ma_window - 1
+        regime_matrix[row, signal_days] = above[rows[signal_days]]
+
+    return {
+        'names': names,
+        'dates': calendar['dates'].view(np.int64),
+        'close': close_matrix,
+        'regime': regime_matrix,
+    }
+
+
+def _share(arrays):
+    """Kopiert die Arrays in Shared Memory; gibt (Beschreibung, Handles) zurück"""
+    description, handles = {}, []
+    for key, array in arrays.items():
+        handle = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+        np.ndarray(array.shape, array.dtype, buffer=handle.buf)[...] = array
+        description[key] = (handle.name, array.shape, array.dtype.str)
+        handles.append(handle)
+    return description, handles
+
+
+def _attach(description):
+    """Initializer der Worker: Arrays aus dem Shared Memory ohne Kopie einbinden"""
+    for key, (name, shape, dtype) in description.items():
+        handle = shared_memory.SharedMemory(name=name)
+        _handles.append(handle)
+        _data[key] = np.ndarray(shape, dtype, buffer=handle.buf)
+
+
+def _evaluate_pair(task):
+    """Aufgabe im Worker: Paar auf den Arrays aus dem Shared Memory auswerten"""
+    return evaluate_pair(_data, *task)
+
+
+@profiling.traced('simulate')
+def evaluate_pair(data, trade, signal, leverages, positions, directions, names, curves=False):
+    """Alle Hebel/Positionen/Richtungen für ein (Trading, Signal)-Paar als Records.
+
+    data ist das Ergebnis von load_scenario_data (ohne 'names'), trade und
+    signal sind Zeilen darin.
+    """
+    close = data['close'][trade]
+    regime = data['regime'][signal]
+
+    mask = (regime != NO_SIGNAL) & np.isfinite(close)
+    dates = data['dates'][mask]
+    if len(dates) < 2:
+        return []
+    price = close[mask]
+    above = regime[mask] == ABOVE_MA
+    daily_return = price[1:] / price[:-1] - 1
+    years = (dates[-1] - dates[0]) / (86_400e9 * 365.25)
+
+    combinations = list(itertools.product(positions, directions, leverages))
+    strategy_returns = np.empty((len(combinations), len(daily_return)))
+    leveraged_returns = np.empty_like(strategy_returns)
+    for row, (position, direction, leverage) in enumerate(combinations):
+        invested = above[:-1] if position == 'over' else ~above[:-1]
+        leveraged_returns[row] = (-daily_return if direction == 'short' else daily_return) * leverage
+        strategy_returns[row] = np.where(invested, leveraged_returns[row], 0.0)
+
+    strategy_final = 100 * np.prod(1 + strategy_returns, axis=1)
+    leveraged_final = 100 * np.prod(1 + leveraged_returns, axis=1)
+    strategy_metrics = metrics.compute_metrics(strategy_returns)
+
+    with np.errstate(invalid='ignore'):
+        strategy_annual = (strategy_final / 100) ** (1 / years) - 1
+        leveraged_annual = (leveraged_final / 100) ** (1 / years) - 1
+
+    start, end = pd.to_datetime([dates[0], dates[-1]])
+    records = [
+        {
+            'Trading Asset': names[trade],
+            'Signal Asset': names[signal],
+            'Hebel': leverage,
+            'Position': position,
+            'Direction': direction,
+            'Start': start,
+            'Ende': end,
+            'Finaler Wert': strategy_final[row],
+            'Jährliche Rendite': strategy_annual[row],
+            'Volatilität': strategy_metrics['Volatilität'][row],
+            'Max Drawdown': strategy_metrics['Max Drawdown'][row],
+            'Sharpe': strategy_metrics['Sharpe'][row],
+            'Buy & Hold Leveraged Rendite': leveraged_annual[row],
+        }
+        for row, (position, direction, leverage) in enumerate(combinations)
+    ]
+
+    if curves:
+        # Wertkurven ab 100 am ersten Tag; Kalender und Regime teilen sich alle Records des Paars
+        values = np.empty((len(combinations), len(dates)), dtype=np.float32)
+        values[:, 0] = 100
+        values[:, 1:] = 100 * np.cumprod(1 + strategy_returns, axis=1)
+        calendar = dates.astype('M8[ns]')
+        regime_codes = above.astype(np.int8)
+        for row, record in enumerate(records):
+            record.update({'Kurve': values[row], 'Kalender': calendar, 'Regime': regime_codes})
+    return records
+
+
+def run_scenarios(ticker_map=general_performance.TICKER_MAP, leverages=(1, 2, 3), positions=('over', 'under'),
+                  directions=('long', 'short'), processes=None, ma_window=200, curves=False):
+    """Erzeugt die Records aller Kombinationen, sobald ein Worker ein Paar fertig hat.
+
+    processes=None nutzt alle Kerne. Die Reihenfolge der Records ist nicht festgelegt.
+    curves=True hängt 'Kurve' (float32), 'Kalender' und 'Regime' (int8) an.
+    """
+    data = load_scenario_data(ticker_map, ma_window)
+    names = data.pop('names')
+    tasks = [(trade, signal, tuple(leverages), tuple(positions), tuple(directions), names, curves)
+             for trade, signal in itertools.product(range(len(names)), repeat=2)]
+
+    description, handles = _share(data)
+    try:
+        with multiprocessing.Pool(processes, initializer=_attach, initargs=(description,)) as pool:
+            for records in pool.imap_unordered(_evaluate_pair, tasks):
+                yield from records
+    finally:
+        for handle in handles:
+            handle.close()
+            handle.unlink()
+
+
+def save_scenarios(path, **kwargs):
+    """Schreibt alle Kombinationen mit Kurve und Regime in einen results_store (während sie eintreffen)"""
+    store = results_store.create(path, STORE_PARAMETERS, STORE_METRICS, codes=('Regime',))
+    for record in run_scenarios(curves=True, **kwargs):
+        results_store.append(store, record, record.pop('Kurve'), record.pop('Kalender'),
+                             codes={'Regime': record.pop('Regime')},
+                             metric_values={name: record[name] for name in STORE_METRICS})
+    return store
+
+
+def scenario_table(**kwargs):
+    """Alle Kombinationen als DataFrame, sortiert nach jährlicher Rendite"""
+    table = pd.DataFrame(list(run_scenarios(**kwargs)))
+    return table.sort_values('Jährliche Rendite', ascending=False, ignore_index=True)
+
+
+if __name__ == "__main__":
+    table = scenario_table()
+    print(table.head(20).to_string())
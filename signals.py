@@ -0,0 +1,281 @@
+"""Trend-Signale für viele Parameter auf einmal.
+
+Ein Signal wird als Dictionary beschrieben (oder als Text, siehe parse()):
+    {'type': 'sma', 'window': 200}                     Kurs über SMA
+    {'type': 'ema', 'window': 100}                     Kurs über EMA (span = window)
+    {'type': 'cross', 'fast': 50, 'slow': 200}         schneller über langsamem MA
+    {'type': 'band', 'window': 200, 'band': 0.02}      Hysterese: an über MA * (1 + band),
+                                                       aus unter MA * (1 - band), dazwischen halten
+Optional 'average': 'sma' | 'ema' (für cross/band, Standard 'sma') und
+'confirm': N (ein Wechsel gilt erst nach N gleichen Tagen in Folge).
+
+compute() liefert eine int8-Matrix (Signale x Tage) mit 1 (an), 0 (aus)
+und -1 (noch kein Signal, z.B. während des MA-Fensters). Jeder benötigte
+Durchschnitt wird nur einmal berechnet: alle SMAs über eine Präfixsumme
+(ma_cache), alle EMAs gemeinsam über einen blockweisen rekursiven Filter.
+
+Text-Form (parse/label): 'sma:200', 'ema:100', 'cross:50:200',
+'cross:ema:12:26', 'band:200:0.02', 'band:ema:200:0.02', Bestätigung
+mit '/N', z.B. 'sma:200/3'.
+"""
+import numpy as np
+
+import ma_cache
+
+NO_SIGNAL = -1
+OFF = 0
+ON = 1
+
+TYPES = ('sma', 'ema', 'cross', 'band')
+AVERAGES = ('sma', 'ema')
+
+# Blocklänge des EMA-Filters (Tage je Matrixprodukt)
+EMA_BLOCK = 128
+
+
+def definition(signal):
+    """Normalisiert eine Signal-Beschreibung (Dictionary, Text oder MA-Fenster als Zahl)"""
+    if isinstance(signal, str):
+        return parse(signal)
+    if isinstance(signal, (int, np.integer)):
+        return definition({'type': 'sma', 'window': int(signal)})
+
+    signal = dict(signal)
+    if signal.get('type') not in TYPES:
+        raise ValueError(f"Unbekannter Signal-Typ {signal.get('type')!r}. Erlaubt: {TYPES}")
+    if signal['type'] in ('cross', 'band') and signal.setdefault('average', 'sma') not in AVERAGES:
+        raise ValueError(f"Unbekannter Durchschnitt {signal['average']!r}. Erlaubt: {AVERAGES}")
+    if signal['type'] == 'cross' and not 0 < signal['fast'] < signal['slow']:
+        raise ValueError(f"cross: 'fast' muss kleiner als 'slow' sein ({signal['fast']}/{signal['slow']})")
+    if signal['type'] == 'band' and signal['band'] < 0:
+        raise ValueError(f"band: Bandbreite muss >= 0 sein ({signal['band']})")
+    if signal['type'] != 'cross' and signal['window'] < 1:
+        raise ValueError(f"{signal['type']}: Fenster muss >= 1 sein ({signal['window']})")
+    if signal.setdefault('confirm', 1) < 1:
+        raise ValueError(f"Bestätigung muss >= 1 Tag sein ({signal['confirm']})")
+    return signal
+
+
+def parse(text):
+    """Signal aus der Text-Form, z.B. 'cross:ema:12:26/2'"""
+    text, _, confirm = text.strip().lower().partition('/')
+    kind, *fields = text.split(':')
+    average = fields.pop(0) if fields and fields[0] in AVERAGES and kind in ('cross', 'band') else 'sma'
+    try:
+        if kind in ('sma', 'ema') and len(fields) == 1:
+            signal = {'type': kind, 'window': int(fields[0])}
+        elif kind == 'cross' and len(fields) == 2:
+            signal = {'type': kind, 'fast': int(fields[0]), 'slow': int(fields[1]), 'average': average}
+        elif kind == 'band' and len(fields) == 2:
+            signal = {'type': kind, 'window': int(fields[0]), 'band': float(fields[1]), 'average': average}
+        else:
+            raise ValueError
+        if confirm:
+            signal['confirm'] = int(confirm)
+    except ValueError:
+        raise ValueError(f"Ungültiges Signal {text!r}, z.B. 'sma:200', 'cross:50:200', 'band:200:0.02/2'") from None
+    return definition(signal)
+
+
+def label(signal):
+    """Text-Form eines Signals (Umkehrung von parse)"""
+    signal = definition(signal)
+    kind = signal['type']
+    prefix = f"{kind}:{signal['average']}" if kind in ('cross', 'band') and signal['average'] != 'sma' else kind
+    if kind == 'cross':
+        text = f"{prefix}:{signal['fast']}:{signal['slow']}"
+    elif kind == 'band':
+        text = f"{prefix}:{signal['window']}:{signal['band']:g}"
+    else:
+        text = f"{prefix}:{signal['window']}"
+    return text + (f"/{signal['confirm']}" if signal['confirm'] > 1 else '')
+
+
+def warmup(signal):
+    """Tage, bis das Signal zum ersten Mal definiert sein kann (längstes MA-Fenster)"""
+    signal = definition(signal)
+    return signal['slow'] if signal['type'] == 'cross' else signal['window']
+
+
+# ---------------------------------------------------------------------------
+# Durchschnitte
+# ---------------------------------------------------------------------------
+
+def sma(values, windows, prefix=None):
+    """SMAs für mehrere Fenster (Fenster x Tage), NaN bis zum vollen Fenster"""
+    if prefix is None:
+        prefix = ma_cache.prefix_sums(values)
+    return ma_cache.moving_average(prefix, np.atleast_1d(windows))
+
+
+def ema(values, windows, block=EMA_BLOCK):
+    """EMAs für mehrere Spans (Spans x Tage), wie pandas ewm(span, adjust=False).mean().
+
+    Die Rekursion y[t] = a * x[t] + (1 - a) * y[t-1] wird blockweise gelöst:
+    innerhalb eines Blocks als ein Matrixprodukt für alle Blöcke und Spans
+    (Startwert 0), danach wird nur der Übertrag am Blockende fortgeschrieben
+    (eine Schleife über T / block Blöcke). Start ist der erste gültige Kurs;
+    fehlende Kurse danach werden mit dem Vortag gefüllt. Bis zum vollen
+    Fenster (span Tage) ist der EMA NaN, wie beim SMA.
+    """
+    values = np.asarray(values, dtype=float)
+    windows = np.atleast_1d(np.asarray(windows, dtype=np.int64))
+    result = np.full((len(windows), len(values)), np.nan)
+    valid = np.flatnonzero(~np.isnan(values))
+    if len(valid) == 0:
+        return result
+
+    # Ab dem ersten gültigen Kurs, Lücken mit dem letzten Kurs füllen
+    first = valid[0]
+    x = values[first:]
+    filled = np.where(np.isnan(x), 0, np.arange(len(x)))
+    np.maximum.accumulate(filled, out=filled)
+    x = x[filled]
+
+    n = len(x)
+    n_blocks = -(-n // block)
+    padded = np.zeros(n_blocks * block)
+    padded[:n] = x - x[0]  # um den Startwert verschoben: Startzustand 0
+    blocks = padded.reshape(n_blocks, block)
+
+    alpha = 2.0 / (windows + 1.0)
+    decay = 1.0 - alpha
+    lag = np.arange(block)[:, None] - np.arange(block)[None, :]
+    # Gewichte (Spans x Block x Block): a * d^(k-j) für j <= k
+    with np.errstate(under='ignore'):
+        kernel = np.where(lag >= 0, alpha[:, None, None] * decay[:, None, None] ** np.maximum(lag, 0), 0.0)
+        carry_weight = decay[:, None] ** (np.arange(block) + 1)[None, :]
+
+    local = np.einsum('skj,nj->snk', kernel, blocks)
+
+    # Übertrag von Block zu Block
+    carry = np.zeros(len(windows))
+    for b in range(n_blocks):
+        local[:, b] += carry_weight * carry[:, None]
+        carry = local[:, b, -1]
+
+    result[:, first:] = local.reshape(len(windows), -1)[:, :n] + x[0]
+    days = np.arange(len(values))[None, :] - first + 1
+    result[days < windows[:, None]] = np.nan
+    return result
+
+
+def averages(values, keys, prefix=None):
+    """Durchschnitte für (Art, Fenster)-Paare; jede Art wird in einem Aufruf berechnet"""
+    keys = list(dict.fromkeys(keys))
+    result = {}
+    sma_windows = [window for kind, window in keys if kind == 'sma']
+    if sma_windows:
+        result.update(zip([('sma', window) for window in sma_windows], sma(values, sma_windows, prefix)))
+    ema_windows = [window for kind, window in keys if kind == 'ema']
+    if ema_windows:
+        result.update(zip([('ema', window) for window in ema_windows], ema(values, ema_windows)))
+    return result
+
+
+# ---------------------------------------------------------------------------
+# Signale
+# ---------------------------------------------------------------------------
+
+def above(values, reference):
+    """Codes 1/0, wenn values über/nicht über reference; -1 wo einer fehlt"""
+    values, reference = np.broadcast_arrays(np.asarray(values, dtype=float), np.asarray(reference, dtype=float))
+    with np.errstate(invalid='ignore'):
+        codes = (values > reference).astype(np.int8)
+    codes[np.isnan(values) | np.isnan(reference)] = NO_SIGNAL
+    return codes
+
+
+def hysteresis(values, reference, bands):
+    """Band-Signale (Zeilen x Tage): an über reference * (1 + band), aus unter reference * (1 - band).
+
+    Dazwischen gilt der letzte Zustand; am ersten Tag mit reference zählt
+    der einfache Vergleich.
+    """
+    values = np.asarray(values, dtype=float)
+    reference = np.atleast_2d(reference)
+    bands = np.asarray(bands, dtype=float).reshape(-1, 1)
+    plain = above(values, reference)
+
+    with np.errstate(invalid='ignore'):
+        events = np.where(values > reference * (1 + bands), ON,
+                          np.where(values < reference * (1 - bands), OFF, NO_SIGNAL)).astype(np.int8)
+    defined = plain != NO_SIGNAL
+    first_day = np.concatenate([defined[:, :1], defined[:, 1:] & ~defined[:, :-1]], axis=1)
+    events = np.where(first_day & (events == NO_SIGNAL), plain, events)
+    events[~defined] = NO_SIGNAL
+
+    # Letztes Ereignis je Tag (Forward-Fill), nur solange reference vorliegt
+    index = np.broadcast_to(np.arange(values.shape[-1]), events.shape)
+    last = np.where(events != NO_SIGNAL, index, -1)
+    np.maximum.accumulate(last, axis=1, out=last)
+    state = np.take_along_axis(events, np.maximum(last, 0), axis=1)
+    state[(last < 0) | ~defined] = NO_SIGNAL
+    return state
+
+
+def confirm(codes, days):
+    """N-Tage-Bestätigung je Zeile: ein Zustand gilt erst, wenn er `days` Tage in Folge vorliegt.
+
+    Bis zur ersten Bestätigung -1. Anders als regime_engine.confirmed_regime
+    ohne Verschiebung auf den Folgetag.
+    """
+    codes = np.atleast_2d(codes)
+    days = np.broadcast_to(np.asarray(days).reshape(-1, 1), (codes.shape[0], 1))
+    index = np.broadcast_to(np.arange(codes.shape[1]), codes.shape)
+
+    run_start = np.zeros(codes.shape, dtype=np.intp)
+    run_start[:, 1:] = np.where(codes[:, 1:] != codes[:, :-1], index[:, 1:], 0)
+    np.maximum.accumulate(run_start, axis=1, out=run_start)
+    confirmed = (index - run_start + 1 >= days) & (codes != NO_SIGNAL)
+
+    last = np.where(confirmed, index, -1)
+    np.maximum.accumulate(last, axis=1, out=last)
+    state = np.take_along_axis(codes, np.maximum(last, 0), axis=1)
+    state[last < 0] = NO_SIGNAL
+    return state
+
+
+def compute(values, signals, prefix=None):
+    """Signal-Matrix (Signale x Tage) als int8-Codes für eine Kursreihe.
+
+    Gleiche Durchschnitte werden zwischen den Signalen geteilt, Band-Signale
+    und Bestätigungen laufen jeweils in einem Aufruf für alle Zeilen.
+    """
+    values = np.asarray(values, dtype=float)
+    signals = [definition(signal) for signal in signals]
+
+    keys = []
+    for signal in signals:
+        if signal['type'] in ('sma', 'ema'):
+            keys.append((signal['type'], signal['window']))
+        elif signal['type'] == 'cross':
+            keys += [(signal['average'], signal['fast']), (signal['average'], signal['slow'])]
+        else:
+            keys.append((signal['average'], signal['window']))
+    ma = averages(values, keys, prefix)
+
+    codes = np.empty((len(signals), len(values)), dtype=np.int8)
+    band_rows = []
+    for row, signal in enumerate(signals):
+        if signal['type'] in ('sma', 'ema'):
+            codes[row] = above(values, ma[(signal['type'], signal['window'])])
+        elif signal['type'] == 'cross':
+            codes[row] = above(ma[(signal['average'], signal['fast'])], ma[(signal['average'], signal['slow'])])
+        else:
+            band_rows.append(row)
+
+    if band_rows:
+        reference = np.stack([ma[(signals[row]['average'], signals[row]['window'])] for row in band_rows])
+        codes[band_rows] = hysteresis(values, reference, [signals[row]['band'] for row in band_rows])
+
+    confirm_rows = [row for row, signal in enumerate(signals) if signal['confirm'] > 1]
+    if confirm_rows:
+        codes[confirm_rows] = confirm(codes[confirm_rows], [signals[row]['confirm'] for row in confirm_rows])
+    return codes
+
+
+def ticker_signals(ticker, signals, field='Close'):
+    """Signal-Matrix über die gesamte Historie eines Tickers; gibt (Datumsindex, Codes) zurück"""
+    entry = ma_cache.ticker_prefix(ticker, field)
+    return entry['index'], compute(entry['values'], signals, entry['prefix'])
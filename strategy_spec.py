@@ -0,0 +1,274 @@
+"""Deklarative Regime-Strategien.
+
+Eine Strategie wird als Dictionary beschrieben. compile_spec() übersetzt sie
+in eine Gewichtsmatrix (Regime x Instrumente), evaluate_specs() rechnet
+beliebig viele Specs mit denselben Daten in einem Durchgang.
+
+Aufbau einer Spec:
+    'assets':            {Name: Ticker}, das erste Asset bestimmt den Kalender
+    'signals':           {Asset: MA-Fenster oder Signal aus dem Modul signals, z.B. 'ema:100'}
+    'regime_signals':    Signale, aus denen das Regime gebildet wird (erstes = höchstes Bit)
+    'confirmation_days': Tage, die ein Regime anliegen muss, bevor gewechselt wird
+    'instruments':       {Name: (Asset, Hebel)}, dazu immer 'Cash'
+    'cash_rate':         tägliche Rendite von 'Cash'
+    'financing_rate':    optional, jährliche Finanzierungskosten des Hebels (auf L - 1)
+    'ter':               optional, jährliche Kosten je Instrument
+    'regimes':           {Name: {'when': {Signal: bool}, 'weights': {Instrument: Gewicht}}}
+    'overlays':          [{'instrument', 'weight', 'signal', 'column'}]: solange das Signal
+                         über seinem MA liegt, fließt 'weight' in das Instrument, der Rest
+                         in das Regime-Portfolio
+
+Instrumente werden nicht als eigene Spalten angelegt: Gewichte, Hebel und
+Kosten werden zu Exposures je Asset zusammengefasst (return_kernel).
+"""
+import numpy as np
+import pandas as pd
+
+import calendar_align
+import ma_cache
+import price_store
+import profiling
+import regime_engine
+import return_kernel
+import signals
+
+
+def compile_spec(spec):
+    """Übersetzt eine Spec in Gewichtsmatrix, Regime-Namen und Overlays"""
+    regime_signals = list(spec['regime_signals'])
+    n_codes = 2 ** len(regime_signals)
+    columns = list(spec['instruments']) + ['Cash']
+
+    # Zeilen: Regime-Codes plus Startzustand, Spalten: Instrumente plus Cash
+    weights = np.zeros((n_codes + 1, len(columns)))
+    regime_names = [f'Regime_{code}' for code in range(n_codes)] + ['Initial']
+
+    for name, regime in spec['regimes'].items():
+        when = regime['when']
+        if set(when) != set(regime_signals):
+            raise ValueError(f"Regime {name}: 'when' muss genau die Signale {regime_signals} festlegen")
+        code = 0
+        for signal in regime_signals:
+            code = 2 * code + bool(when[signal])
+        regime_names[code] = name
+
+        for instrument, weight in regime['weights'].items():
+            if instrument not in columns:
+                raise ValueError(f"Regime {name}: unbekanntes Instrument {instrument}")
+            if instrument == 'Cash':
+                weight = weight * spec['cash_rate']
+            weights[code, columns.index(instrument)] = weight
+
+    overlays = []
+    for overlay in spec.get('overlays', []):
+        if overlay['instrument'] not in spec['instruments']:
+            raise ValueError(f"Overlay: unbekanntes Instrument {overlay['instrument']}")
+        overlays.append(dict(overlay))
+
+    # Exposures je Asset und tägliche Konstante (Cash-Rendite minus Kosten) je Regime
+    asset_names = list(spec['assets'])
+    exposures, constant = return_kernel.fold_weights(
+        weights[:, :-1],
+        [leverage for _, leverage in spec['instruments'].values()],
+        [asset_names.index(asset) for asset, _ in spec['instruments'].values()],
+        len(asset_names),
+        cash_weight=weights[:, -1],
+        cash_rate=1.0,  # Cash-Gewicht enthält die Rate bereits
+        financing_rate=spec.get('financing_rate', 0.0),
+        ter=spec.get('ter', 0.0),
+    )
+
+    return {
+        'spec': spec,
+        'columns': columns,
+        'weights': weights,
+        'exposures': exposures,
+        'constant': constant,
+        'regime_names': np.array(regime_names),
+        'initial': n_codes,
+        'overlays': overlays,
+    }
+
+
+def data_key(spec):
+    """Alles, was Daten und Regime-Folge bestimmt (Specs mit gleichem Key sind gemeinsam auswertbar)"""
+    return (
+        tuple(spec['assets'].items()),
+        tuple((name, signals.label(signal)) for name, signal in spec['signals'].items()),
+        tuple(spec['regime_signals']),
+        spec.get('confirmation_days', 2),
+        tuple(spec['instruments'].items()),
+        tuple((overlay['instrument'], overlay['signal']) for overlay in spec.get('overlays', [])),
+    )
+
+
+@profiling.traced('align')
+def load_data(spec):
+    """Kurse, MAs, Signale und Instrument-Returns auf dem Kalender des ersten Assets"""
+    tickers = list(spec['assets'].values())
+    joined = calendar_align.join(calendar_align.ticker_calendar(tickers), 'native', base=tickers[0])
+    df = pd.DataFrame(index=pd.DatetimeIndex(joined['dates'], name='Date'))
+
+    # MAs (bzw. Signale) auf der eigenen Historie des Assets berechnen
+    for name, ticker in spec['assets'].items():
+        rows = joined['rows'][ticker]
+        df[name] = calendar_align.gather(price_store.get_array(ticker)['Close'], rows)
+        signal = spec['signals'].get(name)
+        if isinstance(signal, (int, np.integer)):
+            ma = ma_cache.ticker_ma(ticker, signal)
+            df[f"{name}_MA{signal}"] = calendar_align.gather(ma, rows)
+        elif signal is not None:
+            # 1.0/0.0, NaN solange das Signal noch nicht definiert ist
+            codes = signals.ticker_signals(ticker, [signal])[1][0]
+            df[f'{name}_signal'] = calendar_align.gather(np.where(codes == signals.NO_SIGNAL, np.nan, codes), rows)
+
+    # Signal bestimmen (True wenn über MA bzw. Signal an)
+    for name, signal in spec['signals'].items():
+        if isinstance(signal, (int, np.integer)):
+            df[f'{name}_above_MA'] = df[name] > df[f'{name}_MA{signal}']
+        else:
+            df[f'{name}_above_MA'] = df[f'{name}_signal'] == signals.ON
+
+    # Returns von gemeinsamem Tag zu gemeinsamem Tag (Tage, an denen ein Asset fehlt, fallen unten weg)
+    joint = df[list(spec['assets'])].notna().all(axis=1)
+    for name in spec['assets']:
+        df[f'{name}_return'] = df.loc[joint, name].pct_change()
+
+    # Erste Tage (längstes MA-Fenster) und Tage mit NaN entfernen
+    return df.iloc[max(signals.warmup(signal) for signal in spec['signals'].values()):].dropna()
+
+
+@profiling.traced('simulate')
+def evaluate_specs(specs, df=None):
+    """Tägliche Portfolio-Returns für mehrere Specs (Specs x Tage).
+
+    Alle Specs müssen denselben data_key haben; sie unterscheiden sich nur in
+    Gewichten, Cash-Rendite und Overlay-Gewichten. Pro Regime wird eine
+    Matrixmultiplikation über alle Specs ausgeführt.
+    """
+    compiled = [compile_spec(spec) for spec in specs]
+    base = compiled[0]['spec']
+    if any(data_key(c['spec']) != data_key(base) for c in compiled):
+        raise ValueError("Alle Specs müssen dieselben Assets, Signale, Instrumente und Overlays verwenden")
+
+    if df is None:
+        df = load_data(base)
+
+    initial = compiled[0]['initial']
+    with profiling.stage('signal', step='strategy_spec.evaluate_specs'):
+        codes = regime_engine.encode_regime(*(df[f'{signal}_above_MA'] for signal in base['regime_signals']))
+        regime = regime_engine.confirmed_regime(codes, initial=initial, days=base.get('confirmation_days', 2))
+
+    # Roh-Returns (Assets x Tage); Hebel, Gewichte und Kosten stecken in den Exposures
+    asset_returns = np.vstack([df[f'{name}_return'].to_numpy(dtype=float) for name in base['assets']])
+    portfolio_return = return_kernel.regime_portfolio_returns(
+        asset_returns, regime,
+        np.stack([c['exposures'] for c in compiled]),
+        np.stack([c['constant'] for c in compiled]),
+    )
+
+    # Overlays nach dem heutigen Signal (nicht am ersten Tag)
+    overlay_active = {}
+    if compiled[0]['overlays']:
+        remaining_allocation = np.ones_like(portfolio_return)
+        overlay_return = np.zeros_like(portfolio_return)
+        for j, overlay in enumerate(compiled[0]['overlays']):
+            active = df[f"{overlay['signal']}_above_MA"].to_numpy(dtype=bool).copy()
+            active[0] = False
+            overlay_active[overlay.get('column', overlay['instrument'])] = active
+
+            overlay_weight = np.array([c['overlays'][j]['weight'] for c in compiled])[:, None]
+            allocation = np.where(active, overlay_weight, 0.0)
+            remaining_allocation -= allocation
+
+            asset, leverage = base['instruments'][overlay['instrument']]
+            instrument_return = np.vstack([
+                return_kernel.instrument_returns(asset_returns[list(base['assets']).index(asset)], leverage,
+                                                 c['spec'].get('financing_rate', 0.0), c['spec'].get('ter', 0.0))
+                for c in compiled
+            ])
+            overlay_return += allocation * instrument_return
+        portfolio_return = remaining_allocation * portfolio_return + overlay_return
+
+    # Initial regime: keine Rendite
+    portfolio_return[:, regime == initial] = 0.0
+
+    return {
+        'returns': portfolio_return,
+        'regime': regime,
+        'regime_names': compiled[0]['regime_names'],
+        'overlay_active': overlay_active,
+        'data': df,
+    }
+
+
+def sweep_signals(spec, asset, candidates, df=None):
+    """Regime-Returns einer Spec für viele Signale eines Assets (Signale x Tage).
+
+    Die Daten werden einmal geladen und alle Kandidaten in einer
+    Signal-Matrix auf der Historie des Assets berechnet; je Kandidat läuft nur
+    noch die Regime-Auswertung. Ausgewertet wird ab dem ersten Tag, an dem
+    alle Kandidaten ein Signal haben.
+    """
+    if df is None:
+        df = load_data(spec)
+    candidates = [signals.definition(candidate) for candidate in candidates]
+    with profiling.stage('signal', step='strategy_spec.sweep_signals', signals=len(candidates)):
+        dates, codes = signals.ticker_signals(spec['assets'][asset], candidates)
+        codes = codes[:, dates.get_indexer(df.index)]
+        defined = (codes != signals.NO_SIGNAL).all(axis=0)
+        df = df[defined]
+
+    returns, regimes = [], []
+    for row in codes[:, defined]:
+        evaluation = evaluate_specs([spec], df.assign(**{f'{asset}_above_MA': row == signals.ON}))
+        returns.append(evaluation['returns'][0])
+        regimes.append(evaluation['regime'])
+
+    return {
+        'signals': [signals.label(candidate) for candidate in candidates],
+        'returns': np.array(returns).reshape(len(candidates), len(df)),
+        'regime': np.array(regimes).reshape(len(candidates), len(df)),
+        'data': df,
+    }
+
+
+def simulate(spec, df=None):
+    """Wertet eine einzelne Spec aus und hängt Returns, Regime und Overlays an die Daten an"""
+    evaluation = evaluate_specs([spec], df)
+    df = evaluation['data'].copy()
+
+    df['Portfolio_return'] = evaluation['returns'][0]
+    df['Regime'] = evaluation['regime_names'][evaluation['regime']]
+    for column, active in evaluation['overlay_active'].items():
+        df[column] = np.where(active, 'Yes', 'No')
+
+    # Portfolio-Wert berechnen
+    df['Portfolio_value'] = 100 * (1 + df['Portfolio_return']).cumprod()
+    return df
+
+
+@profiling.traced('metrics')
+def summarize(df):
+    """Performance und Regime-Verteilung einer simulierten Strategie"""
+    # Performance Metriken berechnen
+    years = (df.index[-1] - df.index[0]).days / 365.25
+    final_value = df['Portfolio_value'].iloc[-1]
+    annual_return = (final_value / 100) ** (1 / years) - 1
+
+    # Regime-Statistiken berechnen
+    regime_stats = df['Regime'].value_counts()
+    regime_percentages = regime_stats / len(df) * 100
+
+    return {
+        'Performance': {
+            'Finaler Portfolio-Wert': round(final_value, 2),
+            'Jährliche Rendite': f"{round(annual_return * 100, 2)}%",
+            'Analysezeitraum': f"{df.index[0].strftime('%Y-%m-%d')} bis {df.index[-1].strftime('%Y-%m-%d')}",
+            'Anzahl Tage': len(df)
+        },
+        'Regime-Verteilung': {
+            regime: f"{percentage:.1f}%"
+            for regime, percentage in regime_percentages.items()
+        }
+    }
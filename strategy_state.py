@@ -0,0 +1,341 @@
+"""Inkrementeller Tagesbetrieb: Strategie-Zustand um einen Kurs-Tag fortschreiben.
+
+Statt täglich die komplette Historie neu zu rechnen, wird der Zustand einmal
+aus der Historie aufgebaut (init_*_state), als JSON gespeichert und danach mit
+update(state, new_bar) in O(1) pro Tag fortgeschrieben. verify(state) rechnet
+zur Kontrolle die komplette Historie nach und vergleicht.
+
+Ein Bar ist ein Dictionary mit 'Date' und einem Schlusskurs je Asset:
+    calculate_trading_strategy:  {'Date', 'index', 'gold'}
+    Regime-Strategien (Spec):    {'Date', <Asset-Name aus spec['assets']>, ...}
+Assets ohne Kurs an dem Tag fehlen im Bar. Wie in calculator.strategy_frames
+und strategy_spec.load_data läuft jedes MA auf dem eigenen Kalender seines
+Assets: jeder Kurs schreibt das MA-Fenster fort. Position, Regime und
+Portfolio-Wert rücken wie in den vollständigen Engines nur an gemeinsamen
+Tagen (alle Assets mit Kurs) vor, Returns laufen von gemeinsamem Tag zu
+gemeinsamem Tag. 'last_date' ist der letzte gemeinsame Tag, 'last_bar_date'
+der letzte verarbeitete Bar.
+"""
+import json
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+import calculator
+import calendar_align
+import price_store
+import regime_engine
+import return_kernel
+import strategy_spec
+
+
+def _missing(value):
+    return value is None or (isinstance(value, float) and np.isnan(value))
+
+
+def _last_closes(ticker, until, count):
+    """Die letzten `count` Schlusskurse eines Tickers bis einschließlich `until` (eigener Kalender)"""
+    array = price_store.get_array(ticker)
+    end = np.searchsorted(array['Date'], pd.Timestamp(until).to_datetime64(), side='right')
+    return [float(price) for price in array['Close'][max(0, end - count):end]]
+
+
+def _bars(tickers, start):
+    """Bars ab `start` auf der Vereinigung der Kalender ({Name: Ticker}); fehlende Kurse fehlen im Bar"""
+    price_store.update_many(tickers.values())
+    calendar = calendar_align.ticker_calendar(tickers.values())
+    first = np.searchsorted(calendar['dates'], pd.Timestamp(start).to_datetime64())
+    closes = {name: calendar_align.gather(price_store.get_array(ticker)['Close'], calendar['rows'][ticker][first:])
+              for name, ticker in tickers.items()}
+    for day, date in enumerate(calendar['dates'][first:]):
+        bar = {'Date': pd.Timestamp(date)}
+        bar.update({name: float(close[day]) for name, close in closes.items() if not np.isnan(close[day])})
+        yield bar
+
+
+def _push_price(window, window_sum, price, size):
+    """Schiebt einen Kurs in das MA-Fenster, gibt (neue Summe, MA oder NaN) zurück"""
+    window.append(price)
+    window_sum += price
+    if len(window) > size:
+        window_sum -= window.popleft()
+    return window_sum, (window_sum / size if len(window) == size else np.nan)
+
+
+# ---------------------------------------------------------------------------
+# calculate_trading_strategy
+# ---------------------------------------------------------------------------
+
+def init_trading_state(index='S&P 500', tax_rate=0.25, lev=1, which_lev='both', ma_window=200, until=None):
+    """Zustand von calculate_trading_strategy nach dem letzten Tag bis `until`"""
+    index_data, gold_data = calculator.load_strategy_prices(index)
+    if until is not None:
+        index_data = index_data.loc[:until]
+        gold_data = gold_data.loc[:until]
+
+    df = calculator.build_strategy_frame(index_data, gold_data, lev, which_lev, ma_window)
+    in_gold, index_lev, gold_lev = calculator._position_arrays(df)
+    values = calculator.portfolio_values_vectorized(in_gold, index_lev, gold_lev, tax_rate)
+
+    # Steuerbasis: Wert direkt nach dem letzten Regimewechsel
+    switches = np.flatnonzero(in_gold[1:] != in_gold[:-1]) + 1
+    last_regime_change_value = values[switches[-1]] if len(switches) else values[0]
+
+    # MA-Fenster auf dem Kalender des Index (wie ma_cache.rolling_mean in build_strategy_frame)
+    window = _last_closes(calculator.INDEX_TICKERS[index], df.index[-1], ma_window)
+    return {
+        'kind': 'trading_strategy',
+        'params': {'index': index, 'tax_rate': tax_rate, 'lev': lev, 'which_lev': which_lev,
+                   'ma_window': ma_window},
+        'last_date': df.index[-1].strftime('%Y-%m-%d'),
+        'last_bar_date': df.index[-1].strftime('%Y-%m-%d'),
+        'days': len(df),
+        'last_prices': {'index': float(df['index_price'].iloc[-1]), 'gold': float(df['gold_price'].iloc[-1])},
+        'ma_window': window,
+        'ma_sum': float(sum(window)),
+        'position': df['position'].iloc[-1],
+        'signal': df['ma_signal'].iloc[-1],
+        'last_regime_change_value': float(last_regime_change_value),
+        'portfolio_value': float(values[-1]),
+    }
+
+
+def update_trading_state(state, new_bar):
+    """Ein Kurs-Tag für calculate_trading_strategy"""
+    index_price, gold_price = new_bar.get('index'), new_bar.get('gold')
+    if _missing(index_price) and _missing(gold_price):
+        return state
+    params = state['params']
+    state['last_bar_date'] = pd.Timestamp(new_bar['Date']).strftime('%Y-%m-%d')
+
+    # MA auf dem Kalender des Index fortschreiben
+    if not _missing(index_price):
+        window = deque(state['ma_window'])
+        state['ma_sum'], ma = _push_price(window, state['ma_sum'], index_price, params['ma_window'])
+        state['ma_window'] = list(window)
+
+    # Position, Steuer und Signal nur an Tagen mit Index- und Goldkurs
+    if _missing(index_price) or _missing(gold_price):
+        return state
+
+    lev = params['lev']
+    index_return = index_price / state['last_prices']['index'] - 1
+    gold_return = gold_price / state['last_prices']['gold'] - 1
+    index_lev = index_return * lev if params['which_lev'] in ['index', 'both'] else index_return
+    gold_lev = gold_return * lev if params['which_lev'] in ['gold', 'both'] else gold_return
+
+    # Heute gilt das Signal von gestern
+    current_position = state['signal']
+    daily_return = gold_lev if current_position == 'gold' else index_lev
+    new_value = state['portfolio_value'] * (1 + daily_return)
+
+    # Steuer bei Regimewechsel
+    if current_position != state['position']:
+        gain = new_value - state['last_regime_change_value']
+        if gain > 0:
+            new_value -= gain * params['tax_rate']
+        state['last_regime_change_value'] = new_value
+
+    # Signal für den nächsten gemeinsamen Tag
+    state['signal'] = 'gold' if index_price < ma else 'index'
+    state['position'] = current_position
+    state['portfolio_value'] = new_value
+    state['last_prices'] = {'index': index_price, 'gold': gold_price}
+    state['last_date'] = pd.Timestamp(new_bar['Date']).strftime('%Y-%m-%d')
+    state['days'] += 1
+    return state
+
+
+def verify_trading_state(state, rtol=1e-9):
+    """Vergleicht den Zustand mit einer kompletten Neuberechnung bis state['last_date']"""
+    params = state['params']
+    replay = init_trading_state(params['index'], params['tax_rate'], params['lev'], params['which_lev'],
+                                params['ma_window'], until=state['last_date'])
+    for key in ['position', 'signal', 'days', 'last_date']:
+        if replay[key] != state[key]:
+            raise AssertionError(f"{key}: inkrementell {state[key]!r}, Neuberechnung {replay[key]!r}")
+    for key in ['portfolio_value', 'last_regime_change_value']:
+        if not np.isclose(state[key], replay[key], rtol=rtol, atol=0):
+            raise AssertionError(f"{key}: inkrementell {state[key]}, Neuberechnung {replay[key]}")
+    return replay
+
+
+def trading_bars_after(state):
+    """Neue Bars aus dem price_store, je Datum mit Index- und/oder Goldkurs"""
+    start = pd.Timestamp(state.get('last_bar_date', state['last_date'])) + pd.Timedelta(days=1)
+    return _bars({'index': calculator.INDEX_TICKERS[state['params']['index']], 'gold': 'GC=F'}, start)
+
+
+# ---------------------------------------------------------------------------
+# Regime-Strategien aus strategy_spec (simulate_regime_portfolio)
+# ---------------------------------------------------------------------------
+
+def _json_spec(spec):
+    """Spec mit Listen statt Tupeln (so wie sie nach dem Laden aus JSON aussieht)"""
+    return json.loads(json.dumps(spec))
+
+
+def init_regime_state(spec, until=None):
+    """Zustand einer Regime-Strategie nach dem letzten Tag bis `until`"""
+    spec = _json_spec(spec)
+    if not all(isinstance(window, int) for window in spec['signals'].values()):
+        raise ValueError("Der fortlaufende Zustand unterstützt nur MA-Fenster als Signale")
+    df = strategy_spec.load_data(spec)
+    if until is not None:
+        df = df.loc[:until]
+
+    evaluation = strategy_spec.evaluate_specs([spec], df)
+    compiled = strategy_spec.compile_spec(spec)
+    days = spec.get('confirmation_days', 2)
+
+    # Regime nach dem letzten Tag: letzter Code, falls lange genug bestätigt
+    codes = regime_engine.encode_regime(*(df[f'{signal}_above_MA'] for signal in spec['regime_signals']))
+    run_length = 1
+    while run_length < len(codes) and codes[-1 - run_length] == codes[-1]:
+        run_length += 1
+    regime = int(codes[-1]) if run_length >= days else int(evaluation['regime'][-1])
+
+    # MA-Fenster aus der eigenen Historie jedes Assets
+    windows = {asset: _last_closes(spec['assets'][asset], df.index[-1], window)
+               for asset, window in spec['signals'].items()}
+
+    return {
+        'kind': 'regime_portfolio',
+        'spec': spec,
+        'last_date': df.index[-1].strftime('%Y-%m-%d'),
+        'last_bar_date': df.index[-1].strftime('%Y-%m-%d'),
+        'days': len(df),
+        'last_prices': {asset: float(df[asset].iloc[-1]) for asset in spec['assets']},
+        'ma_windows': windows,
+        'ma_sums': {asset: float(sum(window)) for asset, window in windows.items()},
+        'above': {asset: bool(df[f'{asset}_above_MA'].iloc[-1]) for asset in spec['signals']},
+        'last_code': int(codes[-1]),
+        'run_length': run_length,
+        'regime': regime,
+        'regime_name': str(compiled['regime_names'][regime]),
+        'portfolio_value': float(100 * np.prod(1 + evaluation['returns'][0])),
+    }
+
+
+def update_regime_state(state, new_bar):
+    """Ein Kurs-Tag für eine Regime-Strategie"""
+    spec = state['spec']
+    compiled = strategy_spec.compile_spec(spec)
+    present = [asset for asset in spec['assets'] if not _missing(new_bar.get(asset))]
+    state['last_bar_date'] = pd.Timestamp(new_bar['Date']).strftime('%Y-%m-%d')
+
+    # MA-Fenster der vorhandenen Assets fortschreiben
+    for asset in present:
+        if asset in spec['signals']:
+            window = deque(state['ma_windows'][asset])
+            state['ma_sums'][asset], ma = _push_price(window, state['ma_sums'][asset], new_bar[asset],
+                                                      spec['signals'][asset])
+            state['ma_windows'][asset] = list(window)
+            state['above'][asset] = bool(new_bar[asset] > ma)
+
+    # Portfolio-Schritt nur an Tagen, an denen alle Assets einen Kurs haben
+    if len(present) < len(spec['assets']):
+        return state
+
+    asset_returns = np.array([new_bar[asset] / state['last_prices'][asset] - 1 for asset in spec['assets']])
+    portfolio_return = compiled['exposures'][state['regime']] @ asset_returns + compiled['constant'][state['regime']]
+
+    # Overlays nach dem heutigen Signal
+    remaining_allocation = 1.0
+    overlay_return = 0.0
+    for overlay in compiled['overlays']:
+        if state['above'][overlay['signal']]:
+            remaining_allocation -= overlay['weight']
+            asset, leverage = spec['instruments'][overlay['instrument']]
+            overlay_return += overlay['weight'] * return_kernel.instrument_returns(
+                asset_returns[list(spec['assets']).index(asset)], leverage,
+                spec.get('financing_rate', 0.0), spec.get('ter', 0.0))
+    portfolio_return = remaining_allocation * portfolio_return + overlay_return
+
+    if state['regime'] == compiled['initial']:
+        portfolio_return = 0.0
+    state['portfolio_value'] *= 1 + portfolio_return
+
+    # Zwei-Tage-Bestätigung (bzw. confirmation_days) für das Regime ab morgen
+    code = 0
+    for signal in spec['regime_signals']:
+        code = 2 * code + state['above'][signal]
+    state['run_length'] = state['run_length'] + 1 if code == state['last_code'] else 1
+    state['last_code'] = code
+    if state['run_length'] >= spec.get('confirmation_days', 2):
+        state['regime'] = code
+        state['regime_name'] = str(compiled['regime_names'][code])
+
+    state['last_prices'] = {asset: float(new_bar[asset]) for asset in spec['assets']}
+    state['last_date'] = pd.Timestamp(new_bar['Date']).strftime('%Y-%m-%d')
+    state['days'] += 1
+    return state
+
+
+def verify_regime_state(state, rtol=1e-9):
+    """Vergleicht den Zustand mit einer kompletten Neuberechnung bis state['last_date']"""
+    replay = init_regime_state(state['spec'], until=state['last_date'])
+    for key in ['regime', 'last_code', 'days', 'last_date']:
+        if replay[key] != state[key]:
+            raise AssertionError(f"{key}: inkrementell {state[key]!r}, Neuberechnung {replay[key]!r}")
+    if not np.isclose(state['portfolio_value'], replay['portfolio_value'], rtol=rtol, atol=0):
+        raise AssertionError(
+            f"portfolio_value: inkrementell {state['portfolio_value']}, Neuberechnung {replay['portfolio_value']}")
+    return replay
+
+
+def regime_bars_after(state):
+    """Neue Bars aus dem price_store, je Datum mit allen Assets, die an dem Tag gehandelt wurden"""
+    start = pd.Timestamp(state['last_bar_date']) + pd.Timedelta(days=1)
+    return _bars(state['spec']['assets'], start)
+
+
+# ---------------------------------------------------------------------------
+# Gemeinsame Schnittstelle
+# ---------------------------------------------------------------------------
+
+def update(state, new_bar):
+    """Schreibt einen Zustand um einen Bar fort"""
+    if state['kind'] == 'trading_strategy':
+        return update_trading_state(state, new_bar)
+    return update_regime_state(state, new_bar)
+
+
+def verify(state, rtol=1e-9):
+    """Prüft den Zustand gegen eine komplette Neuberechnung (AssertionError bei Abweichung)"""
+    if state['kind'] == 'trading_strategy':
+        return verify_trading_state(state, rtol)
+    return verify_regime_state(state, rtol)
+
+
+def bars_after(state):
+    """Alle Bars nach state['last_bar_date'] aus dem price_store"""
+    if state['kind'] == 'trading_strategy':
+        return trading_bars_after(state)
+    return regime_bars_after(state)
+
+
+def replay(state, verify_every=0, rtol=1e-9):
+    """Schreibt den Zustand mit allen Bars aus bars_after fort.
+
+    Mit verify_every > 0 wird alle verify_every Bars und am Ende gegen eine
+    komplette Neuberechnung geprüft (AssertionError bei Abweichung).
+    """
+    for count, bar in enumerate(list(bars_after(state)), start=1):
+        update(state, bar)
+        if verify_every and count % verify_every == 0:
+            verify(state, rtol)
+    if verify_every:
+        verify(state, rtol)
+    return state
+
+
+def save_state(state, path):
+    with open(path, 'w') as f:
+        json.dump(state, f, indent=2)
+
+
+def load_state(path):
+    with open(path) as f:
+        return json.load(f)
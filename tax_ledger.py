@@ -0,0 +1,296 @@
+"""Steuer auf Basis von Handelsereignissen statt einer Tagesschleife.
+
+Eine Strategie wird als Zielgewichte je Tag und Instrument beschrieben
+(weights[t] = Aufteilung, die die Rendite von Tag t verdient, wie in allen
+Engines). Gehandelt wird nur, wenn sich die Gewichte ändern (Regimewechsel,
+BTC-Anteil an/aus) und optional alle rebalance_days Tage - jeweils zum
+Schlusskurs des Vortags. Zwischen zwei Ereignissen werden die Instrumente
+gehalten (Stückzahlen fest), ein nicht investierter Rest liegt unverzinst als
+Cash (negativ = Kredit).
+
+Der Ledger braucht nur die Instrument-Kurse an den Ereignistagen; die
+Schleife läuft über Ereignisse, nicht über Tage. Regeln:
+    - Lots je Instrument, Verkauf nach FIFO
+    - Gewinne und Verluste eines Jahres werden verrechnet (loss_offset);
+      ein Verlust am Jahresende wird vorgetragen (carry_forward)
+    - jährlicher Freibetrag (allowance) nach der Verlustverrechnung
+    - die Steuer wird beim Verkauf fällig bzw. erstattet und mindert die Käufe
+
+Mit loss_offset=False wird jeder Verkauf einzeln besteuert und Verluste
+verfallen. Das entspricht der Regel der Steuer in calculator, nicht aber
+deren Zahlen: calculator besteuert beim Wechsel zum Schlusskurs des
+Wechseltags, der Ledger handelt zum Schlusskurs des Vortags.
+
+Feste Stückzahlen zwischen den Ereignissen sind eine andere Strategie als
+die täglich konstanten Gewichte in strategy_spec.evaluate_specs: mit
+Cash-Anteil oder mehreren Instrumenten driften die Gewichte. Erst mit
+rebalance_days=1 (und Steuer 0) stimmen beide überein. Damit Vergleiche
+Drift und Steuer nicht vermischen, enthält das Ergebnis von run_weights
+unter 'untaxed' denselben Ledger ohne Steuer (gleiche Ereignisse).
+"""
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+import profiling
+import return_kernel
+import strategy_spec
+
+# Rundungsreste beim Umschichten (Anteil am Portfolio-Wert)
+TOLERANCE = 1e-12
+
+
+def price_index(returns):
+    """Preisindex je Instrument (Tage x Instrumente) mit Startwert 1; der Return von Tag 0 zählt nicht"""
+    growth = 1 + np.nan_to_num(np.atleast_2d(np.asarray(returns, dtype=float).T).T)
+    growth[0] = 1.0
+    return np.cumprod(growth, axis=0)
+
+
+def extract_events(weights, rebalance_days=None):
+    """Handelstage: Tag 0 (Einstieg), jeder Tag vor einer Gewichtsänderung und optionale Rebalancings.
+
+    An Ereignis e wird auf weights[e + 1] umgeschichtet.
+    """
+    weights = np.atleast_2d(np.asarray(weights, dtype=float).T).T
+    if len(weights) < 2:
+        return np.empty(0, dtype=np.int64)
+
+    changes = np.flatnonzero(np.any(weights[2:] != weights[1:-1], axis=1)) + 1
+    events = [np.zeros(1, dtype=np.int64), changes]
+    if rebalance_days:
+        events.append(np.arange(rebalance_days, len(weights) - 1, rebalance_days))
+    return np.unique(np.concatenate(events))
+
+
+def _sell(lots, units):
+    """Verkauft units nach FIFO; gibt die Anschaffungskosten der verkauften Stücke zurück"""
+    cost = 0.0
+    while units > 0 and lots:
+        lot = lots[0]
+        take = min(lot[0], units)
+        cost += take * lot[1]
+        lot[0] -= take
+        units -= take
+        if lot[0] <= 0:
+            lots.popleft()
+    return cost
+
+
+def _close_year(state, rules, yearly):
+    """Schließt das laufende Steuerjahr ab; ein verbleibender Verlust wird vorgetragen"""
+    if state['year'] is None:
+        return
+    if rules['loss_offset'] and rules['carry_forward']:
+        state['carry'] = max(0.0, state['carry'] - state['realized'])
+    else:
+        state['carry'] = 0.0
+    yearly.append((state['year'], state['realized'], state['paid'], state['carry']))
+    state.update(realized=0.0, paid=0.0, allowance_used=0.0)
+
+
+def _tax_payment(state, gain, rules):
+    """Steuerzahlung (negativ = Erstattung) für einen realisierten Gewinn"""
+    rate, allowance = rules['tax_rate'], rules['allowance']
+    state['realized'] += gain
+    if rules['loss_offset']:
+        # Jahressteuer auf den verrechneten Gewinn abzüglich Vortrag und Freibetrag
+        due = rate * max(0.0, state['realized'] - state['carry'] - allowance)
+        payment = due - state['paid']
+    else:
+        taxable = max(0.0, gain)
+        exempt = min(taxable, allowance - state['allowance_used'])
+        state['allowance_used'] += exempt
+        payment = rate * (taxable - exempt)
+    state['paid'] += payment
+    return payment
+
+
+@profiling.traced('simulate')
+def run_ledger(prices, targets, years=None, tax_rate=0.25, allowance=0.0, loss_offset=True,
+               carry_forward=True, start_value=100.0, liquidate=False):
+    """Führt die Umschichtungen an den Ereignissen aus.
+
+    prices:  Kurse der Instrumente an den Ereignissen (Ereignisse x Instrumente),
+             die letzte Zeile darf der Schlusstag ohne Umschichtung sein
+    targets: Zielgewichte je Ereignis (Ereignisse x Instrumente) oder eine Zeile
+             weniger als prices (dann ist die letzte Kurszeile der Schlusstag)
+    years:   Steuerjahr je Kurszeile (None = ein Jahr)
+
+    Gibt Stückzahlen, Cash, Werte, Steuern und realisierte Gewinne je Zeile,
+    eine Jahrestabelle und den Endwert zurück. liquidate=True verkauft am
+    Schlusstag alles (Endwert nach Steuer).
+    """
+    prices = np.atleast_2d(np.asarray(prices, dtype=float))
+    targets = np.atleast_2d(np.asarray(targets, dtype=float))
+    n_rows, n_instruments = prices.shape
+    years = np.zeros(n_rows, dtype=np.int64) if years is None else np.asarray(years)
+
+    rules = {'tax_rate': tax_rate, 'allowance': allowance, 'loss_offset': loss_offset,
+             'carry_forward': carry_forward}
+    state = {'year': None, 'carry': 0.0, 'realized': 0.0, 'paid': 0.0, 'allowance_used': 0.0}
+    yearly = []
+
+    lots = [deque() for _ in range(n_instruments)]
+    units = np.zeros(n_instruments)
+    cash = float(start_value)
+    history = {name: np.zeros(n_rows) for name in ('cash', 'value', 'tax', 'realized')}
+    history['units'] = np.zeros((n_rows, n_instruments))
+
+    for row in range(n_rows):
+        if years[row] != state['year']:
+            _close_year(state, rules, yearly)
+            state['year'] = years[row]
+
+        price = prices[row]
+        total = units @ price + cash
+        final = row >= len(targets)
+        if final and liquidate:
+            target = np.zeros(n_instruments)
+        elif final:
+            target = None
+        else:
+            target = targets[row] * total
+
+        tax = gain = 0.0
+        if target is not None:
+            holding = units * price
+            deficit = np.zeros(n_instruments)
+            for i in range(n_instruments):
+                excess = holding[i] - target[i]
+                if excess > TOLERANCE * abs(total):
+                    sold = excess / price[i]
+                    gain += excess - _sell(lots[i], sold)
+                    units[i] -= sold
+                    cash += excess
+                elif excess < -TOLERANCE * abs(total):
+                    deficit[i] = -excess
+
+            if gain:
+                tax = _tax_payment(state, gain, rules)
+                cash -= tax
+
+            # Käufe aus dem Cash über dem Ziel-Cash; die Steuer kürzt alle Käufe anteilig
+            if deficit.any():
+                available = cash - (1 - targets[row].sum()) * (total - tax)
+                scale = available / deficit.sum()
+                for i in np.flatnonzero(deficit):
+                    bought = deficit[i] * scale / price[i]
+                    lots[i].append([bought, price[i]])
+                    units[i] += bought
+                    cash -= deficit[i] * scale
+
+        history['units'][row] = units
+        history['cash'][row] = cash
+        history['value'][row] = units @ price + cash
+        history['tax'][row] = tax
+        history['realized'][row] = gain
+
+    _close_year(state, rules, yearly)
+    history['yearly'] = pd.DataFrame(yearly, columns=['Jahr', 'Realisiert', 'Steuer', 'Verlustvortrag'])
+    history['final_value'] = history['value'][-1] if n_rows else float(start_value)
+    history['total_tax'] = history['tax'].sum()
+    history['carry'] = state['carry']
+    return history
+
+
+def run_weights(weights, returns, dates=None, rebalance_days=None, **options):
+    """Ledger für Zielgewichte und Instrument-Returns (beide Tage x Instrumente).
+
+    Nur die Kurse an Ereignistagen und am letzten Tag gehen in den Ledger.
+    Ergebnis wie run_ledger, dazu 'events' (Tagesindizes) und 'index'
+    (Preisindex je Tag) für value_path() sowie 'untaxed': derselbe Ledger
+    mit tax_rate=0 (gleiche Ereignisse und Stückzahl-Drift, ebenfalls für
+    value_path()). Die Steuerwirkung ist final_value gegen
+    untaxed['final_value'].
+    """
+    weights = np.atleast_2d(np.asarray(weights, dtype=float).T).T
+    index = price_index(returns)
+    events = extract_events(weights, rebalance_days)
+    rows = np.append(events, len(weights) - 1) if len(weights) else events
+
+    years = None
+    if dates is not None:
+        years = np.asarray(dates, dtype='M8[ns]')[rows].astype('M8[Y]').astype(np.int64) + 1970
+
+    result = run_ledger(index[rows], weights[events + 1], years, **options)
+    untaxed = run_ledger(index[rows], weights[events + 1], years, **{**options, 'tax_rate': 0.0})
+    for ledger in (result, untaxed):
+        ledger['events'] = rows
+        ledger['index'] = index
+    result['untaxed'] = untaxed
+    return result
+
+
+def value_path(result):
+    """Täglicher Portfolio-Wert aus Stückzahlen und Cash des jeweils letzten Ereignisses"""
+    index = result['index']
+    segment = np.searchsorted(result['events'], np.arange(len(index)), side='right') - 1
+    values = np.einsum('ij,ij->i', result['units'][segment], index) + result['cash'][segment]
+    # Am Schlusstag gilt der Stand nach einer eventuellen Liquidation
+    values[result['events'][-1]] = result['value'][-1]
+    return values
+
+
+# ---------------------------------------------------------------------------
+# Adapter für die Strategien
+# ---------------------------------------------------------------------------
+
+def trading_strategy_ledger(df, tax_rate=0.25, **options):
+    """Ledger für den Frame aus calculator.build_strategy_frame (Index oder Gold, je 100%)"""
+    in_gold = (df['position'] == 'gold').to_numpy()
+    weights = np.column_stack([~in_gold, in_gold]).astype(float)
+    returns = df[['index_lev', 'gold_lev']].to_numpy(dtype=float)
+    return run_weights(weights, returns, df.index.values, tax_rate=tax_rate, **options)
+
+
+def leveraged_portfolio_ledger(df, tax_rate=0.25, **options):
+    """Ledger für den Frame aus general_performance.prepare_leveraged_data (investiert oder Cash)"""
+    weights = df['invested'].to_numpy(dtype=float)[:, None]
+    returns = df['leveraged_return'].to_numpy(dtype=float)[:, None]
+    return run_weights(weights, returns, df.index.values, tax_rate=tax_rate, **options)
+
+
+def spec_weights(spec, df=None):
+    """(Gewichte, Instrument-Returns, Daten, Instrumente) einer Regime-Spec je Tag"""
+    evaluation = strategy_spec.evaluate_specs([spec], df)
+    compiled = strategy_spec.compile_spec(spec)
+    df = evaluation['data']
+    regime = evaluation['regime']
+
+    # In compile_spec enthält das Cash-Gewicht die Rate, hier wird das reine Gewicht gebraucht
+    instruments = list(spec['instruments']) + ['Cash']
+    regime_weights = compiled['weights'].copy()
+    regime_names = list(compiled['regime_names'])
+    regime_weights[:, -1] = 0.0
+    for name, definition in spec['regimes'].items():
+        regime_weights[regime_names.index(name), -1] = definition['weights'].get('Cash', 0.0)
+    weights = regime_weights[regime]
+
+    returns = np.empty((len(df), len(instruments)))
+    for column, (asset, leverage) in enumerate(spec['instruments'].values()):
+        returns[:, column] = return_kernel.instrument_returns(
+            df[f'{asset}_return'].to_numpy(dtype=float), leverage,
+            spec.get('financing_rate', 0.0), spec.get('ter', 0.0))
+    returns[:, -1] = spec['cash_rate']
+
+    # Overlays: Anteil ins Instrument, der Rest bleibt im Regime-Portfolio
+    for overlay in compiled['overlays']:
+        active = evaluation['overlay_active'][overlay.get('column', overlay['instrument'])]
+        allocation = np.where(active & (regime != compiled['initial']), overlay['weight'], 0.0)
+        weights *= 1 - allocation[:, None]
+        weights[:, instruments.index(overlay['instrument'])] += allocation
+
+    return weights, returns, df, instruments
+
+
+def spec_ledger(spec, tax_rate=0.25, df=None, **options):
+    """Ledger für eine Regime-Spec aus strategy_spec.
+
+    Ohne rebalance_days werden die Stückzahlen nur bei Gewichtsänderungen
+    neu gesetzt und weichen daher auch ohne Steuer von evaluate_specs ab;
+    die Steuerwirkung zeigt der Vergleich mit result['untaxed'].
+    """
+    weights, returns, df, _ = spec_weights(spec, df)
+    return run_weights(weights, returns, df.index.values, tax_rate=tax_rate, **options)
@@ -0,0 +1,292 @@
+"""Suche nach Regime-Gewichten einer Spec (statt handgewählter Konstanten).
+
+prepare() wertet die Spec einmal aus (Kurse, Signale, Regime-Folge) und legt
+für jeden freien Parameter - Gewicht eines Instruments in einem Regime - eine
+maskierte Return-Zeile an: Instrument-Return an den Tagen des Regimes, sonst
+0. Die Portfolio-Returns beliebig vieler Kandidaten (Kandidaten x Parameter)
+sind dann ein Matrixprodukt mit dieser Matrix (Parameter x Tage). Overlay-
+Gewichte (z.B. der BTC-Anteil) hängen je Kandidat elementweise dran.
+
+Suchverfahren:
+    grid_candidates     alle Kombinationen von 'steps' Werten je Parameter
+    random_candidates   gleichverteilt innerhalb der Grenzen
+    coordinate_descent  je Parameter eine Linie von Werten, bestes Ziel übernehmen
+
+pareto_front() liefert die nicht dominierten Kandidaten (CAGR gegen Max
+Drawdown), walk_forward() optimiert auf Trainingsfenstern und bewertet die
+Pareto-Front auf dem jeweils folgenden Testfenster.
+
+Beispiel:
+    problem = prepare(final_portfolio_performance_btc.SPEC)
+    candidates = random_candidates(problem, 50_000)
+    front = front_frame(problem, candidates, score(problem, candidates))
+"""
+import copy
+import itertools
+
+import numpy as np
+import pandas as pd
+
+import profiling
+import return_kernel
+import strategy_spec
+
+# Standardgrenzen je Parameter (Gewicht im Regime bzw. Overlay-Anteil)
+WEIGHT_BOUNDS = (0.0, 1.5)
+CASH_BOUNDS = (0.0, 1.0)
+OVERLAY_BOUNDS = (0.0, 0.5)
+OBJECTIVES = ('CAGR', 'Calmar')
+
+
+def prepare(spec, parameters=None, df=None):
+    """Maskierte Return-Matrix und Overlay-Daten für eine Spec.
+
+    parameters ist eine Liste von (Regime, Instrument); Standard sind alle
+    Gewichte, die in der Spec vorkommen. Overlay-Gewichte werden immer als
+    zusätzliche Parameter am Ende angehängt.
+    """
+    evaluation = strategy_spec.evaluate_specs([spec], df)
+    df = evaluation['data']
+    regime = evaluation['regime']
+    regime_codes = {name: code for code, name in enumerate(evaluation['regime_names'])}
+    initial = len(evaluation['regime_names']) - 1
+
+    if parameters is None:
+        parameters = [(name, instrument) for name, definition in spec['regimes'].items()
+                      for instrument in definition['weights']]
+
+    def instrument_return(instrument):
+        if instrument == 'Cash':
+            return np.full(len(df), spec['cash_rate'])
+        if instrument not in spec['instruments']:
+            raise ValueError(f"Unbekanntes Instrument {instrument}")
+        asset, leverage = spec['instruments'][instrument]
+        return return_kernel.instrument_returns(df[f'{asset}_return'].to_numpy(dtype=float), leverage,
+                                                spec.get('financing_rate', 0.0), spec.get('ter', 0.0))
+
+    with profiling.stage('simulate', step='weight_optimizer.prepare'):
+        returns = np.zeros((len(parameters), len(df)))
+        start = []
+        for row, (name, instrument) in enumerate(parameters):
+            if name not in regime_codes:
+                raise ValueError(f"Unbekanntes Regime {name}")
+            days = regime == regime_codes[name]
+            returns[row, days] = instrument_return(instrument)[days]
+            start.append(spec['regimes'][name]['weights'].get(instrument, 0.0))
+
+        # Overlays nur außerhalb des Startzustands (dort ist die Rendite 0)
+        overlays = spec.get('overlays', [])
+        overlay_active = np.zeros((len(overlays), len(df)), dtype=bool)
+        overlay_returns = np.zeros((len(overlays), len(df)))
+        for row, overlay in enumerate(overlays):
+            overlay_active[row] = evaluation['overlay_active'][overlay.get('column', overlay['instrument'])]
+            overlay_active[row] &= regime != initial
+            overlay_returns[row] = instrument_return(overlay['instrument'])
+            start.append(overlay['weight'])
+
+    dates = df.index
+    years = (dates[-1] - dates[0]).days / 365.25
+    return {
+        'spec': spec,
+        'parameters': list(parameters),
+        'labels': [f'{name}:{instrument}' for name, instrument in parameters]
+                  + [f"Overlay:{overlay['instrument']}" for overlay in overlays],
+        'returns': returns,
+        'overlay_active': overlay_active,
+        'overlay_returns': overlay_returns,
+        'start': np.array(start, dtype=float),
+        'dates': dates,
+        'periods_per_year': (len(dates) - 1) / years,
+    }
+
+
+def default_bounds(problem):
+    """(Parameter x 2) Grenzen: Regime-Gewichte WEIGHT_BOUNDS (Cash CASH_BOUNDS), Overlays OVERLAY_BOUNDS"""
+    bounds = [CASH_BOUNDS if instrument == 'Cash' else WEIGHT_BOUNDS for _, instrument in problem['parameters']]
+    return np.array(bounds + [OVERLAY_BOUNDS] * len(problem['overlay_returns']))
+
+
+def portfolio_returns(problem, candidates, days=slice(None)):
+    """Tägliche Returns (Kandidaten x Tage) für Gewichtsvektoren (Kandidaten x Parameter)"""
+    candidates = np.atleast_2d(np.asarray(candidates, dtype=float))
+    n_weights = len(problem['parameters'])
+    base = candidates[:, :n_weights] @ problem['returns'][:, days]
+    if not len(problem['overlay_returns']):
+        return base
+
+    # Overlay-Anteil fließt in das Instrument, der Rest bleibt im Regime-Portfolio
+    returns = base.copy()
+    for row, (active, overlay_return) in enumerate(zip(problem['overlay_active'], problem['overlay_returns'])):
+        allocation = active[days] * candidates[:, n_weights + row, None]
+        returns += allocation * (overlay_return[days] - base)
+    return returns
+
+
+def _chunk_score(returns, periods_per_year):
+    # Wertverlauf im Puffer der Returns; der Startwert 1 zählt als erstes Hoch
+    n_days = returns.shape[1]
+    returns += 1
+    values = np.cumprod(returns, axis=1, out=returns)
+    peak = np.maximum.accumulate(values, axis=1)
+    np.maximum(peak, 1.0, out=peak)
+    np.divide(values, peak, out=peak)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return {
+            'CAGR': values[:, -1] ** (periods_per_year / n_days) - 1,
+            'Max Drawdown': np.minimum(peak.min(axis=1), 1.0) - 1,
+        }
+
+
+@profiling.traced('metrics')
+def score(problem, candidates, days=slice(None), chunk_size=1024):
+    """CAGR und Max Drawdown je Kandidat (wie in metrics, aber nur diese beiden)"""
+    candidates = np.atleast_2d(np.asarray(candidates, dtype=float))
+    chunks = [_chunk_score(portfolio_returns(problem, candidates[start:start + chunk_size], days),
+                           problem['periods_per_year'])
+              for start in range(0, len(candidates), chunk_size)]
+    scores = {name: np.concatenate([chunk[name] for chunk in chunks]) for name in ('CAGR', 'Max Drawdown')}
+    with np.errstate(divide='ignore', invalid='ignore'):
+        scores['Calmar'] = scores['CAGR'] / -scores['Max Drawdown']
+    return scores
+
+
+def objective_values(scores, objective='Calmar', max_drawdown=None):
+    """Zielwert je Kandidat; -inf für ungültige Werte und bei Drawdown über max_drawdown"""
+    if objective not in OBJECTIVES:
+        raise ValueError(f"Unbekanntes Ziel {objective}. Wählen Sie aus: {', '.join(OBJECTIVES)}")
+    values = np.where(np.isfinite(scores[objective]), scores[objective], -np.inf)
+    if max_drawdown is not None:
+        values[scores['Max Drawdown'] < -abs(max_drawdown)] = -np.inf
+    return values
+
+
+def grid_candidates(problem, steps=5, bounds=None):
+    """Alle Kombinationen von steps Werten je Parameter (steps ** Parameter Kandidaten)"""
+    bounds = default_bounds(problem) if bounds is None else np.asarray(bounds, dtype=float)
+    axes = [np.linspace(low, high, steps) for low, high in bounds]
+    return np.array(list(itertools.product(*axes))) if axes else np.empty((1, 0))
+
+
+def random_candidates(problem, n=20_000, bounds=None, seed=0):
+    """n gleichverteilte Kandidaten innerhalb der Grenzen"""
+    bounds = default_bounds(problem) if bounds is None else np.asarray(bounds, dtype=float)
+    rng = np.random.default_rng(seed)
+    return rng.uniform(bounds[:, 0], bounds[:, 1], size=(n, len(bounds)))
+
+
+def coordinate_descent(problem, start=None, bounds=None, steps=21, rounds=10, objective='Calmar',
+                       max_drawdown=None, days=slice(None)):
+    """Koordinatensuche ab start (Standard: Gewichte der Spec).
+
+    Je Parameter werden steps Werte zwischen den Grenzen mit einem
+    Matrixprodukt bewertet und der beste übernommen, bis eine Runde nichts
+    mehr verbessert. Gibt alle bewerteten Kandidaten zurück, der beste steht
+    in der letzten Zeile.
+    """
+    bounds = default_bounds(problem) if bounds is None else np.asarray(bounds, dtype=float)
+    best = np.array(problem['start'] if start is None else start, dtype=float)
+    best_value = objective_values(score(problem, best, days), objective, max_drawdown)[0]
+    evaluated = []
+
+    for _ in range(rounds):
+        improved = False
+        for parameter, (low, high) in enumerate(bounds):
+            line = np.repeat(best[None, :], steps, axis=0)
+            line[:, parameter] = np.linspace(low, high, steps)
+            values = objective_values(score(problem, line, days), objective, max_drawdown)
+            evaluated.append(line)
+
+            row = np.argmax(values)
+            if values[row] > best_value:
+                best, best_value, improved = line[row].copy(), values[row], True
+        if not improved:
+            break
+
+    evaluated.append(best[None, :])
+    return np.vstack(evaluated)
+
+
+def search(problem, method='random', days=slice(None), **options):
+    """Kandidaten eines Suchverfahrens ('grid', 'random', 'descent') mit Scores"""
+    if method == 'grid':
+        candidates = grid_candidates(problem, **options)
+    elif method == 'random':
+        candidates = random_candidates(problem, **options)
+    elif method == 'descent':
+        candidates = coordinate_descent(problem, days=days, **options)
+    else:
+        raise ValueError(f"Unbekanntes Suchverfahren {method}. Wählen Sie aus: grid, random, descent")
+    return candidates, score(problem, candidates, days)
+
+
+def pareto_front(scores):
+    """Indizes der nicht dominierten Kandidaten (höhere CAGR, kleinerer Drawdown), nach CAGR absteigend"""
+    cagr, drawdown = scores['CAGR'], scores['Max Drawdown']
+    valid = np.flatnonzero(np.isfinite(cagr) & np.isfinite(drawdown))
+    order = valid[np.lexsort((-drawdown[valid], -cagr[valid]))]
+    if not len(order):
+        return order
+
+    # Ein Kandidat gehört zur Front, wenn kein Kandidat mit höherer CAGR einen kleineren Drawdown hat
+    sorted_drawdown = drawdown[order]
+    best_before = np.maximum.accumulate(sorted_drawdown)
+    keep = np.ones(len(order), dtype=bool)
+    keep[1:] = sorted_drawdown[1:] > best_before[:-1]
+    return order[keep]
+
+
+def front_frame(problem, candidates, scores, front=None):
+    """Pareto-Front als DataFrame: Gewichte je Parameter, CAGR, Max Drawdown, Calmar"""
+    front = pareto_front(scores) if front is None else front
+    frame = pd.DataFrame(np.atleast_2d(candidates)[front], columns=problem['labels'])
+    for name in ('CAGR', 'Max Drawdown', 'Calmar'):
+        frame[name] = scores[name][front]
+    return frame
+
+
+def walk_forward_splits(n_days, train_days, test_days, step=None):
+    """(Trainings-, Test-)Slices aufeinanderfolgender Fenster; step Standard = test_days"""
+    step = step or test_days
+    return [(slice(start, start + train_days), slice(start + train_days, start + train_days + test_days))
+            for start in range(0, n_days - train_days - test_days + 1, step)]
+
+
+def walk_forward(problem, train_years=10, test_years=2, step_years=None, method='random', **options):
+    """Optimiert je Trainingsfenster und bewertet dessen Pareto-Front im Testfenster.
+
+    Ergebnis: eine Zeile je Front-Kandidat und Fenster mit Gewichten sowie
+    Train- und Test-Kennzahlen.
+    """
+    periods = problem['periods_per_year']
+    splits = walk_forward_splits(len(problem['dates']), int(train_years * periods), int(test_years * periods),
+                                 int(step_years * periods) if step_years else None)
+    dates = problem['dates']
+
+    frames = []
+    for window, (train, test) in enumerate(splits):
+        candidates, scores = search(problem, method, days=train, **options)
+        front = pareto_front(scores)
+        frame = front_frame(problem, candidates, scores, front)
+        frame = frame.rename(columns={name: f'Train {name}' for name in ('CAGR', 'Max Drawdown', 'Calmar')})
+
+        test_scores = score(problem, candidates[front], test)
+        for name in ('CAGR', 'Max Drawdown', 'Calmar'):
+            frame[f'Test {name}'] = test_scores[name]
+        frame.insert(0, 'Fenster', window)
+        frame.insert(1, 'Test Start', dates[test.start])
+        frame.insert(2, 'Test Ende', dates[test.stop - 1])
+        frames.append(frame)
+
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+
+def apply_weights(problem, vector):
+    """Kopie der Spec mit den Gewichten eines Kandidaten"""
+    spec = copy.deepcopy(problem['spec'])
+    n_weights = len(problem['parameters'])
+    for (name, instrument), weight in zip(problem['parameters'], vector[:n_weights]):
+        spec['regimes'][name]['weights'][instrument] = float(weight)
+    for overlay, weight in zip(spec.get('overlays', []), vector[n_weights:]):
+        overlay['weight'] = float(weight)
+    return spec